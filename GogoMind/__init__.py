@@ -0,0 +1,22 @@
+# Qt-free entry point: importing the package loads nothing until a name is
+# used, and never pulls in PyQt5 (that lives in gogomind.py only).
+
+__all__ = [
+    "Component", "Root", "Node", "MindMapModel", "MindMapBuilder", "SimpleNodeFactory", "DescriptionFactory",
+    "Command", "AddComponentCommand", "EditComponentCommand", "DeleteComponentCommand",
+    "PasteComponentCommand", "MoveComponentCommand", "SetAttributeCommand", "AttributeStore", "SnapshotView",
+    "CommandManager", "CommandJournal", "Query",
+]
+
+
+def __getattr__(name):
+    if (name == "CommandJournal"):
+        from .journal import CommandJournal
+        return CommandJournal
+    if (name == "Query"):
+        from .query import Query
+        return Query
+    if (name in __all__):
+        from . import model
+        return getattr(model, name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+try:
+    from .model import MindMapModel, Observer
+except ImportError:
+    from model import MindMapModel, Observer
+
+
+class AutoSaveService(QObject, Observer):
+
+    saved = pyqtSignal(str, bool)
+
+    def __init__(self, mind_map: MindMapModel, interval: int=60000, commands: int=20, parent=None):
+        super().__init__(parent)
+        self._mind_map = mind_map
+        self._path = None
+        self._file_type = "ggm"
+        self._commands = commands
+        self._pending_commands = 0
+        self._lock = threading.Lock()
+        self._is_saving = False
+        self._last_result = True
+        self._queued = {}
+        # Model versions: the newest one handed to a save, and per path the
+        # newest one actually written.
+        self._requested_version = mind_map.version
+        self._saved_versions = {}
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self.autosave)
+        self._timer.start(interval)
+        self._mind_map.attach(self)
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def set_path(self, path: str, file_type: str, saved: bool=False) -> None:
+        # `saved`: the file already holds the model as it is now (just loaded).
+        self._path = path
+        self._file_type = file_type
+        if (saved):
+            self._requested_version = self._saved_versions[path] = self._mind_map.version
+
+    def saved_version(self, path: str) -> int:
+        return self._saved_versions.get(path)
+
+    @property
+    def is_saving(self) -> bool:
+        return self._is_saving
+
+    @property
+    def last_result(self) -> bool:
+        return self._last_result
+
+    def update(self):
+        self._pending_commands += 1
+        if (self._commands and self._pending_commands >= self._commands):
+            self.autosave()
+
+    def autosave(self) -> None:
+        # By version rather than command count, so changes made without a
+        # command (e.g. journal recovery) are saved too.
+        if (self._path and self._mind_map.version != self._requested_version):
+            self.save(self._path, self._file_type)
+
+    def save(self, path: str, file_type: str) -> None:
+        # The view is taken on the GUI thread between commands in O(1), so
+        # the worker never sees a half-applied command.
+        view = self._mind_map.snapshot_view()
+        self._pending_commands = 0
+        self._requested_version = view.version
+        with self._lock:
+            if (self._is_saving):
+                # Only the newest view per path is worth writing.
+                if (path in self._queued):
+                    self._queued[path][0].release()
+                self._queued[path] = (view, file_type)
+                return
+            self._is_saving = True
+        self._executor.submit(self._write, path, view, file_type)
+
+    def _write(self, path: str, view, file_type: str) -> None:
+        job = (path, view, file_type)
+        while (job):
+            path, view, file_type = job
+            result = False
+            try:
+                with view:
+                    result = MindMapModel.write_snapshot(path, view.get_snapshot(), file_type)
+            except Exception as e:
+                print("Autosave failed")
+                print(e)
+            finally:
+                # Whatever happened, report it and take the next job, so one
+                # failure never stops autosave for the rest of the session.
+                self._last_result = result
+                if (result):
+                    self._saved_versions[path] = view.version
+                # Emitted from the worker; Qt queues it onto the receivers' thread.
+                self.saved.emit(path, result)
+                with self._lock:
+                    if (self._queued):
+                        queued = next(iter(self._queued))
+                        job = (queued,) + self._queued.pop(queued)
+                    else:
+                        job = None
+                        self._is_saving = False
+
+    def wait(self) -> None:
+        # The single worker drains queued saves before it takes the next job.
+        self._executor.submit(int).result()
+
+    def shutdown(self) -> None:
+        self._timer.stop()
+        self._mind_map.detach(self)
+        self._executor.shutdown(wait=True)
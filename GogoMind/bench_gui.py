@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+import os
+# Must be set before Qt is imported so no display is needed.
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtCore import QPointF
+from PyQt5.QtGui import QTransform
+from PyQt5.QtWidgets import QApplication
+
+from gogomind import MainWindow
+from model import EditComponentCommand
+from benchmark import generate, SHAPES
+
+import argparse
+import contextlib
+import json
+import platform
+import random
+import sys
+import time
+
+
+def percentiles(samples: list) -> dict:
+    ordered = sorted(samples)
+    pick = lambda fraction: ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+    return {
+        "count": len(ordered),
+        "p50": pick(0.50),
+        "p90": pick(0.90),
+        "p99": pick(0.99),
+        "max": ordered[-1],
+        "mean": sum(ordered) / len(ordered),
+    }
+
+
+def sample(action, repeat: int) -> list:
+    samples = []
+    for index in range(repeat):
+        start = time.perf_counter()
+        action(index)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def load(window: MainWindow, records: list) -> None:
+    mind_map = window._mind_map
+    mind_map.reset()
+    mind_map.restore_from_snapshot(records)
+
+
+def operations(app: QApplication, window: MainWindow, records: list, seed: int) -> list:
+    rng = random.Random(seed)
+    scene = window.scene
+    view = window.scene_view
+    ids = [record["id"] for record in records]
+
+    def render(index=None):
+        # Paints the viewport into a pixmap, so the scene is really rendered offscreen.
+        view.viewport().grab()
+
+    def draw(index):
+        window.draw()
+        app.processEvents()
+        render()
+
+    def edit(index):
+        id = rng.choice(ids)
+        window._command_manager.execute(EditComponentCommand(id, "Edited {}".format(index)))
+        app.processEvents()
+        render()
+
+    def hit_test(index):
+        rect = scene.itemsBoundingRect()
+        point = QPointF(rect.left() + rng.random() * rect.width(), rect.top() + rng.random() * rect.height())
+        scene.itemAt(point, QTransform())
+
+    def scroll(index):
+        bar = view.verticalScrollBar() if (index % 2) else view.horizontalScrollBar()
+        bar.setValue(rng.randint(bar.minimum(), bar.maximum()))
+        app.processEvents()
+        render()
+
+    def zoom(index):
+        factor = 1.25 if (index % 2) else 0.8
+        view.scale(factor, factor)
+        app.processEvents()
+        render()
+
+    return [
+        ("draw", draw),
+        ("edit_redraw", edit),
+        ("hit_test", hit_test),
+        ("scroll", scroll),
+        ("zoom", zoom),
+    ]
+
+
+def run(shapes: list, sizes: list, repeat: int, seed: int, label: str) -> dict:
+    app = QApplication.instance() or QApplication(sys.argv)
+    results = []
+    for shape in shapes:
+        for size in sorted(sizes):
+            records = generate(shape, size, seed)
+            # MainWindow and the model log every node; keep that off the report.
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                window = MainWindow()
+                window.resize(900, 600)
+                load(window, records)
+                for name, action in operations(app, window, records, seed):
+                    try:
+                        result = percentiles(sample(action, repeat))
+                    except RecursionError as e:
+                        result = {"error": e.__class__.__name__}
+                    result.update({"shape": shape, "size": size, "operation": name})
+                    results.append(result)
+                    print(format_result(result), file=sys.stderr)
+                window.close()
+                window.deleteLater()
+                app.processEvents()
+    return {
+        "label": label,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "qpa": os.environ["QT_QPA_PLATFORM"],
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "seed": seed,
+        "results": results,
+    }
+
+
+def format_result(result: dict) -> str:
+    if ("error" in result):
+        measured = result["error"]
+    else:
+        measured = "p50 {:8.2f}ms  p90 {:8.2f}ms  p99 {:8.2f}ms  max {:8.2f}ms".format(
+            *(result[key] * 1000 for key in ("p50", "p90", "p99", "max")))
+    return "{:9} {:>7} {:12} {}".format(result["shape"], result["size"], result["operation"], measured)
+
+
+def main(argv: list=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark MainWindow rendering and scene interactions offscreen.")
+    parser.add_argument("--shapes", nargs="+", choices=SHAPES, default=["balanced", "wide"])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[100, 1000, 5000])
+    parser.add_argument("--repeat", type=int, default=20, help="samples per operation")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", default="", help="name of this run, e.g. a version or commit")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    report = run(args.shapes, args.sizes, args.repeat, args.seed, args.label)
+    if (args.output):
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
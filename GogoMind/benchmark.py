@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+
+try:
+    from .model import MindMapModel, CommandManager
+    from .model import AddComponentCommand, EditComponentCommand, DeleteComponentCommand
+    from .model import PasteComponentCommand, MoveComponentCommand
+    from . import parallel_load
+except ImportError:
+    from model import MindMapModel, CommandManager
+    from model import AddComponentCommand, EditComponentCommand, DeleteComponentCommand
+    from model import PasteComponentCommand, MoveComponentCommand
+    import parallel_load
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+SHAPES = ("wide", "deep", "balanced", "random")
+DESCRIPTIONS = ("TODO", "Owner", "Status", "Idea", "Note")
+COMPRESSIONS = (("zlib", 1), ("zlib", 6), ("lzma", 0), ("lzma", 6))
+
+
+def generate(shape: str, size: int, seed: int=0, branching: int=4) -> list:
+    # Records in parent-before-child order, like the saved BFS layout.
+    rng = random.Random(seed)
+    records = [{"id": 0, "desc": "Root", "pid": -1}]
+    for id in range(1, size):
+        if (shape == "wide"):
+            pid = 0
+        elif (shape == "deep"):
+            pid = id - 1
+        elif (shape == "balanced"):
+            pid = (id - 1) // branching
+        elif (shape == "random"):
+            pid = rng.randrange(id)
+        else:
+            raise ValueError("Unknown shape {}.".format(shape))
+        records.append({"id": id, "desc": rng.choice(DESCRIPTIONS), "pid": pid})
+    return records
+
+
+def build(records: list) -> MindMapModel:
+    mind_map = MindMapModel()
+    mind_map.restore_from_snapshot(records)
+    return mind_map
+
+
+def measure(setup, run, memory: bool) -> dict:
+    result = {}
+    try:
+        state = setup()
+        start = time.perf_counter()
+        count = run(state)
+        result["seconds"] = time.perf_counter() - start
+        if (isinstance(count, tuple)):
+            # (count, bytes written), for operations that produce output.
+            count, result["output_bytes"] = count
+        result["count"] = count
+        if (memory):
+            state = setup()
+            tracemalloc.start()
+            run(state)
+            # What the operation still holds on to (e.g. undo snapshots), and its peak.
+            result["retained_bytes"], result["peak_bytes"] = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+    except (RecursionError, MemoryError) as e:
+        if (tracemalloc.is_tracing()):
+            tracemalloc.stop()
+        result["error"] = e.__class__.__name__
+    return result
+
+
+def operations(records: list, folder: str, commands: int, seed: int) -> list:
+    size = len(records)
+    rng = random.Random(seed)
+    ids = [rng.randrange(size) for _ in range(commands)]
+    leaves = [id for id in ids if id != 0]
+
+    def ready():
+        return build(records)
+
+    def insert_nodes(mind_map):
+        # One at a time through insert_node, at random parents of a full map.
+        for id in ids:
+            mind_map.insert_node(mind_map.create_node("Inserted"), id)
+        return len(ids)
+
+    def with_attributes():
+        mind_map = build(records)
+        mind_map.attributes.load({obj["id"]: {"priority": obj["id"] % 6, "progress": (obj["id"] % 100) / 100} for obj in records})
+        return mind_map
+
+    def with_path(extension):
+        path = os.path.join(folder, "bench" + extension)
+        return lambda: (build(records), path)
+
+    def saved(extension, file_type):
+        def setup():
+            mind_map, path = with_path(extension)()
+            mind_map.save(path, file_type)
+            return (MindMapModel(), path)
+        return setup
+
+    def undo_snapshot(compression):
+        # Deleting the root keeps a whole-map snapshot for undo.
+        def setup():
+            mind_map = build(records)
+            mind_map.snapshot_compression = compression
+            return (mind_map, DeleteComponentCommand(0))
+        return setup
+
+    def saved_compressed(compression, level):
+        def setup():
+            mind_map, path = with_path(".ggm")()
+            mind_map.save(path, "ggm", compression, level)
+            return (MindMapModel(), path)
+        return setup
+
+    def run_commands(factory):
+        def setup():
+            mind_map = build(records)
+            return (mind_map, CommandManager(mind_map), [factory(mind_map, id) for id in leaves])
+        return setup
+
+    def execute(state):
+        mind_map, command_manager, batch = state
+        for command in batch:
+            command_manager.execute(command)
+        return len(batch)
+
+    def undo_redo(state):
+        mind_map, command_manager, batch = state
+        execute(state)
+        for _ in batch:
+            command_manager.undo()
+        for _ in batch:
+            command_manager.redo()
+        return 2 * len(batch)
+
+    def move_target(mind_map, id):
+        # A node outside the moved subtree, so the move is always legal.
+        target = mind_map.get_node(id).get_parent()
+        return MoveComponentCommand(id, target.get_parent().id if (target.get_parent()) else target.id)
+
+    factories = {
+        "add": lambda mind_map, id: AddComponentCommand(id, "Added"),
+        "edit": lambda mind_map, id: EditComponentCommand(id, "Edited"),
+        "delete": lambda mind_map, id: DeleteComponentCommand(id),
+        "paste": lambda mind_map, id: PasteComponentCommand(0, mind_map.get_node(id)),
+        "move": move_target,
+    }
+
+    def mixed(mind_map, id):
+        return factories[("add", "edit", "move")[id % 3]](mind_map, id)
+
+    ops = [
+        ("bulk_build", lambda: records, lambda records: len(build(records)._components)),
+        ("insert_node", ready, insert_nodes),
+        ("map", ready, lambda mind_map: len(mind_map.map)),
+        ("get_node", ready, lambda mind_map: sum(1 for id in ids if mind_map.get_node(id))),
+        ("clone", ready, lambda mind_map: mind_map.root.clone().subtree_size),
+        ("attribute_filter", with_attributes, lambda mind_map: len(mind_map.filter_nodes("priority", ">", 3)) and size),
+        ("attribute_subtree_sum", with_attributes, lambda mind_map: mind_map.aggregate("progress", "sum", under=0) and size),
+        ("save_json", with_path(".ggm"), lambda state: state[0].save(state[1], "ggm") and (size, os.path.getsize(state[1]))),
+        ("load_json", saved(".ggm", "ggm"), lambda state: state[0].load(state[1], "ggm") and size),
+        ("load_json_parallel", saved(".ggm", "ggm"), lambda state: parallel_load.load(*state) and size),
+        ("save_xml", with_path(".xml"), lambda state: state[0].save(state[1], "xml") and size),
+        ("load_xml", saved(".xml", "xml"), lambda state: state[0].load(state[1], "xml") and size),
+        ("undo_snapshot", undo_snapshot(None), lambda state: state[1].execute(state[0]) and size),
+    ]
+    for compression, level in COMPRESSIONS:
+        name = "{}{}".format(compression, level)
+        ops.extend([
+            ("save_json_" + name, with_path(".ggm"),
+             lambda state, compression=compression, level=level: state[0].save(state[1], "ggm", compression, level) and (size, os.path.getsize(state[1]))),
+            ("load_json_" + name, saved_compressed(compression, level), lambda state: state[0].load(state[1], "ggm") and size),
+            ("undo_snapshot_" + name, undo_snapshot((compression, level)), lambda state: state[1].execute(state[0]) and size),
+        ])
+    for name, factory in factories.items():
+        ops.append(("command_{}".format(name), run_commands(factory), execute))
+        ops.append(("command_{}_undo_redo".format(name), run_commands(factory), undo_redo))
+    ops.append(("command_manager_throughput", run_commands(mixed), execute))
+    return ops
+
+
+def run(shapes: list, sizes: list, commands: int, seed: int, memory: bool, label: str, budget: float) -> dict:
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for shape in shapes:
+            too_slow = False
+            for size in sorted(sizes):
+                if (too_slow):
+                    # Building alone blew the budget at a smaller size.
+                    results.append({"shape": shape, "size": size, "operation": "*", "error": "skipped"})
+                    continue
+                records = generate(shape, size, seed)
+                for name, setup, operation in operations(records, folder, commands, seed):
+                    # The model logs every node and command; keep that off the report.
+                    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                        result = measure(setup, operation, memory)
+                    result.update({"shape": shape, "size": size, "operation": name})
+                    results.append(result)
+                    print(format_result(result), file=sys.stderr)
+                    if (name == "bulk_build" and result.get("seconds", budget) >= budget):
+                        too_slow = True
+                        break
+    return {
+        "label": label,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "seed": seed,
+        "results": results,
+    }
+
+
+def format_result(result: dict) -> str:
+    if ("error" in result):
+        measured = result["error"]
+    else:
+        measured = "{:10.4f}s".format(result["seconds"])
+        if ("output_bytes" in result):
+            measured += " {:10.1f}KiB out".format(result["output_bytes"] / 1024)
+        if ("peak_bytes" in result):
+            measured += " {:10.1f}KiB {:10.1f}KiB kept".format(result["peak_bytes"] / 1024, result["retained_bytes"] / 1024)
+    return "{:9} {:>8} {:32} {}".format(result["shape"], result["size"], result["operation"], measured)
+
+
+def compare(baseline: dict, current: dict) -> None:
+    key = lambda result: (result["shape"], result["size"], result["operation"])
+    before = {key(result): result for result in baseline["results"]}
+    for result in current["results"]:
+        old = before.get(key(result))
+        if (old and "seconds" in old and "seconds" in result and old["seconds"]):
+            print("{:9} {:>8} {:32} {:6.2f}x".format(*key(result), result["seconds"] / old["seconds"]))
+
+
+def main(argv: list=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the GogoMind model layer.")
+    parser.add_argument("--shapes", nargs="+", choices=SHAPES, default=list(SHAPES))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--commands", type=int, default=1000, help="commands per command benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--memory", action="store_true", help="also record peak memory with tracemalloc")
+    parser.add_argument("--budget", type=float, default=10.0, help="skip larger sizes of a shape once building it takes this many seconds")
+    parser.add_argument("--label", default="", help="name of this run, e.g. a version or commit")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="print time ratios against an earlier JSON result")
+    args = parser.parse_args(argv)
+
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))
+    report = run(args.shapes, args.sizes, args.commands, args.seed, args.memory, args.label, args.budget)
+    if (args.output):
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    if (args.compare):
+        with open(args.compare, 'r') as file:
+            compare(json.load(file), report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+try:
+    from .model import MindMapModel, record_columns
+except ImportError:
+    from model import MindMapModel, record_columns
+
+import hashlib
+import json
+import os
+
+MANIFEST = "manifest.json"
+
+
+class ChunkStore:
+    # A document saved as a directory of content-addressed chunks plus a
+    # manifest listing them in order. Small subtrees are stored whole and
+    # keyed by their Merkle hash, so a save only writes chunks whose
+    # subtrees changed since the last one.
+
+    def __init__(self, path: str, limit: int=4096, fanout: int=256):
+        self._path = path
+        self._limit = limit
+        self._fanout = fanout
+        self._manifest = None
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def manifest(self) -> dict:
+        if (self._manifest is None):
+            manifest_path = os.path.join(self._path, MANIFEST)
+            if (os.path.exists(manifest_path)):
+                with open(manifest_path, 'r') as file:
+                    self._manifest = json.load(file)
+            else:
+                self._manifest = {"root": None, "chunks": []}
+        return self._manifest
+
+    def _units(self, mind_map: MindMapModel):
+        # Preorder over the map where any subtree of at most `limit` nodes is
+        # one unit; nodes above that are single-record units.
+        stack = [(mind_map.root, -1)]
+        while (stack):
+            node, pid = stack.pop()
+            if (node.subtree_size <= self._limit):
+                key = hashlib.blake2b(b"s" + node.subtree_hash + str(pid).encode(), digest_size=16).digest()
+                yield (key, node, pid, node.subtree_size, True)
+            else:
+                record = "{}:{}:{}:{}".format(node.id, pid, sorted(mind_map.attributes.row(node.id).items()), node.desc).encode()
+                key = hashlib.blake2b(b"n" + record, digest_size=16).digest()
+                yield (key, node, pid, 1, False)
+                stack.extend((child, node.id) for child in reversed(node.get_childern()) if not child.is_delete)
+
+    def _chunks(self, mind_map: MindMapModel):
+        # Boundaries depend on unit hashes, not positions, so an insert or
+        # delete only reshapes the chunks next to it.
+        units = []
+        size = 0
+        for unit in self._units(mind_map):
+            units.append(unit)
+            size += unit[3]
+            if (size >= self._limit or int.from_bytes(unit[0][:4], "little") % self._fanout == 0):
+                yield units
+                units = []
+                size = 0
+        if (units):
+            yield units
+
+    @staticmethod
+    def _records(mind_map: MindMapModel, units: list) -> list:
+        attributes = mind_map.attributes
+        records = []
+        for key, node, pid, size, whole in units:
+            stack = [(node, pid)]
+            while (stack):
+                node, pid = stack.pop()
+                record = {"id": node.id, "desc": node.desc, "pid": pid}
+                if (node.id in attributes):
+                    record["attrs"] = attributes.row(node.id)
+                records.append(record)
+                if (whole):
+                    stack.extend((child, node.id) for child in reversed(node.get_childern()) if not child.is_delete)
+        return records
+
+    @staticmethod
+    def _write(path: str, text: str) -> None:
+        temp_path = path + ".tmp"
+        with open(temp_path, 'w') as file:
+            file.write(text)
+        os.replace(temp_path, path)
+
+    def save(self, mind_map: MindMapModel) -> dict:
+        os.makedirs(self._path, exist_ok=True)
+        old = self.manifest
+        stats = {"chunks": 0, "written": 0, "removed": 0}
+        root_hash = mind_map.content_hash.hex() if (not mind_map.is_empty()) else None
+        unchanged = root_hash == old["root"] and root_hash is not None
+        if (unchanged and all(os.path.exists(os.path.join(self._path, name + ".json")) for name in old["chunks"])):
+            stats["chunks"] = len(old["chunks"])
+            return stats
+        existing = set(old["chunks"])
+        names = []
+        if (root_hash is not None):
+            for units in self._chunks(mind_map):
+                name = hashlib.blake2b(b"".join(unit[0] for unit in units), digest_size=16).hexdigest()
+                names.append(name)
+                if (name not in existing):
+                    lines = (json.dumps(record) for record in self._records(mind_map, units))
+                    self._write(os.path.join(self._path, name + ".json"), "[\n" + ",\n".join(lines) + "\n]\n")
+                    existing.add(name)
+                    stats["written"] += 1
+        manifest = {"root": root_hash, "chunks": names}
+        self._write(os.path.join(self._path, MANIFEST), json.dumps(manifest))
+        self._manifest = manifest
+        # Only after the new manifest is in place, so a crash never loses data.
+        for name in set(old["chunks"]) - set(names):
+            os.remove(os.path.join(self._path, name + ".json"))
+            stats["removed"] += 1
+        stats["chunks"] = len(names)
+        print("Save {} of {} chunks".format(stats["written"], stats["chunks"]), self._path)
+        return stats
+
+    def load(self, mind_map: MindMapModel) -> bool:
+        self._manifest = None
+        records = []
+        try:
+            for name in self.manifest["chunks"]:
+                with open(os.path.join(self._path, name + ".json"), 'r') as file:
+                    records.extend(json.load(file))
+        except (OSError, ValueError) as e:
+            print("Load failed")
+            print(e)
+            return False
+        errors = []
+        ids, pids, descs, attrs = record_columns(records, errors)
+        print("Load", self._path)
+        return mind_map.load_columns(ids, pids, descs, errors, attrs)
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+
+try:
+    from .model import MindMapModel, Command, Component, Node
+    from .model import AddComponentCommand, EditComponentCommand, DeleteComponentCommand
+    from .model import PasteComponentCommand, MoveComponentCommand, SetAttributeCommand, file_compression
+except ImportError:
+    from model import MindMapModel, Command, Component, Node
+    from model import AddComponentCommand, EditComponentCommand, DeleteComponentCommand
+    from model import PasteComponentCommand, MoveComponentCommand, SetAttributeCommand, file_compression
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import threading
+
+# Constructor arguments of each command that can travel over the wire.
+WIRE_COMMANDS = {
+    "AddComponentCommand": (AddComponentCommand, ("_pid", "_desc")),
+    "EditComponentCommand": (EditComponentCommand, ("_id", "_new_desc")),
+    "DeleteComponentCommand": (DeleteComponentCommand, ("_id",)),
+    "MoveComponentCommand": (MoveComponentCommand, ("_id", "_pid")),
+    "SetAttributeCommand": (SetAttributeCommand, ("_id", "_name", "_value")),
+}
+# asyncio's default 64 KiB line limit is far below a hello for a big map.
+LINE_LIMIT = 256 * 1024 * 1024
+
+
+def encode(message: dict) -> bytes:
+    return (json.dumps(message, separators=(',', ':')) + "\n").encode()
+
+
+def encode_subtree(node: Component, attrs: dict=None) -> list:
+    # [desc, parent index] in preorder, plus the attribute row when there is
+    # one; ids are assigned by the server.
+    records = []
+    stack = [(node, -1)]
+    while (stack):
+        node, parent = stack.pop()
+        row = attrs.get(node.id) if (attrs) else None
+        records.append([node.desc, parent, row] if (row) else [node.desc, parent])
+        index = len(records) - 1
+        stack.extend((child, index) for child in reversed(node.get_childern()) if not child.is_delete)
+    return records
+
+
+def decode_subtree(records: list) -> Component:
+    nodes = []
+    for index, (desc, parent, *_) in enumerate(records):
+        node = Node(index, desc)
+        if (parent != -1):
+            nodes[parent].add_child(node)
+            node.set_parent(nodes[parent])
+        nodes.append(node)
+    for node in reversed(nodes):
+        node._recount()
+    return nodes[0]
+
+
+def encode_command(command: Command) -> list:
+    name = command.__class__.__name__
+    if (isinstance(command, PasteComponentCommand)):
+        return [name, [command._pid, encode_subtree(command._clone_node, command._attrs)]]
+    if (name not in WIRE_COMMANDS):
+        raise ValueError("{} cannot be shared.".format(name))
+    return [name, [getattr(command, field) for field in WIRE_COMMANDS[name][1]]]
+
+
+def decode_command(data: list) -> Command:
+    name, args = data
+    if (name == "PasteComponentCommand"):
+        # Decoded nodes are numbered by position, so rows are keyed the same way.
+        attrs = {index: record[2] for index, record in enumerate(args[1]) if len(record) > 2}
+        return PasteComponentCommand(args[0], decode_subtree(args[1]), attrs)
+    return WIRE_COMMANDS[name][0](*args)
+
+
+def apply_message(mind_map: MindMapModel, message: dict) -> None:
+    # Runs wherever the replica lives (e.g. the GUI thread).
+    if (message["type"] == "hello"):
+        mind_map.restore_from_checkpoint(message["model"])
+    else:
+        for change in message["changes"]:
+            mind_map.apply_change(change)
+    mind_map.notify()
+
+
+class CollabServer:
+    # Owns the shared model. Commands from all clients go through one queue
+    # and are applied in arrival order; everything applied in one pass goes
+    # out as one batch of model changes, encoded once for all clients. Each
+    # client has its own outbound queue and sender task, so a slow reader
+    # only holds itself up; one that falls `max_lag` batches behind is
+    # disconnected (it can rejoin from a fresh checkpoint).
+
+    def __init__(self, mind_map: MindMapModel=None, max_batch: int=512, max_lag: int=1024):
+        self._mind_map = mind_map if (mind_map) else MindMapModel()
+        self._max_batch = max_batch
+        self._max_lag = max_lag
+        self._clients = {}
+        self._ids = itertools.count(1)
+        self._queue = None
+        self._server = None
+        self._applier = None
+        self._version = 0
+        self._ops = 0
+        self._batches = 0
+        self._dropped = 0
+
+    @property
+    def mind_map(self) -> MindMapModel:
+        return self._mind_map
+
+    @property
+    def clients(self) -> int:
+        return len(self._clients)
+
+    @property
+    def stats(self) -> dict:
+        return {"version": self._version, "ops": self._ops, "batches": self._batches, "clients": len(self._clients),
+                "dropped": self._dropped}
+
+    async def start(self, host: str="127.0.0.1", port: int=0) -> tuple:
+        self._queue = asyncio.Queue()
+        self._server = await asyncio.start_server(self._serve, host, port, limit=LINE_LIMIT)
+        self._applier = asyncio.create_task(self._apply_loop())
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def stop(self) -> None:
+        self._server.close()
+        self._applier.cancel()
+        for client in list(self._clients):
+            self._disconnect(client)
+        await self._server.wait_closed()
+
+    async def _serve(self, reader, writer) -> None:
+        client = next(self._ids)
+        # No await between the checkpoint and registering, so the client gets
+        # exactly the batches that follow it.
+        writer.write(encode({"type": "hello", "client": client, "version": self._version,
+                             "model": self._mind_map.get_checkpoint()}))
+        outbox = asyncio.Queue()
+        self._clients[client] = (writer, outbox, asyncio.create_task(self._send(writer, outbox)))
+        try:
+            while (True):
+                line = await reader.readline()
+                if (not line):
+                    break
+                message = json.loads(line)
+                try:
+                    command = decode_command(message["cmd"])
+                except (KeyError, IndexError, TypeError, ValueError) as e:
+                    print("Bad command from client {}: {}".format(client, e))
+                    command = None
+                self._queue.put_nowait((client, message["seq"], command))
+        except (ConnectionError, ValueError) as e:
+            print("Client {} dropped: {}".format(client, e))
+        finally:
+            self._disconnect(client)
+
+    async def _send(self, writer, outbox: asyncio.Queue) -> None:
+        try:
+            while (True):
+                writer.write(await outbox.get())
+                await writer.drain()
+        except ConnectionError:
+            pass
+
+    def _disconnect(self, client: int) -> None:
+        entry = self._clients.pop(client, None)
+        if (entry):
+            writer, _, sender = entry
+            sender.cancel()
+            # abort, not close: a lagging client's unsent buffer is dropped.
+            writer.transport.abort()
+
+    async def _apply_loop(self) -> None:
+        while (True):
+            batch = [await self._queue.get()]
+            while (not self._queue.empty() and len(batch) < self._max_batch):
+                batch.append(self._queue.get_nowait())
+            self._mind_map.begin_changes()
+            acks = []
+            for client, seq, command in batch:
+                try:
+                    result = bool(command and command.execute(self._mind_map))
+                except Exception as e:
+                    print(e)
+                    result = False
+                acks.append([client, seq, result])
+            changes = self._mind_map.end_changes()
+            self._version += 1
+            self._ops += len(batch)
+            self._batches += 1
+            data = encode({"type": "batch", "version": self._version, "changes": changes, "acks": acks})
+            for client, (_, outbox, _) in list(self._clients.items()):
+                if (outbox.qsize() >= self._max_lag):
+                    print("Client {} is {} batches behind, disconnecting".format(client, outbox.qsize()))
+                    self._dropped += 1
+                    self._disconnect(client)
+                else:
+                    outbox.put_nowait(data)
+            # Let the senders run before the next batch.
+            await asyncio.sleep(0)
+
+
+class CollabClient:
+    # Keeps a replica in step with the server. Commands are not applied
+    # locally; they come back, ordered, in the server's batches. Pass `apply`
+    # to run apply_message somewhere else, e.g. on the GUI thread.
+
+    def __init__(self, mind_map: MindMapModel=None, apply=None):
+        self._mind_map = mind_map if (mind_map) else MindMapModel()
+        self._apply = apply if (apply) else (lambda message: apply_message(self._mind_map, message))
+        self._reader = None
+        self._writer = None
+        self._listener = None
+        self._pending = {}
+        self._seq = itertools.count(1)
+        self.client_id = None
+        self.version = 0
+
+    @property
+    def mind_map(self) -> MindMapModel:
+        return self._mind_map
+
+    async def connect(self, host: str, port: int) -> None:
+        self._reader, self._writer = await asyncio.open_connection(host, port, limit=LINE_LIMIT)
+        hello = json.loads(await self._reader.readline())
+        self.client_id = hello["client"]
+        self.version = hello["version"]
+        self._apply(hello)
+        self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        try:
+            while (True):
+                line = await self._reader.readline()
+                if (not line):
+                    break
+                message = json.loads(line)
+                self._apply(message)
+                self.version = message["version"]
+                for client, seq, result in message["acks"]:
+                    if (client == self.client_id):
+                        future = self._pending.pop(seq, None)
+                        if (future and not future.done()):
+                            future.set_result(result)
+        finally:
+            for future in self._pending.values():
+                if (not future.done()):
+                    future.set_exception(ConnectionError("Disconnected from server."))
+            self._pending.clear()
+
+    def submit(self, command: Command) -> asyncio.Future:
+        # Pipelined: resolves to the command's result once its batch is back.
+        return self.submit_encoded(json.dumps(encode_command(command), separators=(',', ':')).encode())
+
+    def submit_encoded(self, cmd: bytes) -> asyncio.Future:
+        # `cmd` is the command's JSON, encoded where the replica lives.
+        seq = next(self._seq)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[seq] = future
+        self._writer.write(b'{"seq":%d,"cmd":%s}\n' % (seq, cmd))
+        return future
+
+    async def execute(self, command: Command) -> bool:
+        future = self.submit(command)
+        await self._writer.drain()
+        return await future
+
+    async def execute_encoded(self, cmd: bytes) -> bool:
+        future = self.submit_encoded(cmd)
+        await self._writer.drain()
+        return await future
+
+    async def close(self) -> None:
+        if (self._writer):
+            self._writer.close()
+            await self._listener
+
+
+class RemoteCommandManager:
+    # Stands in for CommandManager when a window is attached to a server.
+    # The client runs on its own event loop thread; execute only queues.
+
+    journal = None
+
+    def __init__(self, client: CollabClient, loop):
+        self._client = client
+        self._loop = loop
+
+    @classmethod
+    def connect(cls, host: str, port: int, apply, timeout: float=10.0) -> 'RemoteCommandManager':
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+        client = CollabClient(apply=apply)
+        asyncio.run_coroutine_threadsafe(client.connect(host, port), loop).result(timeout)
+        return cls(client, loop)
+
+    def execute(self, command: Command) -> bool:
+        # Encoded here, against the replica this thread owns; the loop
+        # thread only sends the bytes.
+        try:
+            cmd = json.dumps(encode_command(command), separators=(',', ':')).encode()
+        except ValueError as e:
+            print(e)
+            return False
+        asyncio.run_coroutine_threadsafe(self._client.execute_encoded(cmd), self._loop)
+        return True
+
+    def undo(self) -> bool:
+        print("Undo is not shared in a session")
+        return False
+
+    def redo(self) -> bool:
+        print("Redo is not shared in a session")
+        return False
+
+    def close(self) -> None:
+        asyncio.run_coroutine_threadsafe(self._client.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+async def serve(path: str, host: str, port: int, save_interval: float=0) -> None:
+    # Writes the document back every `save_interval` seconds when it has
+    # changed, and once more on shutdown, in the format it was loaded from.
+    mind_map = MindMapModel()
+    file_type = "xml" if (path and path.endswith(".xml")) else "ggm"
+    if (path and not mind_map.load(path, file_type)):
+        print("Cannot open {}".format(path), file=sys.stderr)
+        return
+    compression = file_compression(path) if (path and os.path.exists(path)) else None
+    if (mind_map.is_empty()):
+        mind_map.create_mind_map("Root")
+    server = CollabServer(mind_map)
+    host, port = await server.start(host, port)
+    print("Serving on {}:{}".format(host, port), file=sys.stderr)
+    saved_version = mind_map.version
+    try:
+        if (not path or save_interval <= 0):
+            await asyncio.Event().wait()
+        while (True):
+            await asyncio.sleep(save_interval)
+            version = mind_map.version
+            if (version != saved_version):
+                if (await mind_map.asave(path, file_type, compression=compression)):
+                    saved_version = version
+                else:
+                    print("Cannot save {}: {}".format(path, mind_map.last_error), file=sys.stderr)
+    finally:
+        # Synchronous, so no batch is applied while the file is written.
+        if (path and mind_map.version != saved_version):
+            if (not mind_map.save(path, file_type, compression)):
+                print("Cannot save {}: {}".format(path, mind_map.last_error), file=sys.stderr)
+
+
+def main(argv: list=None) -> int:
+    parser = argparse.ArgumentParser(description="Host a GogoMind map for collaborative editing.")
+    parser.add_argument("path", nargs="?", help="document to open (default: a new map)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--save-interval", type=float, default=60,
+                        help="seconds between saves of a changed document, 0 to save only on exit (default: 60)")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.path, args.host, args.port, args.save_interval))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+try:
+    from .model import MindMapModel, DEFAULT_LEVELS
+except ImportError:
+    from model import MindMapModel, DEFAULT_LEVELS
+
+import argparse
+import glob
+import multiprocessing
+import os
+import sys
+import time
+
+EXTENSIONS = {"ggm": ".ggm", "xml": ".xml"}
+
+
+def file_type_of(path: str) -> str:
+    return "xml" if path.endswith(".xml") else "ggm"
+
+
+def collect(patterns: list) -> list:
+    paths = []
+    for pattern in patterns:
+        if (os.path.isdir(pattern)):
+            for extension in EXTENSIONS.values():
+                paths.extend(glob.glob(os.path.join(pattern, "**", "*" + extension), recursive=True))
+        else:
+            paths.extend(glob.glob(pattern, recursive=True))
+    return sorted(set(paths))
+
+
+def normalize(snapshot: list) -> list:
+    # Renumbers ids densely in the (breadth-first) snapshot order.
+    ids = {-1: -1}
+    for index, obj in enumerate(snapshot):
+        ids[obj["id"]] = index
+    records = []
+    for obj in snapshot:
+        record = {"id": ids[obj["id"]], "desc": obj["desc"], "pid": ids[obj["pid"]]}
+        if ("attrs" in obj):
+            record["attrs"] = obj["attrs"]
+        records.append(record)
+    return records
+
+
+def output_path(path: str, to: str, output: str, root: str=None) -> str:
+    # Under `output`, a file keeps its place relative to `root`, so files of
+    # the same name from different folders do not overwrite each other.
+    base = os.path.splitext(path)[0] + EXTENSIONS[to]
+    if (output):
+        relative = os.path.relpath(os.path.abspath(base), root) if (root) else os.path.basename(base)
+        return os.path.join(output, relative)
+    return base
+
+
+def input_root(paths: list) -> str:
+    if (not paths):
+        return None
+    return os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths])
+
+
+def init_worker(max_memory: int) -> None:
+    # The model logs every node; keep worker output off the summary.
+    sys.stdout = open(os.devnull, 'w')
+    if (max_memory):
+        try:
+            import resource
+            limit = max_memory * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ImportError, ValueError) as e:
+            print("Memory limit unavailable:", e, file=sys.stderr)
+
+
+def convert(job: tuple) -> tuple:
+    # `target` is None to validate only; its extension picks the format.
+    path, target, is_normalize, compression, level = job
+    start = time.perf_counter()
+    try:
+        mind_map = MindMapModel()
+        if (not mind_map.load(path, file_type_of(path))):
+            error = mind_map.last_error
+            message = "{}: {}".format(error.__class__.__name__, error) if (error) else "Cannot open file."
+            return (path, False, 0, time.perf_counter() - start, message)
+        snapshot = mind_map.get_snapshot()
+        if (len(snapshot) != mind_map.size):
+            return (path, False, 0, time.perf_counter() - start, "Unreachable nodes in document.")
+        if (is_normalize):
+            snapshot = normalize(snapshot)
+        if (target):
+            folder = os.path.dirname(target)
+            if (folder):
+                os.makedirs(folder, exist_ok=True)
+            if (not MindMapModel.write_snapshot(target, snapshot, file_type_of(target), compression, level)):
+                return (path, False, len(snapshot), time.perf_counter() - start, "Save failed.")
+        return (path, True, len(snapshot), time.perf_counter() - start, None)
+    except MemoryError:
+        return (path, False, 0, time.perf_counter() - start, "Out of memory.")
+
+
+def main(argv: list=None) -> int:
+    parser = argparse.ArgumentParser(description="Convert, validate and normalise GogoMind documents without Qt.")
+    parser.add_argument("paths", nargs="+", help="files, directories or glob patterns")
+    parser.add_argument("--to", choices=EXTENSIONS.keys(), help="convert to this format; validate only when omitted")
+    parser.add_argument("--output", help="directory for converted files (default: next to the source)")
+    parser.add_argument("--normalize", action="store_true",
+                        help="renumber node ids densely in breadth-first order; without --to, rewrite in the same format")
+    parser.add_argument("--compress", choices=DEFAULT_LEVELS.keys(), help="compress converted files (loading detects it)")
+    parser.add_argument("--level", type=int, help="compression level (default: 6)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--max-tasks-per-child", type=int, default=100, help="recycle a worker after this many files")
+    parser.add_argument("--max-memory", type=int, default=0, help="address space limit per worker in MB")
+    args = parser.parse_args(argv)
+
+    paths = collect(args.paths)
+    root = input_root(paths)
+    targets = {}
+    for path in paths:
+        to = args.to if (args.to) else (file_type_of(path) if (args.normalize) else None)
+        targets[path] = output_path(path, to, args.output, root) if (to) else None
+    # e.g. map.ggm and map.xml in one folder, both converted to XML.
+    writers = {}
+    for path, target in targets.items():
+        if (target):
+            writers.setdefault(os.path.abspath(target), []).append(path)
+    errors = []
+    for target, sources in writers.items():
+        if (len(sources) > 1):
+            for path in sources:
+                errors.append((path, "{} would also be written from {}.".format(target, ", ".join(other for other in sources if other != path))))
+                del targets[path]
+    if (args.output):
+        os.makedirs(args.output, exist_ok=True)
+    jobs = [(path, target, args.normalize, args.compress, args.level) for path, target in targets.items()]
+
+    start = time.perf_counter()
+    succeeded = 0
+    nodes = 0
+    with multiprocessing.Pool(args.jobs, init_worker, (args.max_memory,), args.max_tasks_per_child) as pool:
+        for path, ok, count, seconds, error in pool.imap_unordered(convert, jobs, chunksize=4):
+            if (ok):
+                succeeded += 1
+                nodes += count
+            else:
+                errors.append((path, error))
+    elapsed = time.perf_counter() - start
+
+    for path, error in sorted(errors):
+        print("FAILED {}: {}".format(path, error))
+    print("{} files, {} ok, {} failed, {} nodes in {:.2f}s ({:.1f} files/s, {:.0f} nodes/s)".format(
+        len(paths), succeeded, len(errors), nodes, elapsed,
+        len(paths) / elapsed if (elapsed) else 0.0, nodes / elapsed if (elapsed) else 0.0))
+    return 1 if (errors) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+
+try:
+    from .model import MindMapModel, CommandManager, file_compression
+    from .collab import decode_command
+except ImportError:
+    from model import MindMapModel, CommandManager, file_compression
+    from collab import decode_command
+
+from collections import OrderedDict
+from concurrent.futures import Future
+import argparse
+import contextlib
+import json
+import os
+import sys
+import threading
+
+# Measured with tracemalloc on loaded maps: a node with its index entries
+# costs about 360 bytes; an attribute row adds roughly a third of that.
+NODE_BYTES = 360
+ATTRIBUTE_BYTES = 120
+
+
+def estimate_bytes(mind_map: MindMapModel) -> int:
+    # O(1), so it can run on every release.
+    return len(mind_map._components) * NODE_BYTES + len(mind_map.attributes) * ATTRIBUTE_BYTES
+
+
+def file_type_of(path: str) -> str:
+    return "xml" if path.endswith(".xml") else "ggm"
+
+
+def load_document(path: str) -> MindMapModel:
+    if (not os.path.exists(path)):
+        raise FileNotFoundError("No document {}".format(path))
+    mind_map = MindMapModel()
+    if (not mind_map.load(path, file_type_of(path))):
+        raise ValueError("Cannot load {}: {}".format(path, mind_map.last_error))
+    return mind_map
+
+
+class Document:
+    # An open document. Hold `lock` while running commands: the cache
+    # itself only guards which documents are open.
+
+    def __init__(self, path: str, mind_map: MindMapModel):
+        self._path = path
+        self._mind_map = mind_map
+        self._command_manager = CommandManager(mind_map)
+        self._saved_version = mind_map.version
+        # Saved back the way it was stored.
+        self._compression = file_compression(path) if (os.path.exists(path)) else None
+        self.lock = threading.RLock()
+        self.pins = 0
+        self.bytes = estimate_bytes(mind_map)
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def mind_map(self) -> MindMapModel:
+        return self._mind_map
+
+    @property
+    def command_manager(self) -> CommandManager:
+        return self._command_manager
+
+    @property
+    def dirty(self) -> bool:
+        return self._mind_map.version != self._saved_version
+
+    def save(self) -> bool:
+        with self.lock:
+            version = self._mind_map.version
+            if (not self._mind_map.save(self._path, file_type_of(self._path), self._compression)):
+                return False
+            self._saved_version = version
+            return True
+
+
+class DocumentCache:
+    # Keeps recently used documents open, least recently used first out,
+    # within a byte budget. Documents in use are pinned and never evicted;
+    # dirty ones are saved on their way out. A document being loaded or
+    # flushed is tracked by a Future, so concurrent requests for it wait for
+    # that one load instead of reading the file again.
+
+    def __init__(self, budget: int=256 * 1024 * 1024, loader=load_document):
+        self._budget = budget
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._documents = OrderedDict()
+        self._loading = {}
+        self._flushing = {}
+        self._bytes = 0
+        self._metrics = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "flushes": 0, "flush_errors": 0}
+
+    @property
+    def budget(self) -> int:
+        return self._budget
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._metrics)
+            stats["documents"] = len(self._documents)
+            stats["bytes"] = self._bytes
+        requests = stats["hits"] + stats["misses"] + stats["coalesced"]
+        stats["hit_rate"] = (stats["hits"] + stats["coalesced"]) / requests if (requests) else 0.0
+        return stats
+
+    def __contains__(self, path: str) -> bool:
+        with self._lock:
+            return path in self._documents
+
+    def acquire(self, path: str) -> Document:
+        waited = False
+        while (True):
+            with self._lock:
+                document = self._documents.get(path)
+                if (document):
+                    self._documents.move_to_end(path)
+                    document.pins += 1
+                    if (not waited):
+                        self._metrics["hits"] += 1
+                    return document
+                future = self._loading.get(path)
+                if (future is None):
+                    self._metrics["misses"] += 1
+                    future = self._loading[path] = Future()
+                    flushing = self._flushing.get(path)
+                    break
+                if (not waited):
+                    self._metrics["coalesced"] += 1
+                    waited = True
+            # Raises the loader's error in every waiting request.
+            future.result()
+        try:
+            # Read the file only once its last copy has been written. If that
+            # failed, the document was put back and is used as it is.
+            document = None
+            if (flushing and not flushing.result()):
+                with self._lock:
+                    document = self._documents.get(path)
+            if (document is None):
+                document = Document(path, self._loader(path))
+        except BaseException as e:
+            with self._lock:
+                del self._loading[path]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._loading[path]
+            document.pins += 1
+            if (path not in self._documents):
+                self._documents[path] = document
+                self._bytes += document.bytes
+            victims = self._victims()
+        future.set_result(document)
+        self._flush(victims)
+        return document
+
+    def release(self, document: Document) -> None:
+        with document.lock:
+            size = estimate_bytes(document.mind_map)
+        with self._lock:
+            document.pins -= 1
+            if (self._documents.get(document.path) is document):
+                self._bytes += size - document.bytes
+            document.bytes = size
+            victims = self._victims()
+        self._flush(victims)
+
+    @contextlib.contextmanager
+    def open(self, path: str):
+        document = self.acquire(path)
+        try:
+            yield document
+        finally:
+            self.release(document)
+
+    def _victims(self) -> list:
+        # Called with the lock held.
+        victims = []
+        if (self._bytes <= self._budget):
+            return victims
+        for path, document in list(self._documents.items()):
+            if (self._bytes <= self._budget):
+                break
+            if (document.pins):
+                continue
+            del self._documents[path]
+            self._bytes -= document.bytes
+            self._metrics["evictions"] += 1
+            if (document.dirty):
+                self._flushing[path] = Future()
+                victims.append(document)
+        return victims
+
+    def _flush(self, victims: list) -> None:
+        for document in victims:
+            result = document.save()
+            with self._lock:
+                self._metrics["flushes" if (result) else "flush_errors"] += 1
+                if (not result and document.path not in self._documents):
+                    # Never drop unsaved edits: keep the document open.
+                    self._documents[document.path] = document
+                    self._documents.move_to_end(document.path, last=False)
+                    self._bytes += document.bytes
+                future = self._flushing.pop(document.path)
+            future.set_result(result)
+
+    def flush(self) -> int:
+        # Saves every dirty document, e.g. before shutting down.
+        with self._lock:
+            documents = list(self._documents.values())
+        saved = 0
+        for document in documents:
+            if (document.dirty and document.save()):
+                saved += 1
+        return saved
+
+
+class DocumentService:
+    # JSON-RPC 2.0 front end: each method takes the document path first.
+
+    METHODS = ("snapshot", "execute", "undo", "redo", "save", "stats")
+
+    def __init__(self, cache: DocumentCache, root: str="."):
+        self._cache = cache
+        self._root = os.path.abspath(root)
+
+    def _path(self, name: str) -> str:
+        path = os.path.abspath(os.path.join(self._root, name))
+        if (os.path.commonpath([self._root, path]) != self._root):
+            raise ValueError("{} is outside the document root".format(name))
+        return path
+
+    def call(self, method: str, params: list):
+        if (method == "stats"):
+            return self._cache.stats
+        with self._cache.open(self._path(params[0])) as document:
+            with document.lock:
+                if (method == "snapshot"):
+                    return document.mind_map.get_snapshot()
+                if (method == "execute"):
+                    return document.command_manager.execute(decode_command(params[1]))
+                if (method == "undo"):
+                    return document.command_manager.undo()
+                if (method == "redo"):
+                    return document.command_manager.redo()
+                return document.save()
+
+    def handle(self, request: dict) -> dict:
+        if (not isinstance(request, dict)):
+            # Valid JSON, but not a request object (e.g. a list or a number).
+            return {"jsonrpc": "2.0", "id": None, "error": {"code": -32600, "message": "Invalid Request"}}
+        response = {"jsonrpc": "2.0", "id": request.get("id")}
+        if (request.get("method") not in self.METHODS):
+            response["error"] = {"code": -32601, "message": "Unknown method {}".format(request.get("method"))}
+            return response
+        try:
+            response["result"] = self.call(request["method"], request.get("params", []))
+        except FileNotFoundError as e:
+            response["error"] = {"code": -32001, "message": str(e)}
+        except Exception as e:
+            response["error"] = {"code": -32000, "message": str(e)}
+        return response
+
+    def serve(self, host: str="127.0.0.1", port: int=8080):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                try:
+                    response = service.handle(json.loads(body))
+                except ValueError as e:
+                    response = {"jsonrpc": "2.0", "id": None, "error": {"code": -32700, "message": str(e)}}
+                data = json.dumps(response).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return ThreadingHTTPServer((host, port), Handler)
+
+
+def main(argv: list=None) -> int:
+    parser = argparse.ArgumentParser(description="Serve GogoMind documents over JSON-RPC.")
+    parser.add_argument("root", help="directory holding the documents")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--budget", type=int, default=256, help="cache budget in MB")
+    args = parser.parse_args(argv)
+    cache = DocumentCache(args.budget * 1024 * 1024)
+    server = DocumentService(cache, args.root).serve(args.host, args.port)
+    print("Serving {} on {}:{}".format(args.root, *server.server_address[:2]), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print("Saved {} documents".format(cache.flush()), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
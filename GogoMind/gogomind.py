@@ -8,11 +8,13 @@ import traceback
 
 from core import *
 
-from model import Command, AddComponentCommand, EditComponentCommand, DeleteComponentCommand, PasteComponentCommand
+from model import Command, AddComponentCommand, EditComponentCommand, DeleteComponentCommand, PasteComponentCommand, MoveComponentCommand
 from model import MindMapModel, CommandManager
-from model import Component, Root, Node
-from model import traversal
+from model import Component, Root, Node, Clipboard
 from model import Observer, Subject
+from autosave import AutoSaveService
+from journal import CommandJournal
+from collab import RemoteCommandManager, apply_message
 
 import os
 import sys
@@ -77,20 +79,35 @@ class PresentationModel:
         self._state = PointerState()
         self._command_manager = command_manager
         self._main_window =  main_window
-        self._clone_node = None
+        self._clipboard = None
+        self._cut_node_id = None
 
     @property
-    def clone_node(self) -> Component:
-        return self._clone_node
+    def clipboard(self) -> Clipboard:
+        return self._clipboard
 
-    @clone_node.setter
-    def clone_node(self, clone_node) -> None:
-        self._clone_node = clone_node
+    @clipboard.setter
+    def clipboard(self, clipboard) -> None:
+        self._clipboard = clipboard
+        self._cut_node_id = None
+
+    @property
+    def cut_node_id(self) -> int:
+        return self._cut_node_id
+
+    @cut_node_id.setter
+    def cut_node_id(self, id: int) -> None:
+        self._cut_node_id = id
+        self._clipboard = None
 
     @property
     def command_manager(self) -> CommandManager:
         return self._command_manager
 
+    @command_manager.setter
+    def command_manager(self, command_manager) -> None:
+        self._command_manager = command_manager
+
     @property
     def main_window(self):
         return self._main_window
@@ -234,6 +251,9 @@ class MapScene(QGraphicsScene):
 
 class MainWindow(QMainWindow, Observer):
 
+    # Carries server messages from the session thread to the GUI thread.
+    collab_received = pyqtSignal(object)
+
     def __init__(self, *args, **kwargs):
         super(MainWindow, self).__init__(*args, **kwargs)
 
@@ -243,6 +263,8 @@ class MainWindow(QMainWindow, Observer):
         # self.path holds the path of the currently open file.
         # If none, we haven't got a file open yet (or creating new).
         self.path = None
+        # (path, file type) of a Save As still being written.
+        self._save_as = None
 
         layout.addWidget(self.scene_view)
 
@@ -270,6 +292,11 @@ class MainWindow(QMainWindow, Observer):
         file_menu.addAction(save_file_action)
         file_toolbar.addAction(save_file_action)
 
+        join_action = QAction("Join session...", self)
+        join_action.setStatusTip("Edit a map shared by a collaboration server")
+        join_action.triggered.connect(self.file_join)
+        file_menu.addAction(join_action)
+
         edit_toolbar = QToolBar("Edit")
         edit_toolbar.setIconSize(QSize(16, 16))
         self.addToolBar(edit_toolbar)
@@ -291,7 +318,7 @@ class MainWindow(QMainWindow, Observer):
 
         cut_action = QAction(QIcon(os.path.join('images', 'scissors.png')), "Cut", self)
         cut_action.setStatusTip("Cut selected node")
-        # cut_action.triggered.connect(self.editor.cut)
+        cut_action.triggered.connect(self._pressed_cut_action)
         edit_toolbar.addAction(cut_action)
         edit_menu.addAction(cut_action)
 
@@ -353,6 +380,8 @@ class MainWindow(QMainWindow, Observer):
         self._mind_map = None
         self._command_manager = None
         self._presentation_model = None
+        self._remote = None
+        self.collab_received.connect(self._collab_received)
         self._init_mind_map()
 
         self.scene.set_presentation_model(self._presentation_model)
@@ -365,6 +394,9 @@ class MainWindow(QMainWindow, Observer):
     def _init_mind_map(self) -> None:
         self._mind_map = MindMapModel()
         self._mind_map.attach(self)
+        self._autosave = AutoSaveService(self._mind_map, parent=self)
+        self._autosave.saved.connect(self._saved)
+        self._journal = None
         self._command_manager = CommandManager(self._mind_map)
         self._presentation_model = PresentationModel(self, self._command_manager) 
         self._pressed_selection_action()
@@ -417,24 +449,33 @@ class MainWindow(QMainWindow, Observer):
         if (state):
             node = self._get_selected_node()
             if (node):
-                clone_node = node.clone()
-                self._presentation_model.clone_node = clone_node
-                print("Clone Node")
-                result = []
-                traversal(clone_node, 0, result)
-                print(result)
+                self._presentation_model.clipboard = self._mind_map.copy_node(node.id)
+                self.status.showMessage("Copied {} nodes".format(node.subtree_size))
+                print("Copy Node {}".format(node.id))
+
+    def _pressed_cut_action(self):
+        state = self._is_pointer_state()
+        if (state):
+            node = self._get_selected_node()
+            if (node and node.get_parent()):
+                self._presentation_model.cut_node_id = node.id
+                self.status.showMessage("Cut {} nodes".format(node.subtree_size))
+                print("Cut Node {}".format(node.id))
 
     def _pressed_paste_action(self):
         state = self._is_pointer_state()
         if (state):
             node = self._get_selected_node()
-            clone_node = self._presentation_model.clone_node
-            if (node and clone_node):
+            cut_node_id = self._presentation_model.cut_node_id
+            clipboard = self._presentation_model.clipboard
+            if (node and cut_node_id is not None):
+                print("Move node {} to {}".format(cut_node_id, node.id))
+                if (self._command_manager.execute(MoveComponentCommand(cut_node_id, node.id))):
+                    self._presentation_model.cut_node_id = None
+                    self.update()
+            elif (node and clipboard):
                 print("Paste node")
-                result = []
-                traversal(clone_node, 0, result)
-                print(result)
-                self._command_manager.execute(PasteComponentCommand(node.id, clone_node))
+                self._command_manager.execute(PasteComponentCommand(node.id, clipboard.node, clipboard.attributes))
                 self.update()
 
 
@@ -499,13 +540,26 @@ class MainWindow(QMainWindow, Observer):
 
     def file_open(self):
         path, _ = QFileDialog.getOpenFileName(self, "Open file", "", "All Files (*);;GogoMind documents (*.ggm);;GogoMind XML documents (*.xml)")
+        if (not path):
+            return False
         type = path.split('.')[-1]
+        # Settle the current document and its journal before it is replaced.
+        self._flush()
+        self._close_journal()
         if (self._mind_map.load(path, type)):
-            self.update()
+            self._leave_session()
+            # A Save As of the old document must not move this one.
+            self._save_as = None
             self.path = path
+            self._autosave.set_path(path, self._file_type(path), saved=True)
+            # Recovered edits leave the model newer than the file, so they get saved.
+            self._open_journal(path)
+            self.update()
             self.update_title()
             return True
         else:
+            if (self.path):
+                self._open_journal(self.path, False)
             return False
 
     def file_save(self):
@@ -513,7 +567,8 @@ class MainWindow(QMainWindow, Observer):
             # If we do not have a path, we need to use Save As.
             return self.file_saveas()
         else:
-            return self._mind_map.save(self.path)
+            self._autosave.save(self.path, self._file_type(self.path))
+            return True
 
     def file_saveas(self):
         path, type = QFileDialog.getSaveFileName(self, "Save file", "", "GogoMind documents (*.ggm);;GogoMind XML documents (*.xml)")
@@ -522,12 +577,98 @@ class MainWindow(QMainWindow, Observer):
             return False
         else:
             file_type = "ggm" if "xml" not in type else "xml"
-            if (self._mind_map.save(path, file_type)):
+            # The document only moves to the new path once the write succeeds (see _saved).
+            self._save_as = (path, file_type)
+            self._autosave.save(path, file_type)
+            self.status.showMessage("Saving {}...".format(os.path.basename(path)))
+            return True
+
+    def file_join(self):
+        address, okPressed = QInputDialog.getText(self, "Join session", "Server (host:port):", QLineEdit.Normal, "127.0.0.1:8765")
+        if (not okPressed or not address):
+            return False
+        host, _, port = address.rpartition(":")
+        # The server's map replaces this one: save it first and wait for the write.
+        self._flush()
+        if (self._mind_map.version != self._autosave.saved_version(self.path) and (self.path or self._mind_map.size > 1)):
+            reply = QMessageBox.question(self, "Join session", "The current map has unsaved changes. Discard them and join?",
+                    QMessageBox.Yes | QMessageBox.No)
+            if (reply != QMessageBox.Yes):
+                return False
+        try:
+            remote = RemoteCommandManager.connect(host or "127.0.0.1", int(port), self.collab_received.emit)
+        except Exception as e:
+            self.dialog_critical("Cannot join {}: {}".format(address, e))
+            return False
+        self._leave_session()
+        # Kept on disk if the save above failed, so recovery can still find it.
+        self._close_journal()
+        # The shared map is not the local file; Save As keeps a copy.
+        self.path = None
+        self._save_as = None
+        self._autosave.set_path(None, "ggm")
+        self._remote = remote
+        self._command_manager = remote
+        self._presentation_model.command_manager = remote
+        self.update_title()
+        self.status.showMessage("Joined {}".format(address))
+        return True
+
+    def _leave_session(self) -> None:
+        if (self._remote):
+            self._remote.close()
+            self._remote = None
+            self._command_manager = CommandManager(self._mind_map)
+            self._presentation_model.command_manager = self._command_manager
+
+    def _collab_received(self, message) -> None:
+        if (message["type"] == "hello"):
+            self.scene.reset()
+        apply_message(self._mind_map, message)
+
+    def _open_journal(self, path: str, recover: bool=True) -> None:
+        self._close_journal()
+        # Replays a journal left behind by a crash on top of its checkpoint.
+        self._journal = CommandJournal.open(self._mind_map, path, recover)
+        self._journal.mark_saved(self._autosave.saved_version(path))
+        self._command_manager.journal = self._journal
+
+    def _flush(self) -> None:
+        # Saves pending edits and waits for the write to finish.
+        self._autosave.autosave()
+        self._autosave.wait()
+
+    def _close_journal(self) -> None:
+        # The journal is only discarded once a finished save covers it.
+        if (self._journal):
+            self._journal.mark_saved(self._autosave.saved_version(self.path))
+            self._journal.close(discard=True)
+            self._journal = None
+            self._command_manager.journal = None
+
+    def _file_type(self, path: str) -> str:
+        return "xml" if path.endswith(".xml") else "ggm"
+
+    def _saved(self, path: str, result: bool) -> None:
+        save_as = self._save_as if (self._save_as and self._save_as[0] == path) else None
+        if (save_as):
+            self._save_as = None
+        if (result):
+            if (save_as):
                 self.path = path
+                self._autosave.set_path(*save_as)
+                self._open_journal(path, False)
                 self.update_title()
-                return True
-            else:
-                return False
+            self.status.showMessage("Saved {}".format(os.path.basename(path)))
+        else:
+            self.dialog_critical("Failed to save {}".format(path))
+
+    def closeEvent(self, event):
+        self._autosave.autosave()
+        self._autosave.shutdown()
+        self._close_journal()
+        self._leave_session()
+        super().closeEvent(event)
 
     def update_title(self):
         self.setWindowTitle("%s - GogoMind" % (os.path.basename(self.path) if self.path else "Untitled"))
@@ -539,6 +680,7 @@ class MainWindow(QMainWindow, Observer):
 
     def draw(self):
         self.scene.clear()
+        self.status.showMessage("Nodes: {}".format(self._mind_map.size))
         print("map: {}".format(self._mind_map.map))
         location_map = {}
         p = {}
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+try:
+    from .model import MindMapModel, Command
+except ImportError:
+    from model import MindMapModel, Command
+
+import os
+import json
+
+
+class CommandJournal:
+
+    def __init__(self, mind_map: MindMapModel, path: str, checkpoint_interval: int=1000, sync_interval: int=32):
+        self._mind_map = mind_map
+        self._journal_path = path + ".journal"
+        self._checkpoint_path = path + ".checkpoint"
+        self._checkpoint_interval = checkpoint_interval
+        self._sync_interval = sync_interval
+        self._records = 0
+        self._unsynced = 0
+        self._generation = 0
+        self._file = None
+        # The model version the document file on disk matches.
+        self._saved_version = mind_map.version
+
+    @property
+    def journal_path(self) -> str:
+        return self._journal_path
+
+    @property
+    def checkpoint_path(self) -> str:
+        return self._checkpoint_path
+
+    @property
+    def unsaved(self) -> bool:
+        # True while the journal holds edits (recovered or new) no save covers.
+        return self._mind_map.version != self._saved_version
+
+    def mark_saved(self, version: int) -> None:
+        # `version` is the model version the last successful save was taken at,
+        # or None if the document was never saved.
+        self._saved_version = version
+
+    @classmethod
+    def open(cls, mind_map: MindMapModel, path: str, recover: bool=True, **kwargs) -> 'CommandJournal':
+        journal = cls(mind_map, path, **kwargs)
+        if (recover and os.path.exists(journal.checkpoint_path)):
+            journal.recover()
+        # Start a fresh generation so new records never follow a torn tail.
+        journal.checkpoint()
+        return journal
+
+    def recover(self) -> int:
+        with open(self._checkpoint_path, 'r') as file:
+            checkpoint = json.load(file)
+        self._mind_map.restore_from_checkpoint(checkpoint["model"])
+        self._generation = checkpoint["generation"]
+        replayed = 0
+        if (os.path.exists(self._journal_path)):
+            with open(self._journal_path, 'r') as file:
+                header = file.readline()
+                # A journal from an older generation is already folded into the checkpoint.
+                if (header and json.loads(header)["generation"] == self._generation):
+                    replayed = self._replay(file)
+        print("Recovered {} journal records".format(replayed))
+        return replayed
+
+    def _replay(self, lines) -> int:
+        replayed = 0
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A torn tail left by a crash mid-append.
+                print("Journal truncated at record {}".format(replayed))
+                break
+            for change in record["changes"]:
+                self._mind_map.apply_change(change)
+            replayed += 1
+        return replayed
+
+    def record(self, op: str, command: Command, changes: list) -> None:
+        record = {"op": op, "cmd": command.__class__.__name__, "changes": changes}
+        self._file.write(json.dumps(record, separators=(',', ':')) + "\n")
+        self._records += 1
+        self._unsynced += 1
+        if (self._records >= self._checkpoint_interval):
+            self.checkpoint()
+        elif (self._unsynced >= self._sync_interval):
+            self.sync()
+
+    def sync(self) -> None:
+        if (self._file and self._unsynced):
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def checkpoint(self) -> None:
+        self._generation += 1
+        temp_path = self._checkpoint_path + ".tmp"
+        with open(temp_path, 'w') as file:
+            json.dump({"generation": self._generation, "model": self._mind_map.get_checkpoint()}, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self._checkpoint_path)
+        if (self._file):
+            self._file.close()
+        self._file = open(self._journal_path, 'w')
+        self._file.write(json.dumps({"generation": self._generation}) + "\n")
+        self._file.flush()
+        self._records = 0
+        self._unsynced = 0
+
+    def close(self, discard: bool=False) -> None:
+        if (self._file):
+            self.sync()
+            self._file.close()
+            self._file = None
+        # Never drop the only copy of edits that were not saved.
+        if (discard and not self.unsaved):
+            for path in (self._journal_path, self._checkpoint_path):
+                if (os.path.exists(path)):
+                    os.remove(path)
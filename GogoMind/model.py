@@ -1,11 +1,18 @@
 #!/usr/bin/env python3
 
-from core import *
-import os
-import json
+# Annotations stay unevaluated, so typing is never imported at runtime.
+from __future__ import annotations
 
-from xml.etree.ElementTree import Element, SubElement, tostring
-import xml.etree.ElementTree as XMLET
+import abc
+import operator
+import os
+import sys
+import time
+import weakref
+from _thread import allocate_lock
+from array import array
+from collections import deque, namedtuple
+from itertools import compress, repeat
 
 __all__ = ["Component", "Root", "Node"]
 
@@ -19,7 +26,8 @@ class Observer:
 
 class Subject:
 
-    _observers = [] 
+    def __init__(self):
+        self._observers = []
 
     def attach(self, observer: Observer):
         if (observer not in self._observers):
@@ -46,6 +54,160 @@ def traversal(root: 'Component', level: int, result: List[List[int]]) -> None:
             traversal(child, level + 1, result)
 
 
+class MindMapValidationError(ValueError):
+
+    def __init__(self, errors: List[str]):
+        super().__init__("{} error(s): {}".format(len(errors), " ".join(errors[:10])))
+        self.errors = errors
+
+
+def record_columns(records: List, errors: List[str]) -> Tuple[List[int], List[int], List[str], Dict[int, Dict]]:
+    # Splits records into id, pid and desc columns plus the attributes by id,
+    # reporting malformed records.
+    ids, pids, descs, attrs = [], [], [], {}
+    for index, obj in enumerate(records):
+        try:
+            id, pid, desc = obj["id"], obj["pid"], obj["desc"]
+        except (KeyError, TypeError):
+            errors.append("Record {} is missing id, pid or desc.".format(index))
+            continue
+        if (not isinstance(id, int) or not isinstance(pid, int)):
+            errors.append("Record {} has a non-integer id or pid.".format(index))
+            continue
+        if (not isinstance(desc, str)):
+            errors.append("Record {} has a non-string desc.".format(index))
+            continue
+        row = obj.get("attrs")
+        if (row):
+            if (not isinstance(row, dict)):
+                errors.append("Record {} has malformed attrs.".format(index))
+                continue
+            attrs[id] = row
+        ids.append(id)
+        pids.append(pid)
+        descs.append(desc)
+    return ids, pids, descs, attrs
+
+
+def validate_records(records: List) -> List[str]:
+    errors = []
+    ids, pids, _, _ = record_columns(records, errors)
+    return errors + validate_columns(ids, pids)
+
+
+def validate_columns(ids: List[int], pids: List[int]) -> List[str]:
+    # One pass over the records plus one over the tree; reports every error.
+    errors = []
+    parents = {}
+    position = {}
+    roots = []
+    for index, (id, pid) in enumerate(zip(ids, pids)):
+        if (id in parents):
+            errors.append("Duplicate id {} in records {} and {}.".format(id, position[id], index))
+            continue
+        parents[id] = pid
+        position[id] = index
+        if (pid == -1):
+            roots.append(id)
+    if (not roots and ids):
+        errors.append("No root record.")
+    elif (len(roots) > 1):
+        errors.append("Multiple roots: {}.".format(roots))
+    for root in roots:
+        if (root != 0):
+            errors.append("Root must have id 0, not {}.".format(root))
+    if (parents.get(0, -1) != -1):
+        errors.append("Id 0 is reserved for the root.")
+
+    children = {}
+    for id, pid in parents.items():
+        if (pid == -1):
+            continue
+        if (pid not in parents):
+            errors.append("Node {} has missing parent {}.".format(id, pid))
+        children.setdefault(pid, []).append(id)
+    reached = set()
+    stack = list(roots)
+    while (stack):
+        id = stack.pop()
+        reached.add(id)
+        stack.extend(children.get(id, ()))
+    # Whatever is not reachable from a root hangs off a missing parent or a cycle.
+    visited = set()
+    for start in parents:
+        if (start in reached or start in visited):
+            continue
+        path = []
+        on_path = set()
+        id = start
+        while (id in parents and id not in reached and id not in visited):
+            visited.add(id)
+            on_path.add(id)
+            path.append(id)
+            id = parents[id]
+        if (id in on_path):
+            errors.append("Cycle through nodes {}.".format(path[path.index(id):]))
+    return errors
+
+
+# Files: zlib is stored in a gzip container, so standard tools can read it.
+# Both are told apart from plain JSON ("[") and XML ("<") by their magic bytes.
+FILE_MAGIC = {"zlib": b"\x1f\x8b", "lzma": b"\xfd7zXZ\x00"}
+DEFAULT_LEVELS = {"zlib": 6, "lzma": 6}
+
+
+def file_compression(path: str) -> str:
+    with open(path, 'rb') as file:
+        head = file.read(6)
+    for compression, magic in FILE_MAGIC.items():
+        if (head.startswith(magic)):
+            return compression
+    return None
+
+
+def open_document(path: str, mode: str='r', compression: str=None, level: int=None):
+    # Reading detects the format; writing streams through the compressor.
+    binary = 'b' in mode
+    mode = mode.replace('b', '').replace('t', '')
+    if (mode == 'r'):
+        compression = file_compression(path)
+    if (compression is None):
+        return open(path, mode + ('b' if (binary) else ''))
+    if (compression not in DEFAULT_LEVELS):
+        raise ValueError("Unknown compression {}.".format(compression))
+    level = DEFAULT_LEVELS[compression] if (level is None) else level
+    mode += 'b' if (binary) else 't'
+    if (compression == "zlib"):
+        import gzip
+        return gzip.open(path, mode, compresslevel=level)
+    import lzma
+    return lzma.open(path, mode, preset=level if ('w' in mode) else None)
+
+
+def compress_snapshot(snapshot: List, compression: str="zlib", level: int=1) -> bytes:
+    # For snapshots held in memory (undo), where a fast level pays off most.
+    import json
+    data = json.dumps(snapshot, separators=(',', ':')).encode()
+    if (compression == "zlib"):
+        import zlib
+        return zlib.compress(data, level)
+    if (compression == "lzma"):
+        import lzma
+        return lzma.compress(data, preset=level)
+    raise ValueError("Unknown compression {}.".format(compression))
+
+
+def decompress_snapshot(data: bytes) -> List:
+    import json
+    if (data.startswith(FILE_MAGIC["lzma"])):
+        import lzma
+        data = lzma.decompress(data)
+    elif (not data.startswith(b"[")):
+        import zlib
+        data = zlib.decompress(data)
+    return json.loads(data)
+
+
 class ComponentVisitor(abc.ABC):
     
     @abc.abstractmethod
@@ -56,6 +218,7 @@ class ComponentVisitor(abc.ABC):
 class XMLSavingVisitor(ComponentVisitor):
 
     def save(self, component):
+        from xml.etree.ElementTree import Element, SubElement
         node_tag = Element("Node")
         id_tag = SubElement(node_tag, "Id")
         id_tag.text = str(component.id)
@@ -78,25 +241,194 @@ class JSONSavingVisitor(ComponentVisitor):
         return info
 
 
+class DescriptionFactory:
+
+    # Shared by every node of every document: desc -> [desc, references].
+    # Nodes are built on worker threads too (aload, documents.py), so every
+    # update holds LOCK. A node that is collected does not release its
+    # description; instead, entries no node holds any more are swept out
+    # whenever the pool has doubled since the last sweep.
+    CACHE = {}
+    HITS = 0
+    MISSES = 0
+    LOCK = allocate_lock()
+    SWEEP_AT = 1024
+
+    def get_description(self, desc: str) -> str:
+        with self.LOCK:
+            entry = self.CACHE.get(desc)
+            if (entry):
+                entry[1] += 1
+                DescriptionFactory.HITS += 1
+                return entry[0]
+            if (len(self.CACHE) >= DescriptionFactory.SWEEP_AT):
+                self._sweep()
+                DescriptionFactory.SWEEP_AT = max(1024, 2 * len(self.CACHE))
+            self.CACHE[desc] = [desc, 1]
+            DescriptionFactory.MISSES += 1
+            return desc
+
+    def release(self, desc: str) -> None:
+        with self.LOCK:
+            entry = self.CACHE.get(desc)
+            if (entry):
+                entry[1] -= 1
+                if (entry[1] <= 0):
+                    del self.CACHE[desc]
+
+    def sweep(self) -> int:
+        with self.LOCK:
+            return self._sweep()
+
+    def _sweep(self) -> int:
+        # The pool holds each string twice (key and entry) and getrefcount
+        # adds one; anything above that is a live node or other user.
+        unused = [entry[0] for entry in self.CACHE.values() if sys.getrefcount(entry[0]) <= 3]
+        for desc in unused:
+            del self.CACHE[desc]
+        return len(unused)
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        with self.LOCK:
+            lookups = self.HITS + self.MISSES
+            return {
+                "size": len(self.CACHE),
+                "references": sum(entry[1] for entry in self.CACHE.values()),
+                "hits": self.HITS,
+                "misses": self.MISSES,
+                "hit_rate": self.HITS / lookups if (lookups) else 0.0,
+            }
+
+
+DESCRIPTION_FACTORY = DescriptionFactory()
+
+
 class Component(abc.ABC):
 
     def __init__(self, id:int, desc:str):
         self._id = id
-        self._desc = desc
+        self._desc = DESCRIPTION_FACTORY.get_description(desc)
         self._children = []
         self._siblings = []
         self._parent = None
         self._is_delete = False
+        self._size = 1
+        self._height = 1
+        self._deleted = 0
+        self._hash = None
+        self._attrs = ""
+        self._history = None
     
     @property
     def is_delete(self) -> bool:
         return self._is_delete
 
     def delete(self, deleted: bool, with_child: bool=False) -> None:
+        size, height, deleted_count = self._size, self._height, self._deleted
+        # Deleted nodes are never rehashed, so a stale hash here says nothing
+        # about the ancestors: always clear them.
+        self._hash = None
+        if (self._parent):
+            self._parent._invalidate_hash()
+        self._mark_delete(deleted, with_child)
+        self._propagate(self._size - size, self._deleted - deleted_count, height, self._height)
+
+    def _mark_delete(self, deleted: bool, with_child: bool) -> None:
         self._is_delete = deleted
+        self._hash = None
         if (with_child):
             for child in self._children:
-                child.delete(deleted, with_child)
+                child._mark_delete(deleted, with_child)
+        self._recount()
+
+    def _recount(self) -> None:
+        self._deleted = (1 if (self._is_delete) else 0) + sum(child._deleted for child in self._children)
+        if (self._is_delete):
+            self._size = 0
+            self._height = 0
+        else:
+            self._size = 1 + sum(child._size for child in self._children)
+            self._height = 1 + max((child._height for child in self._children), default=0)
+
+    def _propagate(self, size_delta: int, deleted_delta: int, old_height: int, new_height: int) -> None:
+        # Walk up the ancestor chain, so every update costs O(depth). A child
+        # that grew can only raise its parent's height; the siblings are only
+        # rescanned when the child that shrank was the tallest one.
+        node = self._parent
+        while (node and (size_delta or deleted_delta or old_height != new_height)):
+            if (node._is_delete):
+                size_delta = 0
+                old_height = new_height
+            else:
+                node._size += size_delta
+                height = node._height
+                if (new_height > old_height):
+                    node._height = max(height, new_height + 1)
+                elif (new_height < old_height and old_height + 1 == height):
+                    node._height = 1 + max((child._height for child in node._children), default=0)
+                old_height, new_height = height, node._height
+            node._deleted += deleted_delta
+            node = node._parent
+
+    def _invalidate_hash(self) -> None:
+        # A stale hash implies stale ancestors, so stop at the first one.
+        node = self
+        while (node and node._hash is not None):
+            node._hash = None
+            node = node._parent
+
+    def _unlink(self) -> int:
+        parent = self._parent
+        parent._invalidate_hash()
+        index = parent._children.index(self)
+        del parent._children[index]
+        self._propagate(-self._size, -self._deleted, self._height, 0)
+        self._parent = None
+        return index
+
+    def _link(self, parent: 'Component', index: int=None) -> None:
+        if (index is None):
+            parent._children.append(self)
+        else:
+            parent._children.insert(index, self)
+        self._parent = parent
+        parent._invalidate_hash()
+        self._propagate(self._size, self._deleted, 0, self._height)
+
+    @property
+    def subtree_size(self) -> int:
+        return self._size
+
+    @property
+    def subtree_height(self) -> int:
+        return self._height
+
+    @property
+    def deleted_count(self) -> int:
+        return self._deleted
+
+    @property
+    def subtree_hash(self) -> bytes:
+        # Merkle hash over id, desc, attributes and the visible children's hashes; only
+        # stale nodes are rehashed, bottom-up and without recursion.
+        if (self._hash is None):
+            import hashlib
+            stack = [(self, False)]
+            while (stack):
+                node, ready = stack.pop()
+                if (ready):
+                    digest = hashlib.blake2b("{}:{}:{}:".format(node._id, len(node._desc), len(node._attrs)).encode(), digest_size=16)
+                    digest.update(node._desc.encode())
+                    digest.update(node._attrs.encode())
+                    for child in node._children:
+                        if (not child._is_delete):
+                            digest.update(child._hash)
+                    node._hash = digest.digest()
+                elif (node._hash is None):
+                    stack.append((node, True))
+                    stack.extend((child, False) for child in node._children if not child._is_delete)
+        return self._hash
 
     @property
     def id(self) -> int:
@@ -105,6 +437,7 @@ class Component(abc.ABC):
     @id.setter
     def id(self, id) -> None:
         self._id = id
+        self._invalidate_hash()
    
     @property
     def desc(self) -> str:
@@ -112,7 +445,10 @@ class Component(abc.ABC):
 
     @desc.setter
     def desc(self, desc: str) -> None:
+        desc = DESCRIPTION_FACTORY.get_description(desc)
+        DESCRIPTION_FACTORY.release(self._desc)
         self._desc = desc
+        self._invalidate_hash()
 
     def get_parent(self) -> 'Component':
         return self._parent
@@ -123,6 +459,7 @@ class Component(abc.ABC):
             return False
         else:
             self._children.append(node)
+            self._invalidate_hash()
             return True
 
     @abc.abstractmethod
@@ -155,13 +492,23 @@ class Component(abc.ABC):
         return {"desc": self._desc, "id": str(self._id)}
 
     def clone(self) -> 'Component':
+        # With an explicit stack, so deep branches do not hit the recursion limit.
         clone_node = Node(self._id, self._desc)
         clone_node.set_parent(self.get_parent())
-        for child in self._children:
-            if (not child.is_delete):
-                clone_node.add_child(child.clone())
-        for child in clone_node.get_childern():
-            child.set_parent(clone_node)
+        nodes = [clone_node]
+        stack = [(self, clone_node)]
+        while (stack):
+            origin, copy = stack.pop()
+            for child in origin._children:
+                if (not child.is_delete):
+                    child_copy = Node(child._id, child._desc)
+                    copy._children.append(child_copy)
+                    child_copy._parent = copy
+                    nodes.append(child_copy)
+                    stack.append((child, child_copy))
+        # Parents come before their children in nodes, so count bottom-up.
+        for node in reversed(nodes):
+            node._recount()
         return clone_node
 
 
@@ -226,30 +573,525 @@ class Node(Component):
         return "{desc} <Id:{id}, Type:{type}>".format(**info)
 
 
+class AncestryIndex:
+
+    def __init__(self, root: 'Component'):
+        self._enter = {}
+        self._leave = {}
+        self._depth = {}
+        self._first = {}
+        self._table = []
+        self._pending = {}
+        self._build(root)
+
+    def __len__(self) -> int:
+        return len(self._first) + len(self._pending)
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    @property
+    def built(self) -> int:
+        return len(self._first)
+
+    def _build(self, root: 'Component') -> None:
+        # Euler tour with entry/leave stamps, done iteratively so deep maps
+        # do not hit the recursion limit.
+        tour = [(0, root.id)]
+        clock = 0
+        self._enter[root.id] = clock
+        self._depth[root.id] = 0
+        self._first[root.id] = 0
+        stack = [(root, iter(root._children))]
+        while (stack):
+            node, children = stack[-1]
+            child = next(children, None)
+            clock += 1
+            if (child is None):
+                stack.pop()
+                self._leave[node.id] = clock
+                if (stack):
+                    parent = stack[-1][0]
+                    tour.append((self._depth[parent.id], parent.id))
+            else:
+                depth = self._depth[node.id] + 1
+                self._enter[child.id] = clock
+                self._depth[child.id] = depth
+                self._first[child.id] = len(tour)
+                tour.append((depth, child.id))
+                stack.append((child, iter(child._children)))
+        # Sparse table over the tour for O(1) range-minimum (LCA) queries.
+        self._table = [tour]
+        step = 1
+        while (step * 2 <= len(tour)):
+            prev = self._table[-1]
+            self._table.append([min(prev[i], prev[i + step]) for i in range(len(prev) - step)])
+            step *= 2
+
+    def add_leaf(self, id: int, pid: int) -> None:
+        self._pending[id] = pid
+
+    def relink(self, node: 'Component', pid: int) -> None:
+        # A pasted or moved subtree: every node in it goes to the pending
+        # parent links, which win over its (now stale) tour stamps. Nodes
+        # below a pending node are always pending themselves, so the tour
+        # stays right for everything else. Costs O(subtree), not a rebuild.
+        self._pending[node.id] = pid
+        stack = [node]
+        while (stack):
+            parent = stack.pop()
+            for child in parent._children:
+                self._pending[child.id] = parent.id
+                stack.append(child)
+
+    def __contains__(self, id: int) -> bool:
+        return id in self._first or id in self._pending
+
+    def _chain(self, id: int) -> Tuple[List[int], int]:
+        chain = []
+        while (id in self._pending):
+            chain.append(id)
+            id = self._pending[id]
+        return chain, id
+
+    def is_ancestor(self, ancestor: int, id: int) -> bool:
+        chain, id = self._chain(id)
+        if (ancestor in chain):
+            return True
+        if (ancestor in self._pending):
+            return False
+        return (self._enter[ancestor] <= self._enter[id] and self._leave[id] <= self._leave[ancestor])
+
+    def depth(self, id: int) -> int:
+        chain, id = self._chain(id)
+        return self._depth[id] + len(chain)
+
+    def lowest_common_ancestor(self, id_a: int, id_b: int) -> int:
+        chain_a, id_a = self._chain(id_a)
+        chain_b, id_b = self._chain(id_b)
+        pending_b = set(chain_b)
+        for id in chain_a:
+            if (id in pending_b):
+                return id
+        left, right = self._first[id_a], self._first[id_b]
+        if (left > right):
+            left, right = right, left
+        level = (right - left + 1).bit_length() - 1
+        row = self._table[level]
+        return min(row[left], row[right - (1 << level) + 1])[1]
+
+
+class IdAllocator:
+
+    def __init__(self, reuse: bool=False):
+        self._reuse = reuse
+        self._next_id = 0
+        self._free_ids = []
+        self._is_free = set()
+
+    @property
+    def last_id(self) -> int:
+        return self._next_id - 1
+
+    def allocate(self) -> int:
+        while (self._reuse and self._free_ids):
+            id = self._free_ids.pop()
+            if (id in self._is_free):
+                self._is_free.discard(id)
+                return id
+        id = self._next_id
+        self._next_id += 1
+        return id
+
+    def reserve(self, count: int) -> int:
+        # Blocks always come from the high-water mark, so they are contiguous.
+        first_id = self._next_id
+        self._next_id += count
+        return first_id
+
+    def claim(self, id: int) -> None:
+        if (id >= self._next_id):
+            self._next_id = id + 1
+        else:
+            self._is_free.discard(id)
+
+    def release(self, id: int) -> None:
+        if (self._reuse and id < self._next_id and id not in self._is_free):
+            self._free_ids.append(id)
+            self._is_free.add(id)
+
+    def reset(self) -> None:
+        self._next_id = 0
+        self._free_ids.clear()
+        self._is_free.clear()
+
+
+class AttributeStore:
+    # Typed columns keyed by node id. Values live in arrays (a list for str),
+    # so filters and aggregations run over whole columns in C loops instead
+    # of touching per-node dicts. Snapshot views read rows from other
+    # threads, so the column dict is never changed in place: adding a column
+    # or clearing swaps in a new dict.
+
+    KINDS = {"int": 'q', "float": 'd', "bool": 'b', "str": None}
+    DEFAULTS = {"int": 0, "float": 0.0, "bool": False, "str": ""}
+    OPERATORS = {
+        "<": operator.lt, "<=": operator.le, "==": operator.eq, "!=": operator.ne,
+        ">": operator.gt, ">=": operator.ge, "startswith": str.startswith,
+    }
+
+    def __init__(self, on_change: Callable=None):
+        self._on_change = on_change
+        self._rows = {}
+        self._ids = array('q')
+        self._free = []
+        self._columns = {}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, id: int) -> bool:
+        return id in self._rows
+
+    @property
+    def schema(self) -> Dict[str, str]:
+        return {name: column[0] for name, column in self._columns.items()}
+
+    @staticmethod
+    def kind_of(value) -> str:
+        if (isinstance(value, bool)):
+            return "bool"
+        if (isinstance(value, int)):
+            return "int"
+        if (isinstance(value, float)):
+            return "float"
+        if (isinstance(value, str)):
+            return "str"
+        raise TypeError("Unsupported attribute value {!r}.".format(value))
+
+    def define(self, name: str, kind: str) -> None:
+        if (kind not in self.KINDS):
+            raise ValueError("Unknown attribute type {}.".format(kind))
+        column = self._columns.get(name)
+        if (column):
+            if (column[0] != kind):
+                raise TypeError("Attribute {} is {}, not {}.".format(name, column[0], kind))
+            return
+        code = self.KINDS[kind]
+        size = len(self._ids)
+        values = array(code, bytes(array(code).itemsize * size)) if (code) else [""] * size
+        columns = dict(self._columns)
+        columns[name] = [kind, values, bytearray(size)]
+        self._columns = columns
+
+    def _coerce(self, name: str, value):
+        kind = self.kind_of(value)
+        column = self._columns.get(name)
+        if (column is None):
+            self.define(name, kind)
+        elif (kind != column[0]):
+            if (column[0] == "float" and kind == "int"):
+                return float(value)
+            raise TypeError("Attribute {} is {}, not {}.".format(name, column[0], kind))
+        return value
+
+    def _row(self, id: int) -> int:
+        row = self._rows.get(id)
+        if (row is None):
+            if (self._free):
+                row = self._free.pop()
+                self._ids[row] = id
+            else:
+                row = len(self._ids)
+                self._ids.append(id)
+                for kind, values, present in self._columns.values():
+                    values.append(self.DEFAULTS[kind])
+                    present.append(0)
+            self._rows[id] = row
+        return row
+
+    def _set(self, id: int, name: str, value) -> None:
+        value = self._coerce(name, value)
+        column = self._columns[name]
+        row = self._row(id)
+        column[1][row] = value
+        column[2][row] = 1
+
+    def _changed(self, id: int) -> None:
+        if (self._on_change):
+            self._on_change(id)
+
+    def set(self, id: int, name: str, value) -> None:
+        self._set(id, name, value)
+        self._changed(id)
+
+    def get(self, id: int, name: str, default=None):
+        row = self._rows.get(id)
+        column = self._columns.get(name)
+        if (row is None or column is None or not column[2][row]):
+            return default
+        value = column[1][row]
+        return bool(value) if (column[0] == "bool") else value
+
+    def unset(self, id: int, name: str) -> None:
+        row = self._rows.get(id)
+        column = self._columns.get(name)
+        if (row is None or column is None or not column[2][row]):
+            return
+        column[1][row] = self.DEFAULTS[column[0]]
+        column[2][row] = 0
+        if (not any(present[row] for _, _, present in self._columns.values())):
+            self.drop(id)
+        self._changed(id)
+
+    def row(self, id: int) -> Dict[str, object]:
+        columns = self._columns
+        row = self._rows.get(id)
+        if (row is None):
+            return {}
+        return {name: bool(values[row]) if (kind == "bool") else values[row]
+                for name, (kind, values, present) in columns.items() if present[row]}
+
+    def drop(self, id: int) -> None:
+        row = self._rows.pop(id, None)
+        if (row is None):
+            return
+        for kind, values, present in self._columns.values():
+            values[row] = self.DEFAULTS[kind]
+            present[row] = 0
+        self._ids[row] = -1
+        self._free.append(row)
+
+    def clear(self) -> None:
+        self._rows = {}
+        self._ids = array('q')
+        self._free.clear()
+        self._columns = {}
+
+    def load(self, rows: Dict[int, Dict]) -> None:
+        # Bulk set; a name holding both ints and floats becomes a float column.
+        kinds = {}
+        for row in rows.values():
+            for name, value in row.items():
+                kinds.setdefault(name, set()).add(self.kind_of(value))
+        for name, found in kinds.items():
+            if (found == {"int", "float"}):
+                found = {"float"}
+            if (len(found) > 1):
+                raise TypeError("Attribute {} mixes types {}.".format(name, sorted(found)))
+            self.define(name, found.pop())
+        for id, row in rows.items():
+            for name, value in row.items():
+                self._set(id, name, value)
+            self._changed(id)
+
+    def _selection(self, name: str, ids: List[int]) -> Tuple:
+        if (name not in self._columns):
+            raise KeyError("Unknown attribute {}.".format(name))
+        kind, values, present = self._columns[name]
+        if (ids is None):
+            return values, present, self._ids
+        rows = [self._rows[id] for id in ids if id in self._rows]
+        return (list(map(values.__getitem__, rows)), bytes(map(present.__getitem__, rows)),
+                list(map(self._ids.__getitem__, rows)))
+
+    def filter(self, name: str, op: str, value, ids: List[int]=None) -> List[int]:
+        values, present, row_ids = self._selection(name, ids)
+        test = self.OPERATORS[op]
+        return list(compress(row_ids, map(operator.and_, present, map(test, values, repeat(value)))))
+
+    def aggregate(self, name: str, func: str="sum", ids: List[int]=None):
+        values, present, _ = self._selection(name, ids)
+        selected = list(compress(values, present))
+        if (func == "count"):
+            return len(selected)
+        if (func == "sum"):
+            return sum(selected)
+        if (func not in ("min", "max", "mean")):
+            raise ValueError("Unknown aggregate {}.".format(func))
+        if (not selected):
+            return None
+        if (func == "mean"):
+            return sum(selected) / len(selected)
+        return min(selected) if (func == "min") else max(selected)
+
+
+class Clipboard:
+
+    def __init__(self, node: 'Component', attributes: AttributeStore=None):
+        self._node = node
+        self._attributes = attributes
+        self._rows = None
+        self._is_copied = False
+
+    @property
+    def node(self) -> 'Component':
+        return self._node
+
+    @property
+    def is_copied(self) -> bool:
+        return self._is_copied
+
+    @property
+    def attributes(self) -> Dict[int, Dict]:
+        # Attribute rows of the copied subtree by node id, as of the copy.
+        if (self._is_copied):
+            return self._rows
+        return self.subtree_rows(self._node, self._attributes)
+
+    @staticmethod
+    def subtree_rows(node: 'Component', attributes: AttributeStore) -> Dict[int, Dict]:
+        rows = {}
+        stack = [node] if (attributes is not None) else []
+        while (stack):
+            node = stack.pop()
+            if (node._attrs):
+                rows[node.id] = attributes.row(node.id)
+            stack.extend(child for child in node._children if not child.is_delete)
+        return rows
+
+    def copy_on_write(self) -> None:
+        if (not self._is_copied):
+            self._rows = self.attributes
+            self._node = self._node.clone()
+            self._is_copied = True
+
+
+NodeVersion = namedtuple("NodeVersion", "id desc pid children is_delete attrs")
+
+
+class SnapshotView:
+    # A read-only view of a model as of one version. Writers push a node's
+    # pre-image before changing it while views are alive, so taking a view is
+    # O(1) and reading it needs no locks. Release it so the model can drop
+    # the pre-images no view needs any more.
+
+    def __init__(self, mind_map: 'MindMapModel'):
+        self._version = mind_map.version
+        self._root = mind_map.root
+        self._components = mind_map._components
+        self._component_history = mind_map._component_history
+        self._attributes = mind_map.attributes
+        self._released = False
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def released(self) -> bool:
+        return self._released
+
+    def release(self) -> None:
+        # Only flags the view; the model reclaims on its own thread.
+        self._released = True
+
+    def __enter__(self) -> 'SnapshotView':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+    def __del__(self):
+        self._released = True
+
+    def _pick(self, history):
+        # The earliest pre-image taken at or after this version is the state
+        # this version saw.
+        if (history):
+            for entry in history:
+                if (entry[0] >= self._version):
+                    return entry
+        return None
+
+    def _state(self, node: Component) -> tuple:
+        entry = self._pick(node._history)
+        if (entry is None):
+            attrs = self._attributes.row(node._id) if (node._attrs) else None
+            live = (None, node._desc, tuple(node._children), node._parent, node._is_delete, attrs)
+            # Writers push before mutating: a pre-image that appeared while
+            # reading means the live fields may be half-updated.
+            entry = self._pick(node._history) or live
+        return entry
+
+    def _lookup(self, id: int) -> Component:
+        entry = self._pick(self._component_history.get(id))
+        if (entry is None):
+            node = self._components.get(id)
+            entry = self._pick(self._component_history.get(id)) or (None, node)
+        return entry[1]
+
+    def _version_of(self, node: Component) -> NodeVersion:
+        _, desc, children, parent, is_delete, attrs = self._state(node)
+        return NodeVersion(node.id, desc, parent.id if (parent) else -1, tuple(child.id for child in children), is_delete, attrs or {})
+
+    @property
+    def root(self) -> NodeVersion:
+        return self._version_of(self._root) if (self._root) else None
+
+    def get_node(self, id: int) -> NodeVersion:
+        node = self._lookup(id)
+        if (node is None):
+            return None
+        version = self._version_of(node)
+        return None if (version.is_delete) else version
+
+    def get_childern(self, id: int) -> List[NodeVersion]:
+        node = self.get_node(id)
+        if (not node):
+            return []
+        return [child for child in map(self.get_node, node.children) if child]
+
+    def get_snapshot(self) -> List:
+        # Same records and breadth-first order as MindMapModel.get_snapshot.
+        if (not self._root or self._state(self._root)[4]):
+            return []
+        data = []
+        queue = deque([self._root])
+        while (queue):
+            node = queue.popleft()
+            _, desc, children, parent, _, attrs = self._state(node)
+            record = {"id": node.id, "desc": desc, "pid": parent.id if (parent) else -1}
+            if (attrs):
+                record["attrs"] = attrs
+            data.append(record)
+            queue.extend(child for child in children if not self._state(child)[4])
+        return data
+
+
 class MindMapModel(Subject):
 
-    def __init__(self):
+    def __init__(self, reuse_ids: bool=False):
+        super().__init__()
         self._root = None
         self._components = {}
-        self._serial_ids = -1
+        self._ids = IdAllocator(reuse_ids)
+        self._ancestry = None
+        self._clipboards = weakref.WeakSet()
+        self._changes = None
+        self._last_error = None
+        self._attributes = AttributeStore(self._attributes_changed)
+        self._version = 0
+        self._views = []
+        self._versioned = []
+        self._component_history = {}
+        self._snapshot_compression = None
+
+    @property
+    def version(self) -> int:
+        # Bumped by every logged mutation; lets derived indexes spot staleness.
+        return self._version
 
     @property
     def serial_id(self) -> int:
-        return self._serial_ids
+        return self._ids.last_id
 
-    @serial_id.setter
-    def serial_id(self, id: int) -> None: 
-        self._serial_ids = id
+    def reserve_ids(self, count: int) -> int:
+        return self._ids.reserve(count)
 
-    def increase_id(self) -> None:
-        self._serial_ids += 1
-        log = "[{}][increase_id] current serial_ids = {}".format(self.__class__, self._serial_ids)
-        print(log)
-    
-    def decrease_id(self) -> None:
-        self._serial_ids -= 1
-        log = "[{}][decrease_id] current serial_ids = {}".format(self.__class__, self._serial_ids)
-        print(log)
+    def release_id(self, id: int) -> None:
+        self._ids.release(id)
 
     def get_node(self, id: int) -> Component:
         if (not id in self._components):
@@ -265,6 +1107,17 @@ class MindMapModel(Subject):
     def root(self) -> Root:
         return self._root
 
+    @property
+    def last_error(self) -> Exception:
+        return self._last_error
+
+    @property
+    def size(self) -> int:
+        if (self.is_empty()):
+            return 0
+        else:
+            return self._root.subtree_size
+
     def is_empty(self) -> bool:
         if (self._root == None or self._root.is_delete):
             return True
@@ -280,8 +1133,7 @@ class MindMapModel(Subject):
             return self.insert_node(self.create_node(desc))
 
     def create_node(self, desc:str) -> Component:
-        self.increase_id()
-        return self._create_node(self._serial_ids, desc)
+        return self._create_node(self._ids.allocate(), desc)
 
     def _create_node(self, id:int, desc:str) -> Component:
         type = COMPONENT_TYPE_ROOT if (id == 0) else COMPONENT_TYPE_NODE
@@ -294,6 +1146,7 @@ class MindMapModel(Subject):
                 return False
             else:
                 self._root = node
+                self._ancestry = None
         else:
             if (not node): 
                 raise Exception("Node must by not None.")
@@ -303,17 +1156,295 @@ class MindMapModel(Subject):
                 raise Exception("Parent not exists.")
                 return False
             if (not self.get_node(node.id)):
+                self._before_mutate(parent)
                 parent.add_child(node)
                 node.set_parent(parent)
+                node._propagate(node.subtree_size, node.deleted_count, 0, node.subtree_height)
+                self._patch_ancestry(node, pid)
             else:
                 raise Exception("Node({}) exists.".format(node.id))
                 return False
+        self._preserve_component(node.id)
         self._components[node.id] = node
+        self._log("insert", node.id, pid if (pid is not None) else -1, node.desc)
+        return True
+
+    def _patch_ancestry(self, node: Component, pid: int) -> None:
+        # Inserts, pastes and moves go to the index's pending links; once
+        # they outnumber a quarter of the tour, the next query rebuilds it.
+        if (not self._ancestry):
+            return
+        if (node._children):
+            self._ancestry.relink(node, pid)
+        else:
+            self._ancestry.add_leaf(node.id, pid)
+        if (self._ancestry.pending > self._ancestry.built // 4 + 64):
+            self._ancestry = None
+
+    def _get_ancestry(self) -> AncestryIndex:
+        if (not self._ancestry and self._root):
+            self._ancestry = AncestryIndex(self._root)
+        return self._ancestry
+
+    def is_ancestor(self, ancestor_id: int, id: int) -> bool:
+        if (ancestor_id not in self._components or id not in self._components):
+            return False
+        return self._get_ancestry().is_ancestor(ancestor_id, id)
+
+    def lowest_common_ancestor(self, id_a: int, id_b: int) -> int:
+        if (id_a not in self._components or id_b not in self._components):
+            return None
+        return self._get_ancestry().lowest_common_ancestor(id_a, id_b)
+
+    def get_depth(self, id: int) -> int:
+        if (id not in self._components):
+            return -1
+        return self._get_ancestry().depth(id)
+
+    def move_node(self, node: Component, pid: int, index: int=None) -> int:
+        if (not node or isinstance(node, Root)):
+            raise ValueError("Root cannot be moved.")
+        parent = self.get_node(pid)
+        if (not parent):
+            raise ValueError("Parent({}) not exists.".format(pid))
+        if (self._is_ancestor_of(node, parent)):
+            raise ValueError("Node({}) cannot be moved under its own descendant.".format(node.id))
+        self._before_mutate(node.get_parent())
+        self._before_mutate(parent)
+        self._preserve(node)
+        old_index = node._unlink()
+        node._link(parent, index)
+        self._patch_ancestry(node, pid)
+        self._log("move", node.id, pid, index)
+        return old_index
+
+    def _is_ancestor_of(self, ancestor: Component, node: Component) -> bool:
+        if (self._ancestry and ancestor.id in self._ancestry and node.id in self._ancestry):
+            return self._ancestry.is_ancestor(ancestor.id, node.id)
+        while (node):
+            if (node is ancestor):
+                return True
+            node = node.get_parent()
+        return False
+
+    def insert_subtree(self, source: Component, pid: int, attrs: Dict[int, Dict]=None) -> Component:
+        # `attrs` are the source's attribute rows by source id (see
+        # Clipboard.attributes); a live node of this map brings its own.
+        parent = self.get_node(pid)
+        if (not parent):
+            raise Exception("Parent not exists.")
+        if (not source or source.is_delete):
+            raise Exception("Node must by not None.")
+        if (attrs is None and self._components.get(source.id) is source):
+            attrs = Clipboard.subtree_rows(source, self._attributes)
+        self._before_mutate(parent)
+        next_id = self.reserve_ids(source.subtree_size)
+        top = None
+        nodes = []
+        rows = {}
+        stack = [(source, None)]
+        while (stack):
+            origin, copy_parent = stack.pop()
+            node = SimpleNodeFactory.create_node(COMPONENT_TYPE_NODE, next_id, origin.desc)
+            next_id += 1
+            if (copy_parent):
+                copy_parent._children.append(node)
+                node._parent = copy_parent
+            else:
+                top = node
+            nodes.append(node)
+            if (attrs and attrs.get(origin.id)):
+                rows[node.id] = attrs[origin.id]
+            for child in reversed(origin.get_childern()):
+                if (not child.is_delete):
+                    stack.append((child, node))
+        # Before any node is registered, so a type clash leaves the map as it was.
+        self._attributes.load(rows)
+        for node in reversed(nodes):
+            node._recount()
+            self._preserve_component(node.id)
+            self._components[node.id] = node
+            if (node.id in rows):
+                self._attributes_changed(node.id)
+        top._link(parent)
+        self._patch_ancestry(top, pid)
+        # One version step for the whole paste, whether or not changes are logged.
+        self._version += 1
+        if (self._changes is not None):
+            self._changes.extend(["insert", node.id, node.get_parent().id, node.desc] for node in nodes)
+            self._changes.extend(["attr", id, name, value] for id, row in rows.items() for name, value in row.items())
+        return top
+
+    def copy_node(self, id: int) -> Clipboard:
+        node = self.get_node(id)
+        if (not node):
+            return None
+        clipboard = Clipboard(node, self._attributes)
+        self._clipboards.add(clipboard)
+        return clipboard
+
+    def snapshot_view(self) -> SnapshotView:
+        self._live_views()
+        view = SnapshotView(self)
+        self._views.append(weakref.ref(view))
+        return view
+
+    def _live_views(self) -> List[SnapshotView]:
+        views = [ref() for ref in self._views]
+        live = [view for view in views if view is not None and not view.released]
+        if (len(live) < len(self._views)):
+            self._views = [weakref.ref(view) for view in live]
+            self._reclaim(live)
+        return live
+
+    def _reclaim(self, views: List[SnapshotView]) -> None:
+        # Pre-images older than the oldest live view can never be read again.
+        # Lists are replaced, not edited, since readers may be iterating them.
+        oldest = min((view.version for view in views), default=None)
+        keep = lambda history: [entry for entry in history if oldest is not None and entry[0] >= oldest]
+        versioned = []
+        for node in self._versioned:
+            node._history = keep(node._history) or None
+            if (node._history):
+                versioned.append(node)
+        self._versioned = versioned
+        for id, history in list(self._component_history.items()):
+            history = keep(history)
+            if (history):
+                self._component_history[id] = history
+            else:
+                del self._component_history[id]
+
+    def _preserve(self, node: Component, with_child: bool=False) -> None:
+        # MVCC pre-images, taken at most once per node for the newest view.
+        if (not self._views or not node):
+            return
+        views = self._live_views()
+        if (not views):
+            return
+        newest = max(view.version for view in views)
+        stack = [node]
+        while (stack):
+            node = stack.pop()
+            history = node._history
+            if (not history or history[-1][0] < newest):
+                attrs = self._attributes.row(node._id) if (node._attrs) else None
+                entry = (self._version, node._desc, tuple(node._children), node._parent, node._is_delete, attrs)
+                if (history):
+                    history.append(entry)
+                else:
+                    node._history = [entry]
+                    self._versioned.append(node)
+            if (with_child):
+                stack.extend(node._children)
+
+    def _preserve_component(self, id: int) -> None:
+        if (not self._views):
+            return
+        views = self._live_views()
+        if (not views):
+            return
+        history = self._component_history.get(id)
+        if (not history or history[-1][0] < max(view.version for view in views)):
+            entry = (self._version, self._components.get(id))
+            if (history):
+                history.append(entry)
+            else:
+                self._component_history[id] = [entry]
+
+    def _before_mutate(self, node: Component, with_child: bool=False) -> None:
+        self._preserve(node, with_child)
+        # Copy any clipboard whose source subtree is about to change.
+        for clipboard in list(self._clipboards):
+            source = clipboard.node
+            if (self._is_ancestor_of(source, node) or (with_child and self._is_ancestor_of(node, source))):
+                clipboard.copy_on_write()
+                self._clipboards.discard(clipboard)
+
+    @property
+    def attributes(self) -> AttributeStore:
+        return self._attributes
+
+    def _attributes_changed(self, id: int) -> None:
+        node = self._components.get(id)
+        if (node):
+            row = self._attributes.row(id)
+            node._attrs = repr(sorted(row.items())) if (row) else ""
+            node._invalidate_hash()
+
+    def set_attribute(self, node: Component, name: str, value) -> None:
+        # None removes the attribute.
+        self._before_mutate(node)
+        if (value is None):
+            self._attributes.unset(node.id, name)
+        else:
+            self._attributes.set(node.id, name, value)
+        self._log("attr", node.id, name, value)
+
+    def _scope(self, under: int=None) -> List[int]:
+        # None means every row, which is only right when nothing is hidden.
+        if (under is None and (self.is_empty() or self._root.deleted_count == 0)):
+            return None
+        top = self.get_node(under if (under is not None) else 0)
+        ids = []
+        stack = [top] if (top) else []
+        while (stack):
+            node = stack.pop()
+            ids.append(node.id)
+            stack.extend(child for child in node.get_childern() if not child.is_delete)
+        return ids
+
+    def filter_nodes(self, name: str, op: str, value, under: int=None) -> List[int]:
+        return self._attributes.filter(name, op, value, self._scope(under))
+
+    def aggregate(self, name: str, func: str="sum", under: int=None):
+        return self._attributes.aggregate(name, func, self._scope(under))
+
+    def edit_node(self, node: Component, desc: str) -> None:
+        self._before_mutate(node)
+        node.desc = desc
+        self._log("edit", node.id, desc)
+
+    def restore_node(self, node: Component, with_child: bool=False) -> bool:
+        if (node and node.is_delete):
+            self._before_mutate(node, with_child)
+            node.delete(False, with_child)
+            self._log("delete", node.id, False, with_child)
+            return True
+        return False
+
+    def purge_node(self, node: Component) -> bool:
+        if (not node or self._components.get(node.id) is not node):
+            return False
+        nodes = []
+        stack = [node]
+        while (stack):
+            current = stack.pop()
+            if (not current.is_delete):
+                return False
+            nodes.append(current)
+            stack.extend(current.get_childern())
+        parent = node.get_parent()
+        if (parent):
+            self._before_mutate(parent)
+            node._unlink()
+        for current in nodes:
+            if (self._components.get(current.id) is current):
+                self._preserve(current)
+                self._preserve_component(current.id)
+                del self._components[current.id]
+                self._attributes.drop(current.id)
+                self._ids.release(current.id)
+        # The index keeps the purged ids: nothing live reaches them, and a
+        # reused id is re-added as pending when it is inserted again.
+        self._log("purge", node.id)
         return True
 
     def remove_node(self, node: Component, with_child: bool=False) -> bool:
         if (node and not node.is_delete):
+            self._before_mutate(node, with_child)
             node.delete(True, with_child)
+            self._log("delete", node.id, True, with_child)
             return True
         return False
 
@@ -337,69 +1468,409 @@ class MindMapModel(Subject):
         traversal(self._root, 0, result)
         return result
 
-    def save(self, path: str, file_type) -> bool:
+    @property
+    def content_hash(self) -> bytes:
+        return self._root.subtree_hash if (not self.is_empty()) else None
+
+    def _visible_node(self, id: int) -> Component:
+        node = self.get_node(id)
+        parent = node.get_parent() if (node) else None
+        while (parent):
+            if (parent.is_delete):
+                return None
+            parent = parent.get_parent()
+        return node
+
+    def diff(self, other: 'MindMapModel') -> Dict[str, List[int]]:
+        # Changes from this map to other, matched by id. Subtrees with equal
+        # hashes are identical and skipped, so cost follows the change size.
+        result = {"added": [], "removed": [], "edited": [], "moved": []}
+        if (self.is_empty() or other.is_empty()):
+            result["added"] = [pair[0] for layer in other.map for pair in layer]
+            result["removed"] = [pair[0] for layer in self.map for pair in layer]
+            return result
+        if (self._root.desc != other.root.desc):
+            result["edited"].append(self._root.id)
+        stack = [(self._root, other.root)]
+        while (stack):
+            old, new = stack.pop()
+            if (old and new and old.subtree_hash == new.subtree_hash):
+                continue
+            if (new):
+                for child in new.get_childern():
+                    if (child.is_delete):
+                        continue
+                    match = self._visible_node(child.id)
+                    if (not match):
+                        result["added"].append(child.id)
+                    else:
+                        if (match.get_parent().id != new.id):
+                            result["moved"].append(child.id)
+                        if (match.desc != child.desc):
+                            result["edited"].append(child.id)
+                    stack.append((match, child))
+            if (old):
+                for child in old.get_childern():
+                    # Nodes still present are handled from the new side.
+                    if (not child.is_delete and not other._visible_node(child.id)):
+                        result["removed"].append(child.id)
+                        stack.append((child, None))
+        return result
+
+    def query(self) -> 'Query':
+        try:
+            from .query import Query
+        except ImportError:
+            from query import Query
+        return Query(self)
+
+    def save(self, path: str, file_type, compression: str=None, level: int=None) -> bool:
+        return MindMapModel.write_snapshot(path, self.get_snapshot(), file_type, compression, level)
+
+    @staticmethod
+    def write_snapshot(path: str, snapshot: List, file_type: str, compression: str=None, level: int=None) -> bool:
+        # Only touches the snapshot, so it is safe to run off the GUI thread.
+        temp_path = path + ".tmp"
         try:
-            if (os.path.exists(path)):
-                os.remove(path)
-            data = None
             if file_type == "xml":
-                data = self._convert_to_xml_format()
+                import xml.etree.ElementTree as XMLET
+                data = MindMapModel._snapshot_to_xml(snapshot)
                 tree = XMLET.ElementTree(data)
-                tree.write(path)
-                print("Save as XML format", path, tostring(data))
+                with open_document(temp_path, 'wb', compression, level) as file:
+                    tree.write(file)
+                print("Save as XML format", path)
             else:
-                data = self._convert_to_json_format()
-                with open(path, 'w') as file:
-                    json.dump(data, file)
-                print("Save as JSON format", path, data)
+                import json
+                with open_document(temp_path, 'w', compression, level) as file:
+                    # One record per line, so readers can split the file on newlines.
+                    file.write("[\n" + ",\n".join(json.dumps(obj) for obj in snapshot) + "\n]\n")
+                print("Save as JSON format", path)
+            os.replace(temp_path, path)
             return True
         except Exception as e:
             print(e)
             print("Save failed")
+            if (os.path.exists(temp_path)):
+                os.remove(temp_path)
             return False
 
     def reset(self) -> None:
         self._root = None
-        self._serial_ids = -1
-        self._components.clear()
+        self._ids.reset()
+        self._ancestry = None
+        self._clipboards.clear()
+        # Views may still hold the old dicts.
+        self._components = {}
+        self._component_history = {}
+        self._attributes = AttributeStore(self._attributes_changed)
+        self._log("reset")
+
+    def begin_changes(self) -> None:
+        self._changes = []
+
+    def end_changes(self) -> List:
+        changes, self._changes = self._changes, None
+        return changes
+
+    def _log(self, *change) -> None:
+        # Every single-node mutation ends here; bulk ones (insert_subtree,
+        # _build_from_columns) bump the version themselves.
+        self._version += 1
+        if (self._changes is not None):
+            self._changes.append(list(change))
+
+    def apply_change(self, change: List) -> None:
+        op = change[0]
+        if (op == "insert"):
+            node = self._create_node(change[1], change[3])
+            self.insert_node(node, change[2])
+            self._ids.claim(node.id)
+        elif (op == "delete"):
+            if (change[2]):
+                self.remove_node(self._components[change[1]], change[3])
+            else:
+                self.restore_node(self._components[change[1]], change[3])
+        elif (op == "edit"):
+            self.edit_node(self._components[change[1]], change[2])
+        elif (op == "move"):
+            self.move_node(self._components[change[1]], change[2], change[3])
+        elif (op == "purge"):
+            self.purge_node(self._components[change[1]])
+        elif (op == "attr"):
+            self.set_attribute(self._components[change[1]], change[2], change[3])
+        elif (op == "reset"):
+            self.reset()
+        else:
+            raise ValueError("Unknown change {}.".format(op))
+
+    def get_checkpoint(self) -> Dict:
+        # Unlike get_snapshot, keeps deleted nodes so undo history stays valid.
+        nodes = []
+        if (self._root):
+            stack = [self._root]
+            while (stack):
+                node = stack.pop()
+                parent = node.get_parent()
+                nodes.append([node.id, parent.id if (parent) else -1, node.desc, node.is_delete])
+                stack.extend(reversed(node.get_childern()))
+        attrs = {str(id): self._attributes.row(id) for id in self._attributes._rows}
+        return {"next_id": self._ids.last_id + 1, "nodes": nodes, "attrs": attrs}
+
+    def restore_from_checkpoint(self, checkpoint: Dict) -> None:
+        self.reset()
+        deleted = []
+        for id, pid, desc, is_delete in checkpoint["nodes"]:
+            node = self._create_node(id, desc)
+            self.insert_node(node, pid)
+            if (is_delete):
+                deleted.append(node)
+        for node in deleted:
+            node.delete(True)
+        self._attributes.load({int(id): row for id, row in checkpoint.get("attrs", {}).items()})
+        self._ids.claim(checkpoint["next_id"] - 1)
 
     def load(self, path: str, file_type: str) -> bool:
+        self._last_error = None
         if (os.path.exists(path)):
             try:
                 if file_type == "xml":
-                    raise Exception("Not implemented.")
+                    import xml.etree.ElementTree as XMLET
+                    with open_document(path, 'rb') as file:
+                        data = self._parse_xml(XMLET.parse(file).getroot())
                 else:
-                    with open(path, 'r') as file:
-                        data = json.load(file)
-                    print("Load", path, data)
-                    self.reset()
-                    self._build_from_json(data)
+                    with open_document(path) as file:
+                        data = self._parse_json(file.read())
+                print("Load", path)
+                # Built off to the side, so a bad file never touches this model.
+                mind_map = MindMapModel()
+                mind_map._build_from_records(data)
+                self._adopt(mind_map)
                 return True
             except Exception as e:
                 print("Load failed")
                 print(e)
+                self._last_error = e
                 return False
         else:
             return False
 
-    def get_snapshot(self) -> List:
-        return self._convert_to_json_format()
+    def load_columns(self, ids: List[int], pids: List[int], descs: List[str], errors: List[str]=(), attrs: Dict[int, Dict]=None) -> bool:
+        # For columns parsed elsewhere (see parallel_load); all or nothing, like load.
+        self._last_error = None
+        try:
+            errors = list(errors) + validate_columns(ids, pids)
+            if (errors):
+                raise MindMapValidationError(errors)
+            mind_map = MindMapModel()
+            mind_map._build_from_columns(ids, pids, descs, attrs=attrs)
+            self._adopt(mind_map)
+            return True
+        except Exception as e:
+            print("Load failed")
+            print(e)
+            self._last_error = e
+            return False
+
+    async def aload(self, path: str, file_type: str, progress: Callable=None, executor=None) -> bool:
+        # Parses and builds a separate model in the executor and only adopts
+        # it on success, so failure or cancellation leaves this model intact.
+        import asyncio
+        import threading
+        if (not os.path.exists(path)):
+            return False
+        loop = asyncio.get_running_loop()
+        cancelled = threading.Event()
+        report = self._progress_reporter(loop, progress)
 
-    def restore_from_snapshot(self, snapshot: List) -> None:
+        def build() -> 'MindMapModel':
+            if file_type == "xml":
+                import xml.etree.ElementTree as XMLET
+                with open_document(path, 'rb') as file:
+                    data = MindMapModel._parse_xml(XMLET.parse(file).getroot())
+            else:
+                with open_document(path) as file:
+                    data = MindMapModel._parse_json(file.read())
+            report("parse", len(data), len(data))
+            mind_map = MindMapModel()
+            mind_map._build_from_records(data, report, cancelled)
+            return mind_map
+
+        try:
+            mind_map = await loop.run_in_executor(executor, build)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        except Exception as e:
+            print("Load failed")
+            print(e)
+            return False
+        self._adopt(mind_map)
+        return True
+
+    async def asave(self, path: str, file_type: str, progress: Callable=None, executor=None, compression: str=None, level: int=None) -> bool:
+        import asyncio
+        import threading
+        loop = asyncio.get_running_loop()
+        cancelled = threading.Event()
+        report = self._progress_reporter(loop, progress)
+        # Taking the view is O(1); walking it happens in the executor, so the
+        # event loop is not held up by a big map.
+        view = self.snapshot_view()
+
+        def write() -> bool:
+            with view:
+                snapshot = view.get_snapshot()
+            return MindMapModel._write_in_chunks(path, snapshot, file_type, report, cancelled, compression, level)
+
+        try:
+            return await loop.run_in_executor(executor, write)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        except Exception as e:
+            # Same contract as save: a failed write is a False, not an error.
+            print(e)
+            print("Save failed")
+            return False
+
+    @staticmethod
+    def _progress_reporter(loop, progress: Callable) -> Callable:
+        def report(stage: str, done: int, total: int) -> None:
+            if (progress):
+                loop.call_soon_threadsafe(progress, stage, done, total)
+        return report
+
+    def _build_from_records(self, data: List, report: Callable=None, cancelled: threading.Event=None, chunk: int=10000) -> None:
+        errors = []
+        ids, pids, descs, attrs = record_columns(data, errors)
+        errors.extend(validate_columns(ids, pids))
+        if (errors):
+            raise MindMapValidationError(errors)
+        self._build_from_columns(ids, pids, descs, report, cancelled, chunk, attrs)
+
+    def _build_from_columns(self, ids: List[int], pids: List[int], descs: List[str], report: Callable=None, cancelled: threading.Event=None, chunk: int=10000, attrs: Dict[int, Dict]=None) -> None:
+        # Expects validated columns.
+        if (self._root):
+            raise Exception("Root exists.")
+        if (not ids):
+            return
+        nodes = {}
+        total = len(ids)
+        for start in range(0, total, chunk):
+            if (cancelled and cancelled.is_set()):
+                raise Exception("Load cancelled.")
+            for id, desc in zip(ids[start:start + chunk], descs[start:start + chunk]):
+                nodes[id] = self._create_node(id, desc)
+            if (report):
+                report("build", min(start + chunk, total), total)
+        # Link directly and count every subtree once, bottom-up, instead of
+        # paying O(depth) per insert_node.
+        for id, pid in zip(ids, pids):
+            if (pid != -1):
+                node = nodes[id]
+                parent = nodes[pid]
+                parent._children.append(node)
+                node._parent = parent
+        order = [nodes[0]]
+        for node in order:
+            order.extend(node._children)
+        for node in reversed(order):
+            node._recount()
+        self._root = nodes[0]
+        self._version += 1
+        # New dicts, so views of the old (empty) map are left alone.
+        self._components = {**self._components, **nodes}
+        self._component_history = {}
+        self._ids.claim(max(nodes))
+        if (attrs):
+            self._attributes.load(attrs)
+        if (self._changes is not None):
+            for node in order:
+                parent = node.get_parent()
+                self._log("insert", node.id, parent.id if (parent) else -1, node.desc)
+            for id, row in (attrs or {}).items():
+                for name, value in row.items():
+                    self._log("attr", id, name, value)
+
+    @staticmethod
+    def _write_in_chunks(path: str, snapshot: List, file_type: str, report: Callable, cancelled: threading.Event,
+                         compression: str=None, level: int=None, chunk: int=10000) -> bool:
+        import json
+        from xml.etree.ElementTree import tostring
+        total = len(snapshot)
+        xml = (file_type == "xml")
+        temp_path = path + ".tmp"
+        try:
+            with open_document(temp_path, 'wb' if (xml) else 'w', compression, level) as file:
+                file.write(b"<Data>" if (xml) else "[\n")
+                for start in range(0, total, chunk):
+                    if (cancelled.is_set()):
+                        return False
+                    if (xml):
+                        # Node elements one chunk at a time, as tree.write would lay them out.
+                        file.write(b"".join(tostring(node) for node in MindMapModel._snapshot_to_xml(snapshot[start:start + chunk])))
+                    else:
+                        if (start):
+                            file.write(",\n")
+                        file.write(",\n".join(json.dumps(obj) for obj in snapshot[start:start + chunk]))
+                    report("save", min(start + chunk, total), total)
+                file.write(b"</Data>" if (xml) else "\n]\n")
+            os.replace(temp_path, path)
+            return True
+        finally:
+            if (os.path.exists(temp_path)):
+                os.remove(temp_path)
+
+    def _adopt(self, mind_map: 'MindMapModel') -> None:
+        self._root = mind_map._root
+        self._components = mind_map._components
+        self._ids = mind_map._ids
+        self._component_history = {}
+        self._attributes = mind_map._attributes
+        self._attributes._on_change = self._attributes_changed
+        self._version += 1
+        self._ancestry = None
+        self._clipboards.clear()
+
+    @property
+    def snapshot_compression(self) -> Tuple[str, int]:
+        return self._snapshot_compression
+
+    @snapshot_compression.setter
+    def snapshot_compression(self, compression: Tuple[str, int]) -> None:
+        # (compression, level) for the whole-map snapshots kept for undo, or None.
+        if (compression is not None and compression[0] not in DEFAULT_LEVELS):
+            raise ValueError("Unknown compression {}.".format(compression[0]))
+        self._snapshot_compression = compression
+
+    def get_snapshot(self, compressed: bool=False):
+        snapshot = self._convert_to_json_format()
+        if (compressed and self._snapshot_compression):
+            return compress_snapshot(snapshot, *self._snapshot_compression)
+        return snapshot
+
+    def restore_from_snapshot(self, snapshot) -> None:
+        if (isinstance(snapshot, bytes)):
+            snapshot = decompress_snapshot(snapshot)
         self._build_from_json(snapshot)
 
     def _convert_to_xml_format(self):
-        xml_visitor = XMLSavingVisitor()
+        return self._snapshot_to_xml(self.get_snapshot())
+
+    @staticmethod
+    def _snapshot_to_xml(snapshot: List):
+        from xml.etree.ElementTree import Element, SubElement
         data = Element("Data")
-        for layer in self.map:
-            for pair in layer:
-                node = self._components[pair[0]]
-                info = node.accept(xml_visitor)
-                data.append(info)
-                print("xml", tostring(data))
+        for obj in snapshot:
+            node_tag = SubElement(data, "Node")
+            SubElement(node_tag, "Id").text = str(obj["id"])
+            SubElement(node_tag, "Desc").text = obj["desc"]
+            SubElement(node_tag, "Pid").text = str(obj["pid"])
+            for name, value in obj.get("attrs", {}).items():
+                attr_tag = SubElement(node_tag, "Attr", name=name, type=AttributeStore.kind_of(value))
+                attr_tag.text = str(value)
         return data
 
-
     def _convert_to_json_format(self) -> List:
         json_visitor = JSONSavingVisitor()
         data = []
@@ -407,35 +1878,69 @@ class MindMapModel(Subject):
             for pair in layer:
                 node = self._components[pair[0]]
                 info = node.accept(json_visitor)
+                if (node._attrs):
+                    info["attrs"] = self._attributes.row(node.id)
                 data.append(info)
         return data
 
     def _build_from_xml(self, data) -> None:
-        serial_ids = -1
-        for obj in data:
-            print("parse", obj)
-        #     node = self._create_node(obj["id"], obj["desc"])
-        #     print(node.info)
-        #     if (self.insert_node(node, obj["pid"])):
-        #         if (node.id > serial_ids): serial_ids = node.id
-        #     else:
-        #         raise Exception("Build mind map from JSON failed.")
-        # self._serial_ids = serial_ids
-        # print("Builded mind map from JSON.")
-        # print(self.map)
+        self._build_from_json(self._parse_xml(data))
+
+    @staticmethod
+    def _parse_json(text: str) -> List:
+        # Accepts one record list or several concatenated ones ("[...][...]").
+        import json
+        decoder = json.JSONDecoder()
+        records = []
+        index = 0
+        while (True):
+            while (index < len(text) and text[index].isspace()):
+                index += 1
+            if (index == len(text)):
+                return records
+            data, index = decoder.raw_decode(text, index)
+            records.extend(data)
+
+    @staticmethod
+    def _parse_xml(data) -> List:
+        convert = {"int": int, "float": float, "bool": lambda text: text == "True", "str": str}
+        records = []
+        for node_tag in data.iter("Node"):
+            record = {
+                "id": int(node_tag.findtext("Id")),
+                "desc": node_tag.findtext("Desc") or "",
+                "pid": int(node_tag.findtext("Pid")),
+            }
+            attrs = {tag.get("name"): convert[tag.get("type")](tag.text or "") for tag in node_tag.iter("Attr")}
+            if (attrs):
+                record["attrs"] = attrs
+            records.append(record)
+        return records
 
     def _build_from_json(self, data: List) -> None:
-        serial_ids = -1
-        for obj in data:
-            node = self._create_node(obj["id"], obj["desc"])
-            print(node.info)
-            if (self.insert_node(node, obj["pid"])):
-                if (node.id > serial_ids): serial_ids = node.id
-            else:
-                raise Exception("Build mind map from JSON failed.")
-        self._serial_ids = serial_ids
-        print("Builded mind map from JSON.")
-        print(self.map)
+        self._build_from_records(data)
+
+
+class MindMapBuilder:
+
+    def __init__(self):
+        self._records = []
+
+    def add(self, records: List) -> None:
+        # Chunks may come from any producer in any order; nodes are only
+        # linked by pid once everything has arrived.
+        self._records.extend(records)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def validate(self) -> List[str]:
+        return validate_records(self._records)
+
+    def build(self, report: Callable=None, cancelled=None) -> MindMapModel:
+        mind_map = MindMapModel()
+        mind_map._build_from_records(self._records, report, cancelled)
+        return mind_map
 
 
 class SimpleNodeFactory:
@@ -457,6 +1962,9 @@ class Command(abc.ABC):
     def unexecute(self, mind_map: MindMapModel) -> bool:
         return False
 
+    def discard(self, mind_map: MindMapModel) -> None:
+        pass
+
 class AddComponentCommand(Command):
 
     def __init__(self, pid: int, desc: str):
@@ -471,8 +1979,7 @@ class AddComponentCommand(Command):
                 mind_map.restore_from_snapshot(self._snapshot)
                 return True
             else:
-                self._node.delete(False)
-                mind_map.increase_id()
+                mind_map.restore_node(self._node)
                 return True
         else:
             node = mind_map.create_node(self._desc)
@@ -490,14 +1997,17 @@ class AddComponentCommand(Command):
     def unexecute(self, mind_map: MindMapModel) -> bool:
         if (self._node):
             if (isinstance(self._node, Root)):
-                self._snapshot = mind_map.get_snapshot()
+                self._snapshot = mind_map.get_snapshot(compressed=True)
                 mind_map.reset()
                 return True
             elif (mind_map.remove_node(self._node)):
-                mind_map.decrease_id()           
                 return True
         return False
 
+    def discard(self, mind_map: MindMapModel) -> None:
+        if (self._node and not isinstance(self._node, Root)):
+            mind_map.purge_node(self._node)
+
     def __repr__(self):
         return "[{}] Node {}".format(self.__class__, self._node.id)
 
@@ -518,7 +2028,7 @@ class EditComponentCommand(Command):
         node = mind_map.get_node(self._id)
         if (node):
             temp_desc = node.desc
-            node.desc = self._new_desc
+            mind_map.edit_node(node, self._new_desc)
             self._new_desc = temp_desc
             print("Edited the description of the node ({}) ({} - > {})".format(self._id, self._new_desc, node.desc))
             return True
@@ -541,7 +2051,7 @@ class DeleteComponentCommand(Command):
         node = mind_map.get_node(self._id)
         if (isinstance(node, Root)):
             self._node = node
-            self._snapshot = mind_map.get_snapshot()
+            self._snapshot = mind_map.get_snapshot(compressed=True)
             mind_map.reset()
             return True
         else:
@@ -556,7 +2066,7 @@ class DeleteComponentCommand(Command):
             return True
         else:
             if (self._node):
-                self._node.delete(False, True)
+                mind_map.restore_node(self._node, True)
                 return True
         return False
 
@@ -565,61 +2075,255 @@ class DeleteComponentCommand(Command):
 
 class PasteComponentCommand(Command):
 
-    def __init__(self, pid: int, node: Component):
+    def __init__(self, pid: int, node: Component, attrs: Dict[int, Dict]=None):
         self._pid = pid
         self._clone_node = node
-        self._after_paste_id = -1
-        self._before_paste_id = -1
+        self._attrs = attrs
         self._node = None
 
     def execute(self, mind_map: MindMapModel) -> bool:
-        def insert_node(node: Component, pid: int):
-            new_node = mind_map.create_node(node.desc)
-            if (mind_map.insert_node(new_node, pid)):
-                print("Paste {} node to map".format(new_node.info))
-                for child in node.get_childern():
-                    if (not insert_node(child, new_node.id)):
-                        return None
-                return new_node
-            return None 
         if (self._node):
-            self._node.delete(False)
-            mind_map.serial_id = self._after_paste_id
+            mind_map.restore_node(self._node, True)
             return True
         elif (self._clone_node):
-            self._before_paste_id = mind_map.serial_id
-            self._node = insert_node(self._clone_node, self._pid)
-            self._after_paste_id = mind_map.serial_id
+            try:
+                self._node = mind_map.insert_subtree(self._clone_node, self._pid, self._attrs)
+            except Exception as e:
+                print(e)
+                return False
             self._clone_node = None
+            self._attrs = None
+            print("Paste {} nodes to map".format(self._node.subtree_size))
             return True
         return False
 
     def unexecute(self, mind_map: MindMapModel) -> bool:
         if (self._node):
             if (mind_map.remove_node(self._node, True)):
-                mind_map.serial_id = self._before_paste_id
                 return True
         return False
 
+    def discard(self, mind_map: MindMapModel) -> None:
+        if (self._node):
+            mind_map.purge_node(self._node)
+
     def __repr__(self):
         return "[{}]".format(self.__class__)
 
 
+class MoveComponentCommand(Command):
+
+    def __init__(self, id: int, pid: int):
+        self._id = id
+        self._pid = pid
+        self._old_pid = None
+        self._old_index = None
+
+    def execute(self, mind_map: MindMapModel) -> bool:
+        node = mind_map.get_node(self._id)
+        if (not node or isinstance(node, Root)):
+            print("Not found node ({})".format(self._id))
+            return False
+        old_pid = node.get_parent().id
+        try:
+            self._old_index = mind_map.move_node(node, self._pid)
+        except ValueError as e:
+            print(e)
+            return False
+        self._old_pid = old_pid
+        print("Moved node ({}) from ({}) to ({})".format(self._id, self._old_pid, self._pid))
+        return True
+
+    def unexecute(self, mind_map: MindMapModel) -> bool:
+        node = mind_map.get_node(self._id)
+        if (node and self._old_pid is not None):
+            mind_map.move_node(node, self._old_pid, self._old_index)
+            return True
+        return False
+
+    def __repr__(self):
+        return "[{}] Node {}".format(self.__class__, self._id)
+
+
+class SetAttributeCommand(Command):
+
+    def __init__(self, id: int, name: str, value):
+        self._id = id
+        self._name = name
+        self._value = value
+
+    def execute(self, mind_map: MindMapModel) -> bool:
+        return self._set(mind_map)
+
+    def unexecute(self, mind_map: MindMapModel) -> bool:
+        return self._set(mind_map)
+
+    def _set(self, mind_map: MindMapModel) -> bool:
+        node = mind_map.get_node(self._id)
+        if (node):
+            old_value = mind_map.attributes.get(self._id, self._name)
+            try:
+                mind_map.set_attribute(node, self._name, self._value)
+            except TypeError as e:
+                print(e)
+                return False
+            self._value = old_value
+            print("Set attribute {} of the node ({}) ({} -> {})".format(self._name, self._id, self._value, mind_map.attributes.get(self._id, self._name)))
+            return True
+        else:
+            print("Not found node ({})".format(self._id))
+            return False
+
+    def __repr__(self):
+        return "[{}] Node {}".format(self.__class__, self._id)
+
+
+class CommandMetrics:
+
+    def __init__(self, window: int=1000, trace_memory: bool=False):
+        self._window = window
+        self._trace_memory = trace_memory
+        self._owns_tracing = False
+        self._samples = {}
+        self._counts = {}
+        if (trace_memory):
+            import tracemalloc
+            if (not tracemalloc.is_tracing()):
+                tracemalloc.start()
+                self._owns_tracing = True
+
+    def measure(self, op: str, command: Command, action: Callable, mind_map: MindMapModel) -> bool:
+        size = mind_map.size
+        memory = self._traced_memory()
+        start = time.perf_counter()
+        try:
+            return action(mind_map)
+        finally:
+            seconds = time.perf_counter() - start
+            allocated = self._traced_memory() - memory if (self._trace_memory) else None
+            self._add("{}.{}".format(command.__class__.__name__, op), (seconds, mind_map.size - size, allocated))
+
+    def measure_notify(self, mind_map: MindMapModel) -> None:
+        start = time.perf_counter()
+        mind_map.notify()
+        self._add("notify", (time.perf_counter() - start, 0, None))
+
+    def _traced_memory(self) -> int:
+        if (self._trace_memory):
+            import tracemalloc
+            return tracemalloc.get_traced_memory()[0]
+        return 0
+
+    def _add(self, key: str, sample: Tuple) -> None:
+        samples = self._samples.get(key)
+        if (samples is None):
+            samples = self._samples[key] = deque(maxlen=self._window)
+            self._counts[key] = 0
+        samples.append(sample)
+        self._counts[key] += 1
+
+    def report(self) -> Dict[str, Dict]:
+        report = {}
+        for key, samples in self._samples.items():
+            times = sorted(sample[0] for sample in samples)
+            pick = lambda fraction: times[min(len(times) - 1, int(fraction * len(times)))]
+            histogram = {}
+            for seconds in times:
+                # Power-of-two buckets in microseconds: bucket k holds [2^(k-1), 2^k).
+                bucket = int(seconds * 1000000).bit_length()
+                histogram[bucket] = histogram.get(bucket, 0) + 1
+            allocations = [sample[2] for sample in samples if sample[2] is not None]
+            report[key] = {
+                "count": self._counts[key],
+                "window": len(times),
+                "mean": sum(times) / len(times),
+                "p50": pick(0.50),
+                "p90": pick(0.90),
+                "p99": pick(0.99),
+                "max": times[-1],
+                "histogram_us": {"<{}".format(1 << bucket): count for bucket, count in sorted(histogram.items())},
+                "size_delta": sum(sample[1] for sample in samples),
+                "allocated_bytes": sum(allocations) if (allocations) else None,
+            }
+        return report
+
+    def reset(self) -> None:
+        self._samples.clear()
+        self._counts.clear()
+
+    def close(self) -> None:
+        if (self._owns_tracing):
+            import tracemalloc
+            tracemalloc.stop()
+            self._owns_tracing = False
+
+
 class CommandManager:
 
-    def __init__(self, mind_map: MindMapModel):
+    def __init__(self, mind_map: MindMapModel, journal=None):
         self._mind_map = mind_map
         self._redo_commands = []
         self._undo_commands = []
+        self._journal = journal
+        self._metrics = None
+
+    @property
+    def metrics(self) -> CommandMetrics:
+        return self._metrics
+
+    def enable_metrics(self, window: int=1000, trace_memory: bool=False) -> CommandMetrics:
+        self.disable_metrics()
+        self._metrics = CommandMetrics(window, trace_memory)
+        return self._metrics
+
+    def disable_metrics(self) -> None:
+        if (self._metrics):
+            self._metrics.close()
+            self._metrics = None
+
+    def _run(self, op: str, command: Command, action: Callable) -> bool:
+        if (self._metrics):
+            return self._metrics.measure(op, command, action, self._mind_map)
+        return action(self._mind_map)
+
+    def _notify(self) -> None:
+        if (self._metrics):
+            self._metrics.measure_notify(self._mind_map)
+        else:
+            self._mind_map.notify()
+
+    @property
+    def journal(self):
+        return self._journal
+
+    @journal.setter
+    def journal(self, journal) -> None:
+        self._journal = journal
+
+    def _begin(self) -> None:
+        if (self._journal):
+            self._mind_map.begin_changes()
+
+    def _end(self, op: str, command: Command) -> None:
+        if (self._journal):
+            changes = self._mind_map.end_changes()
+            if (changes):
+                self._journal.record(op, command, changes)
 
     def execute(self, command: Command) -> bool:
         if (command):
-            if (command.execute(self._mind_map)):
-                self._redo_commands.clear()
-                self._undo_commands.append(command)
-                self.info()
-                self._mind_map.notify()
-                return True
+            self._begin()
+            try:
+                if (self._run("execute", command, command.execute)):
+                    for discarded in self._redo_commands:
+                        discarded.discard(self._mind_map)
+                    self._redo_commands.clear()
+                    self._undo_commands.append(command)
+                    self.info()
+                    self._notify()
+                    return True
+            finally:
+                self._end("execute", command)
         else:
             raise ValueError("Command should not be none.")
         return False
@@ -629,11 +2333,15 @@ class CommandManager:
             print("Redo list is empty")
         else:
             command = self._redo_commands.pop()
-            if (command.execute(self._mind_map)):
-                self._undo_commands.append(command)
-                self.info()
-                self._mind_map.notify()
-                return True
+            self._begin()
+            try:
+                if (self._run("redo", command, command.execute)):
+                    self._undo_commands.append(command)
+                    self.info()
+                    self._notify()
+                    return True
+            finally:
+                self._end("redo", command)
         return False
 
     def undo(self) -> bool:
@@ -641,14 +2349,17 @@ class CommandManager:
             print("Undo list is empty.")
         else:
             command = self._undo_commands.pop()
-            if (command.unexecute(self._mind_map)):
-                self._redo_commands.append(command)
-                self.info()
-                self._mind_map.notify()
-                return True
+            self._begin()
+            try:
+                if (self._run("undo", command, command.unexecute)):
+                    self._redo_commands.append(command)
+                    self.info()
+                    self._notify()
+                    return True
+            finally:
+                self._end("undo", command)
         return False
 
     def info(self):
         print("Undo list: {}".format(self._undo_commands))
         print("redo list: {}".format(self._redo_commands))
-
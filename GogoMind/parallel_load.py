@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+try:
+    from .model import MindMapModel, record_columns
+except ImportError:
+    from model import MindMapModel, record_columns
+
+from array import array
+import json
+import multiprocessing
+import os
+
+CHUNK_BYTES = 4 * 1024 * 1024
+
+
+def available_cpus() -> int:
+    # The CPUs this process may run on, which can be fewer than the machine has.
+    if (hasattr(os, "sched_getaffinity")):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def is_line_delimited(path: str) -> bool:
+    # The layout write_snapshot produces: "[", then one record per line.
+    with open(path, 'rb') as file:
+        return file.readline().strip() == b"["
+
+
+def split(path: str, count: int) -> list:
+    # Byte ranges that always start right after a newline, so no record is cut.
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as file:
+        for index in range(1, count):
+            file.seek(max(bounds[-1], size * index // count))
+            file.readline()
+            bounds.append(min(file.tell(), size))
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def parse_lines(text: str) -> list:
+    records = []
+    for line in text.splitlines():
+        line = line.strip().rstrip(",")
+        if (line and line not in ("[", "]")):
+            records.append(json.loads(line))
+    return records
+
+
+def parse_chunk(job: tuple) -> tuple:
+    # Runs in a worker: returns compact columns rather than a list of dicts,
+    # which would cost far more to send back to the main process.
+    path, start, end = job
+    errors = []
+    try:
+        with open(path, 'rb') as file:
+            file.seek(start)
+            text = file.read(end - start).decode("utf-8")
+        body = text.strip()
+        if (body.startswith("[")):
+            body = body[1:]
+        if (body.endswith("]")):
+            body = body[:-1]
+        try:
+            records = json.loads("[" + body.strip().rstrip(",") + "]")
+        except ValueError:
+            # Concatenated lists ("]" and "[" lines mid-chunk) need the slow path.
+            records = parse_lines(text)
+    except (OSError, ValueError) as e:
+        return (array('q'), array('q'), [], {}, ["Bytes {}-{}: {}".format(start, end, e)])
+    ids, pids, descs, attrs = record_columns(records, errors)
+    errors = ["Bytes {}-{}: {}".format(start, end, error) for error in errors]
+    return (array('q', ids), array('q', pids), descs, attrs, errors)
+
+
+def load(mind_map: MindMapModel, path: str, jobs: int=None, chunk_bytes: int=CHUNK_BYTES) -> bool:
+    # Only parsing runs in the pool. Validation and building the components
+    # need the whole map in this process and take most of the time (about
+    # 85% for a 300k node map), so the speedup is small, and with a single
+    # usable CPU the pool is pure overhead. Whenever fewer than two workers
+    # would run, the file is loaded with the plain serial path instead.
+    if (not os.path.exists(path)):
+        return False
+    if (not is_line_delimited(path)):
+        # Older single-line files and compressed ones cannot be split safely.
+        return mind_map.load(path, "ggm")
+    jobs = min(jobs or available_cpus(), available_cpus())
+    count = max(1, min(jobs * 4, os.path.getsize(path) // chunk_bytes))
+    chunks = [(path, start, end) for start, end in split(path, count)]
+    if (jobs < 2 or len(chunks) == 1):
+        return mind_map.load(path, "ggm")
+    with multiprocessing.Pool(min(jobs, len(chunks))) as pool:
+        # map keeps chunk order, which is sibling order.
+        batches = pool.map(parse_chunk, chunks)
+    ids, pids, descs, attrs, errors = array('q'), array('q'), [], {}, []
+    for chunk_ids, chunk_pids, chunk_descs, chunk_attrs, chunk_errors in batches:
+        ids.extend(chunk_ids)
+        pids.extend(chunk_pids)
+        descs.extend(chunk_descs)
+        attrs.update(chunk_attrs)
+        errors.extend(chunk_errors)
+    print("Load", path)
+    return mind_map.load_columns(ids, pids, descs, errors, attrs)
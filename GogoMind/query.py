@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+
+try:
+    from .model import MindMapModel, AttributeStore
+except ImportError:
+    from model import MindMapModel, AttributeStore
+
+import bisect
+import math
+import operator
+import weakref
+
+COMPARE = {
+    "<": operator.lt, "<=": operator.le, "==": operator.eq, "!=": operator.ne,
+    ">": operator.gt, ">=": operator.ge,
+}
+TEXT = {
+    "startswith": str.startswith,
+    "equals": operator.eq,
+    "contains": operator.contains,
+}
+# Relative per-row costs: a vectorised column scan is far cheaper per row
+# than visiting a node in Python.
+COLUMN_SCAN_COST = 0.1
+
+
+class TextIndex:
+    # Sorted (desc, id) pairs answer equality and prefix lookups by bisection.
+    # Rebuilt lazily once the model's version moves on.
+
+    _cache = weakref.WeakKeyDictionary()
+
+    def __init__(self, mind_map: MindMapModel):
+        pairs = sorted((node.desc, id) for id, node in mind_map._components.items())
+        self._descs = [pair[0] for pair in pairs]
+        self._ids = [pair[1] for pair in pairs]
+        self.version = mind_map.version
+
+    @classmethod
+    def cached(cls, mind_map: MindMapModel) -> 'TextIndex':
+        index = cls._cache.get(mind_map)
+        return index if (index and index.version == mind_map.version) else None
+
+    @classmethod
+    def of(cls, mind_map: MindMapModel) -> 'TextIndex':
+        index = cls.cached(mind_map)
+        if (index is None):
+            index = cls._cache[mind_map] = cls(mind_map)
+        return index
+
+    def _range(self, op: str, text: str) -> tuple:
+        start = bisect.bisect_left(self._descs, text)
+        if (op == "equals"):
+            return start, bisect.bisect_right(self._descs, text, start)
+        if (not text):
+            return 0, len(self._descs)
+        # Every string with this prefix sorts below the prefix with its last
+        # character bumped.
+        end = bisect.bisect_left(self._descs, text[:-1] + chr(ord(text[-1]) + 1), start)
+        return start, end
+
+    def count(self, op: str, text: str) -> int:
+        start, end = self._range(op, text)
+        return end - start
+
+    def lookup(self, op: str, text: str) -> list:
+        start, end = self._range(op, text)
+        return self._ids[start:end]
+
+
+class Query:
+    # Builds a conjunction of structural, text and attribute predicates.
+    # Depth counts from the root (0), as get_depth does; "under" means a
+    # strict descendant.
+
+    def __init__(self, mind_map: MindMapModel):
+        self._mind_map = mind_map
+        self._under = None
+        self._parent = None
+        self._low = 0
+        self._high = None
+        self._children = None
+        self._texts = []
+        self._attrs = []
+
+    def under(self, id: int) -> 'Query':
+        self._under = id
+        return self
+
+    def parent(self, id: int) -> 'Query':
+        self._parent = id
+        return self
+
+    def depth(self, low: int=0, high: int=None) -> 'Query':
+        self._low = low
+        self._high = high
+        return self
+
+    def children(self, op: str, count: int) -> 'Query':
+        self._children = (COMPARE[op], op, count)
+        return self
+
+    def desc(self, op: str, text: str) -> 'Query':
+        self._texts.append((TEXT[op], op, text))
+        return self
+
+    def attr(self, name: str, op: str, value) -> 'Query':
+        self._attrs.append((AttributeStore.OPERATORS[op], name, op, value))
+        return self
+
+    def _access_paths(self) -> list:
+        # (cost, description, candidate generator, predicates it already covers)
+        mind_map = self._mind_map
+        paths = []
+        if (mind_map.is_empty()):
+            return [(0, "empty map", lambda: iter(()), set())]
+        for _, op, text in self._texts:
+            if (op in ("startswith", "equals")):
+                index = TextIndex.cached(mind_map)
+                if (index):
+                    rows = index.count(op, text)
+                    cost, state = rows, "~{} rows".format(rows)
+                else:
+                    # A stale index has to be rebuilt over every node first,
+                    # and that is a sort, so a one-off full scan beats it.
+                    size = mind_map.size
+                    cost, state = size * (1 + math.log2(size + 1)), "rebuild over ~{} nodes".format(size)
+                paths.append((cost, "text index {} {!r} ({})".format(op, text, state),
+                              lambda op=op, text=text: iter(TextIndex.of(mind_map).lookup(op, text)), {("desc", op, text)}))
+        for _, name, op, value in self._attrs:
+            if (name in mind_map.attributes.schema):
+                rows = len(mind_map.attributes)
+                paths.append((rows * COLUMN_SCAN_COST, "attribute column {} {} {!r} (~{} rows scanned)".format(name, op, value, rows),
+                              lambda name=name, op=op, value=value: iter(mind_map.attributes.filter(name, op, value)),
+                              {("attr", name, op, value)}))
+        if (self._parent is not None):
+            parent = mind_map.get_node(self._parent)
+            rows = len(parent.get_childern()) if (parent) else 0
+            paths.append((rows, "children of {} (~{} rows)".format(self._parent, rows),
+                          lambda: (child.id for child in parent.get_childern() if not child.is_delete) if (parent) else iter(()),
+                          {("parent",)}))
+        top = mind_map.get_node(self._under) if (self._under is not None) else mind_map.root
+        rows = top.subtree_size if (top) else 0
+        name = "subtree walk under {}".format(self._under) if (self._under is not None) else "full scan"
+        paths.append((rows, "{} with subtree-height pruning (~{} rows)".format(name, rows),
+                      lambda: self._walk(top), {("under",), ("depth",), ("visible",)}))
+        return paths
+
+    def _walk(self, top):
+        # Streams visible nodes, never descending past the depth range nor
+        # into subtrees too shallow to reach it.
+        if (not top):
+            return
+        strict = self._under is not None
+        stack = [(top, self._mind_map.get_depth(top.id))]
+        while (stack):
+            node, depth = stack.pop()
+            if (not (strict and node is top) and depth >= self._low):
+                yield node.id
+            if (self._high is not None and depth >= self._high):
+                continue
+            for child in reversed(node.get_childern()):
+                if (not child.is_delete and depth + child.subtree_height >= self._low):
+                    stack.append((child, depth + 1))
+
+    def plan(self) -> dict:
+        paths = sorted(self._access_paths(), key=lambda path: path[0])
+        cost, access, candidates, covered = paths[0]
+        mind_map = self._mind_map
+        filters = []
+        if (("visible",) not in covered and not mind_map.is_empty() and mind_map.root.deleted_count):
+            filters.append(("visible", self._is_visible))
+        if (self._under is not None and ("under",) not in covered):
+            under = self._under
+            filters.append(("under {} (ancestry interval)".format(under),
+                            lambda node: node.id != under and mind_map.is_ancestor(under, node.id)))
+        if ((self._low or self._high is not None) and ("depth",) not in covered):
+            low, high = self._low, self._high
+            filters.append(("depth {}..{} (ancestry depth)".format(low, "" if (high is None) else high),
+                            lambda node: low <= mind_map.get_depth(node.id) and (high is None or mind_map.get_depth(node.id) <= high)))
+        if (self._parent is not None and ("parent",) not in covered):
+            pid = self._parent
+            filters.append(("parent {}".format(pid), lambda node: node.get_parent() is not None and node.get_parent().id == pid))
+        for test, op, text in self._texts:
+            if (("desc", op, text) not in covered):
+                filters.append(("desc {} {!r}".format(op, text), lambda node, test=test, text=text: test(node.desc, text)))
+        for test, name, op, value in self._attrs:
+            if (("attr", name, op, value) not in covered):
+                filters.append(("attr {} {} {!r}".format(name, op, value), lambda node, test=test, name=name, value=value:
+                                self._test_attr(node, test, name, value)))
+        if (self._children):
+            test, op, count = self._children
+            filters.append(("children {} {} (visible)".format(op, count),
+                            lambda node: test(sum(1 for child in node.get_childern() if not child.is_delete), count)))
+        return {
+            "access": access,
+            "cost": cost,
+            "candidates": candidates,
+            "filters": filters,
+            "rejected": [path[1] for path in paths[1:]],
+        }
+
+    def _is_visible(self, node) -> bool:
+        while (node):
+            if (node.is_delete):
+                return False
+            node = node.get_parent()
+        return True
+
+    def _test_attr(self, node, test, name: str, value) -> bool:
+        current = self._mind_map.attributes.get(node.id, name)
+        return current is not None and test(current, value)
+
+    def explain(self) -> str:
+        plan = self.plan()
+        lines = ["access: {}".format(plan["access"])]
+        lines.extend("filter: {}".format(name) for name, _ in plan["filters"])
+        lines.extend("rejected: {}".format(access) for access in plan["rejected"])
+        return "\n".join(lines)
+
+    def __iter__(self):
+        plan = self.plan()
+        filters = [test for _, test in plan["filters"]]
+        components = self._mind_map._components
+        for id in plan["candidates"]():
+            node = components.get(id)
+            if (node and all(test(node) for test in filters)):
+                yield id
+
+    def run(self) -> list:
+        return list(self)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+from model import MindMapModel, CommandManager, AddComponentCommand, EditComponentCommand
+import os
+import tempfile
+import threading
+import unittest
+
+try:
+    from PyQt5.QtCore import QCoreApplication
+except ImportError:
+    QCoreApplication = None
+
+
+@unittest.skipIf(QCoreApplication is None, "PyQt5 is not installed")
+class AutoSaveServiceTest(unittest.TestCase):
+
+    def setUp(self):
+        from autosave import AutoSaveService
+        self.app = QCoreApplication.instance() or QCoreApplication([])
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, "map.ggm")
+        self.mind_map = MindMapModel()
+        self.mind_map.create_mind_map("Root")
+        self.command_manager = CommandManager(self.mind_map)
+        self.service = AutoSaveService(self.mind_map, interval=60000, commands=0)
+        self.signals = []
+        self.service.saved.connect(lambda path, result: self.signals.append((path, result)))
+
+    def tearDown(self):
+        self.service.shutdown()
+        self.folder.cleanup()
+
+    def settle(self):
+        # Waits for the worker, then delivers the signals it queued.
+        self.service.wait()
+        self.app.processEvents()
+
+    def saved_snapshot(self) -> list:
+        mind_map = MindMapModel()
+        self.assertTrue(mind_map.load(self.path, "ggm"))
+        return mind_map.get_snapshot()
+
+    def test_autosave_by_version(self):
+        self.service.autosave()
+        self.settle()
+        self.assertEqual(self.signals, [])
+
+        self.service.set_path(self.path, "ggm")
+        self.command_manager.execute(AddComponentCommand(0, "A"))
+        self.service.autosave()
+        self.settle()
+        self.assertEqual(self.signals, [(self.path, True)])
+        self.assertEqual(self.service.saved_version(self.path), self.mind_map.version)
+        self.assertEqual(self.saved_snapshot(), self.mind_map.get_snapshot())
+
+        # Nothing changed since, so nothing is written.
+        self.service.autosave()
+        self.settle()
+        self.assertEqual(len(self.signals), 1)
+
+    def test_queued_saves_coalesce(self):
+        gate = threading.Event()
+        self.service._executor.submit(gate.wait)
+        self.service.set_path(self.path, "ggm")
+        for index in range(4):
+            self.command_manager.execute(AddComponentCommand(0, "Node {}".format(index)))
+            self.service.save(self.path, "ggm")
+        expected = self.mind_map.get_snapshot()
+        # Edits after the last save request are not in the file.
+        self.command_manager.execute(EditComponentCommand(1, "Later"))
+        gate.set()
+        self.settle()
+        # The first request and the newest queued one; the two in between are dropped.
+        self.assertEqual(self.signals, [(self.path, True), (self.path, True)])
+        self.assertEqual(self.saved_snapshot(), expected)
+        self.assertNotEqual(self.service.saved_version(self.path), self.mind_map.version)
+
+    def test_failed_save(self):
+        path = os.path.join(self.folder.name, "missing", "map.ggm")
+        self.service.save(path, "ggm")
+        self.settle()
+        self.assertEqual(self.signals, [(path, False)])
+        self.assertFalse(self.service.last_result)
+        self.assertIsNone(self.service.saved_version(path))
+
+    def test_error_does_not_stop_autosave(self):
+        from unittest import mock
+        self.service.set_path(self.path, "ggm")
+        self.command_manager.execute(AddComponentCommand(0, "A"))
+        with mock.patch("autosave.MindMapModel.write_snapshot", side_effect=RuntimeError("boom")):
+            self.service.autosave()
+            self.settle()
+        self.assertEqual(self.signals, [(self.path, False)])
+        self.assertFalse(self.service.is_saving)
+
+        self.command_manager.execute(AddComponentCommand(0, "B"))
+        self.service.autosave()
+        self.settle()
+        self.assertEqual(self.signals[-1], (self.path, True))
+        self.assertEqual(self.saved_snapshot(), self.mind_map.get_snapshot())
+
+
+if __name__ == "__main__":
+    unittest.main()
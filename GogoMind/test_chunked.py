@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+from model import MindMapModel, CommandManager, EditComponentCommand, AddComponentCommand, DeleteComponentCommand
+from benchmark import generate
+from chunked import ChunkStore, MANIFEST
+import os
+import tempfile
+import unittest
+
+
+class ChunkStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, "map.chunks")
+        self.mind_map = MindMapModel()
+        self.mind_map.restore_from_snapshot(generate("random", 3000, seed=2))
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_incremental_save(self):
+        store = ChunkStore(self.path, limit=64, fanout=8)
+        stats = store.save(self.mind_map)
+        self.assertEqual(stats["written"], stats["chunks"])
+        self.assertGreater(stats["chunks"], 20)
+        self.assertEqual(store.save(self.mind_map)["written"], 0)
+
+        command_manager = CommandManager(self.mind_map)
+        command_manager.execute(EditComponentCommand(2500, "Edited"))
+        command_manager.execute(AddComponentCommand(1200, "Added"))
+        stats = store.save(self.mind_map)
+        self.assertGreater(stats["written"], 0)
+        self.assertLessEqual(stats["written"], 6)
+        self.assertEqual(len(os.listdir(self.path)), len(set(store.manifest["chunks"])) + 1)
+
+        loaded = MindMapModel()
+        self.assertTrue(ChunkStore(self.path).load(loaded))
+        self.assertEqual(loaded.content_hash, self.mind_map.content_hash)
+        self.assertEqual(loaded.diff(self.mind_map), {"added": [], "removed": [], "edited": [], "moved": []})
+
+    def test_save_after_undo(self):
+        store = ChunkStore(self.path, limit=64, fanout=8)
+        store.save(self.mind_map)
+        command_manager = CommandManager(self.mind_map)
+        command_manager.execute(DeleteComponentCommand(5))
+        store.save(self.mind_map)
+        command_manager.undo()
+        self.assertGreater(store.save(self.mind_map)["written"], 0)
+
+        loaded = MindMapModel()
+        self.assertTrue(ChunkStore(self.path).load(loaded))
+        self.assertEqual(loaded.size, self.mind_map.size)
+        self.assertEqual(loaded.get_snapshot(), self.mind_map.get_snapshot())
+
+    def test_corrupt_chunk(self):
+        store = ChunkStore(self.path, limit=64, fanout=8)
+        store.save(self.mind_map)
+        with open(os.path.join(self.path, store.manifest["chunks"][3] + ".json"), 'a') as file:
+            file.write("{")
+        loaded = MindMapModel()
+        self.assertFalse(ChunkStore(self.path).load(loaded))
+        self.assertTrue(loaded.is_empty())
+        self.assertTrue(os.path.exists(os.path.join(self.path, MANIFEST)))
+
+
+if __name__ == "__main__":
+    unittest.main()
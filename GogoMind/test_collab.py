@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+
+from model import MindMapModel, Node, AddComponentCommand, EditComponentCommand, DeleteComponentCommand
+from model import PasteComponentCommand, MoveComponentCommand, SetAttributeCommand
+from collab import CollabServer, CollabClient, encode_command, decode_command, serve
+import asyncio
+import json
+import os
+import random
+import socket
+import tempfile
+import unittest
+
+
+class CollabTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mind_map = MindMapModel()
+        self.mind_map.create_mind_map("Root")
+        for index in range(20):
+            self.mind_map.insert_node(self.mind_map.create_node("Topic {}".format(index)), 0)
+
+    def test_wire_commands(self):
+        top = Node(0, "Copied")
+        child = Node(1, "Child")
+        top.add_child(child)
+        child.set_parent(top)
+        top._recount()
+        for command in (AddComponentCommand(3, "New"), EditComponentCommand(4, "Text"), DeleteComponentCommand(5),
+                        MoveComponentCommand(6, 7), SetAttributeCommand(8, "cost", 2.5), PasteComponentCommand(9, top)):
+            data = encode_command(command)
+            self.assertEqual(encode_command(decode_command(data)), data)
+        self.assertEqual(decode_command(encode_command(PasteComponentCommand(9, top)))._clone_node.subtree_size, 2)
+        command = decode_command(encode_command(PasteComponentCommand(9, top, {1: {"cost": 2.5}})))
+        self.assertEqual(command._attrs, {1: {"cost": 2.5}})
+        self.assertTrue(command.execute(self.mind_map))
+        self.assertEqual(self.mind_map.attributes.row(22), {"cost": 2.5})
+
+    def test_clients_converge(self):
+        clients, ops = 50, 20
+
+        async def session():
+            server = CollabServer(self.mind_map)
+            host, port = await server.start()
+            replicas = [CollabClient() for _ in range(clients)]
+            await asyncio.gather(*(replica.connect(host, port) for replica in replicas))
+            self.assertEqual(server.clients, clients)
+
+            async def edit(replica, seed):
+                rng = random.Random(seed)
+                futures = []
+                for index in range(ops):
+                    ids = [id for id in range(1, 21)]
+                    choice = rng.random()
+                    if (choice < 0.3):
+                        command = AddComponentCommand(rng.choice(ids), "Client {} op {}".format(seed, index))
+                    elif (choice < 0.5):
+                        command = EditComponentCommand(rng.choice(ids), "Edited by {}".format(seed))
+                    elif (choice < 0.65):
+                        command = SetAttributeCommand(rng.choice(ids), "votes", rng.randint(0, 9))
+                    elif (choice < 0.8):
+                        command = MoveComponentCommand(rng.choice(ids), rng.choice(ids))
+                    elif (choice < 0.9):
+                        command = DeleteComponentCommand(rng.choice(ids))
+                    else:
+                        top = Node(0, "Pasted by {}".format(seed))
+                        child = Node(1, "Pasted child")
+                        top.add_child(child)
+                        child.set_parent(top)
+                        top._recount()
+                        command = PasteComponentCommand(rng.choice(ids), top)
+                    futures.append(replica.submit(command))
+                return await asyncio.gather(*futures)
+
+            results = await asyncio.gather(*(edit(replica, seed) for seed, replica in enumerate(replicas)))
+            # A client that joins late starts from the current checkpoint;
+            # random deletes may have removed any of the topics by now.
+            late = CollabClient()
+            await late.connect(host, port)
+            self.assertTrue(await late.execute(AddComponentCommand(0, "Late")))
+            await asyncio.gather(*(replica.execute(EditComponentCommand(2, "Sync")) for replica in replicas))
+            for replica in replicas + [late]:
+                await replica.close()
+            stats = server.stats
+            await server.stop()
+            return replicas + [late], results, stats
+
+        replicas, results, stats = asyncio.run(session())
+        self.assertEqual(sum(len(result) for result in results), clients * ops)
+        # Ops on topics someone else deleted fail; the rest go through.
+        succeeded = sum(sum(result) for result in results)
+        self.assertGreater(succeeded, 0)
+        self.assertLess(succeeded, clients * ops)
+        self.assertLess(stats["batches"], stats["ops"])
+        self.assertTrue(any(node["desc"].startswith("Pasted by") for node in self.mind_map.get_snapshot()))
+        self.assertGreater(self.mind_map.root.deleted_count, 0)
+        expected = self.mind_map.get_checkpoint()
+        for replica in replicas:
+            self.assertEqual(replica.mind_map.get_checkpoint(), expected)
+            self.assertEqual(replica.mind_map.content_hash, self.mind_map.content_hash)
+
+    def test_slow_client_is_dropped(self):
+        async def session():
+            server = CollabServer(self.mind_map, max_lag=8)
+            host, port = await server.start()
+            # Connects but never reads, so its socket buffers fill up.
+            slow_reader, slow_writer = await asyncio.open_connection(host, port)
+            fast = CollabClient()
+            await fast.connect(host, port)
+            text = "x" * 65536
+            for index in range(300):
+                self.assertTrue(await fast.execute(EditComponentCommand(1, text + str(index))))
+            stats = server.stats
+            slow_writer.close()
+            await fast.close()
+            await server.stop()
+            return fast, stats
+
+        fast, stats = asyncio.run(session())
+        self.assertEqual(stats["dropped"], 1)
+        self.assertEqual(stats["clients"], 1)
+        self.assertEqual(fast.mind_map.get_node(1).desc, "x" * 65536 + "299")
+
+    def test_bad_command(self):
+        async def session():
+            server = CollabServer(self.mind_map)
+            host, port = await server.start()
+            client = CollabClient()
+            await client.connect(host, port)
+            client._writer.write(b'{"seq": 1, "cmd": ["RestoreEverything", []]}\n')
+            client._pending[1] = asyncio.get_running_loop().create_future()
+            result = await client._pending[1]
+            still_works = await client.execute(EditComponentCommand(1, "Fine"))
+            await client.close()
+            await server.stop()
+            return result, still_works, client
+
+        result, still_works, client = asyncio.run(session())
+        self.assertFalse(result)
+        self.assertTrue(still_works)
+        self.assertEqual(client.mind_map.get_node(1).desc, "Fine")
+
+    def test_encoded_commands(self):
+        async def session():
+            server = CollabServer(self.mind_map)
+            host, port = await server.start()
+            client = CollabClient()
+            await client.connect(host, port)
+            cmd = json.dumps(encode_command(EditComponentCommand(1, "Sent as bytes"))).encode()
+            result = await client.execute_encoded(cmd)
+            await client.close()
+            await server.stop()
+            return result, client
+
+        result, client = asyncio.run(session())
+        self.assertTrue(result)
+        self.assertEqual(client.mind_map.get_node(1).desc, "Sent as bytes")
+
+    def test_serve_saves_edits(self):
+        def free_port() -> int:
+            with socket.socket() as sock:
+                sock.bind(("127.0.0.1", 0))
+                return sock.getsockname()[1]
+
+        async def session(path, save_interval, edits):
+            port = free_port()
+            server = asyncio.ensure_future(serve(path, "127.0.0.1", port, save_interval))
+            client = CollabClient()
+            for _ in range(100):
+                try:
+                    await client.connect("127.0.0.1", port)
+                    break
+                except OSError:
+                    await asyncio.sleep(0.01)
+            for desc in edits:
+                self.assertTrue(await client.execute(EditComponentCommand(1, desc)))
+            saved = None
+            if (save_interval):
+                for _ in range(100):
+                    await asyncio.sleep(save_interval)
+                    saved = load(path)
+                    if (saved.get_node(1).desc == edits[-1]):
+                        break
+            await client.close()
+            server.cancel()
+            try:
+                await server
+            except asyncio.CancelledError:
+                pass
+            return saved
+
+        def load(path) -> MindMapModel:
+            mind_map = MindMapModel()
+            self.assertTrue(mind_map.load(path, "xml" if path.endswith(".xml") else "ggm"))
+            return mind_map
+
+        with tempfile.TemporaryDirectory() as folder:
+            for name in ("map.ggm", "map.xml"):
+                path = os.path.join(folder, name)
+                self.assertTrue(self.mind_map.save(path, "xml" if name.endswith(".xml") else "ggm"))
+                # Saved on shutdown, in the format it was loaded from.
+                asyncio.run(session(path, 0, ["Edited"]))
+                self.assertEqual(load(path).get_node(1).desc, "Edited")
+                # And every interval while serving.
+                saved = asyncio.run(session(path, 0.05, ["First", "Second"]))
+                self.assertEqual(saved.get_node(1).desc, "Second")
+                self.assertEqual(load(path).get_snapshot(), saved.get_snapshot())
+
+
+if __name__ == "__main__":
+    unittest.main()
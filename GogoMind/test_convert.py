@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+from model import MindMapModel, AddComponentCommand, DeleteComponentCommand, SetAttributeCommand, CommandManager
+from convert import convert, normalize, output_path, main
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+
+class ConvertTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, "map.ggm")
+        self.mind_map = MindMapModel()
+        self.mind_map.create_mind_map("Root")
+        command_manager = CommandManager(self.mind_map)
+        for index in range(6):
+            command_manager.execute(AddComponentCommand(index // 2, "Topic {}".format(index)))
+        command_manager.execute(DeleteComponentCommand(2))
+        command_manager.execute(SetAttributeCommand(3, "cost", 2.5))
+        command_manager.execute(SetAttributeCommand(3, "done", True))
+        command_manager.execute(SetAttributeCommand(4, "owner", "ann"))
+        self.mind_map.save(self.path, "ggm")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_normalize_keeps_attributes(self):
+        records = normalize(self.mind_map.get_snapshot())
+        self.assertEqual([record["id"] for record in records], list(range(len(records))))
+        attrs = {record["desc"]: record.get("attrs") for record in records}
+        self.assertEqual(attrs["Topic 2"], {"cost": 2.5, "done": True})
+        self.assertEqual(attrs["Topic 3"], {"owner": "ann"})
+        self.assertIsNone(attrs["Topic 0"])
+
+    def test_round_trip(self):
+        expected = [(record["desc"], record.get("attrs")) for record in self.mind_map.get_snapshot()]
+        for to, is_normalize in (("xml", False), ("xml", True), ("ggm", True)):
+            target = output_path(self.path, to, self.folder.name)
+            path, ok, count, _, error = convert((self.path, target, is_normalize, None, None))
+            self.assertTrue(ok, error)
+            self.assertEqual(count, len(expected))
+            mind_map = MindMapModel()
+            self.assertTrue(mind_map.load(target, to))
+            self.assertEqual([(record["desc"], record.get("attrs")) for record in mind_map.get_snapshot()], expected)
+
+    def run_main(self, *args) -> int:
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            code = main(list(args) + ["--jobs", "1"])
+        self.output = out.getvalue()
+        return code
+
+    def test_output_keeps_folders(self):
+        for folder in ("a", "b"):
+            os.makedirs(os.path.join(self.folder.name, "in", folder))
+            mind_map = MindMapModel()
+            mind_map.create_mind_map("Root " + folder)
+            mind_map.save(os.path.join(self.folder.name, "in", folder, "map.ggm"), "ggm")
+        output = os.path.join(self.folder.name, "out")
+        self.assertEqual(self.run_main(os.path.join(self.folder.name, "in"), "--to", "xml", "--output", output), 0)
+        for folder in ("a", "b"):
+            mind_map = MindMapModel()
+            self.assertTrue(mind_map.load(os.path.join(output, folder, "map.xml"), "xml"))
+            self.assertEqual(mind_map.get_node(0).desc, "Root " + folder)
+
+    def test_colliding_outputs_fail(self):
+        self.mind_map.save(os.path.join(self.folder.name, "map.xml"), "xml")
+        output = os.path.join(self.folder.name, "out")
+        self.assertEqual(self.run_main(self.folder.name, "--to", "xml", "--output", output), 1)
+        self.assertIn("2 failed", self.output)
+        self.assertFalse(os.path.exists(os.path.join(output, "map.xml")))
+
+    def test_normalize_in_place(self):
+        self.assertEqual(self.run_main(self.path, "--normalize"), 0)
+        mind_map = MindMapModel()
+        self.assertTrue(mind_map.load(self.path, "ggm"))
+        self.assertEqual([record["id"] for record in mind_map.get_snapshot()], list(range(mind_map.size)))
+        self.assertEqual([record["desc"] for record in mind_map.get_snapshot()],
+                         [record["desc"] for record in self.mind_map.get_snapshot()])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+from model import MindMapModel, EditComponentCommand, PasteComponentCommand, Node, file_compression
+from benchmark import generate
+from collab import encode_command
+from documents import DocumentCache, DocumentService, NODE_BYTES, load_document
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+import urllib.request
+
+
+class DocumentCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.paths = []
+        for index in range(6):
+            mind_map = MindMapModel()
+            mind_map.restore_from_snapshot(generate("random", 100, seed=index))
+            path = os.path.join(self.folder.name, "doc{}.ggm".format(index))
+            mind_map.save(path, "ggm")
+            self.paths.append(path)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_lru_and_flush(self):
+        # Room for three documents of 100 nodes.
+        cache = DocumentCache(budget=3 * 100 * NODE_BYTES)
+        with cache.open(self.paths[0]) as document:
+            document.command_manager.execute(EditComponentCommand(5, "Changed"))
+            self.assertTrue(document.dirty)
+        for path in self.paths[1:3]:
+            with cache.open(path):
+                pass
+        with cache.open(self.paths[0]):
+            pass
+        self.assertEqual(cache.stats["hits"], 1)
+        self.assertEqual(cache.stats["misses"], 3)
+
+        with cache.open(self.paths[3]):
+            pass
+        # doc1 was least recently used, not doc0.
+        self.assertNotIn(self.paths[1], cache)
+        self.assertIn(self.paths[0], cache)
+        for path in self.paths[4:]:
+            with cache.open(path):
+                pass
+        self.assertNotIn(self.paths[0], cache)
+        stats = cache.stats
+        self.assertEqual(stats["evictions"], 3)
+        self.assertEqual(stats["flushes"], 1)
+        self.assertLessEqual(stats["bytes"], cache.budget)
+        self.assertEqual(load_document(self.paths[0]).get_node(5).desc, "Changed")
+
+    def test_paste_is_flushed(self):
+        cache = DocumentCache(budget=150 * NODE_BYTES)
+        service = DocumentService(cache, self.folder.name)
+        command = encode_command(PasteComponentCommand(0, Node(0, "Pasted")))
+        self.assertTrue(service.handle({"id": 1, "method": "execute", "params": ["doc0.ggm", command]})["result"])
+        service.handle({"id": 2, "method": "snapshot", "params": ["doc1.ggm"]})
+        self.assertEqual(cache.stats["flushes"], 1)
+        self.assertIn("Pasted", [node["desc"] for node in load_document(self.paths[0]).get_snapshot()])
+
+    def test_keeps_compression(self):
+        load_document(self.paths[0]).save(self.paths[0], "ggm", "lzma")
+        cache = DocumentCache()
+        with cache.open(self.paths[0]) as document:
+            document.command_manager.execute(EditComponentCommand(5, "Changed"))
+            self.assertTrue(document.save())
+        self.assertEqual(file_compression(self.paths[0]), "lzma")
+
+    def test_pinned_documents_stay(self):
+        cache = DocumentCache(budget=100 * NODE_BYTES)
+        first = cache.acquire(self.paths[0])
+        with cache.open(self.paths[1]):
+            self.assertIn(self.paths[0], cache)
+        self.assertIn(self.paths[0], cache)
+        cache.release(first)
+        with cache.open(self.paths[2]):
+            pass
+        self.assertNotIn(self.paths[0], cache)
+
+    def test_coalesced_loads(self):
+        loads = []
+
+        def slow_loader(path):
+            loads.append(path)
+            time.sleep(0.05)
+            return load_document(path)
+
+        cache = DocumentCache(loader=slow_loader)
+        documents = []
+
+        def request():
+            with cache.open(self.paths[0]) as document:
+                documents.append(document)
+
+        threads = [threading.Thread(target=request) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(loads, [self.paths[0]])
+        self.assertEqual(len(set(map(id, documents))), 1)
+        stats = cache.stats
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"] + stats["coalesced"], 7)
+
+        self.assertRaises(FileNotFoundError, cache.acquire, os.path.join(self.folder.name, "missing.ggm"))
+        self.assertEqual(cache.stats["documents"], 1)
+
+    def test_service(self):
+        service = DocumentService(DocumentCache(), self.folder.name)
+        command = encode_command(EditComponentCommand(3, "Remote"))
+        self.assertTrue(service.handle({"id": 1, "method": "execute", "params": ["doc2.ggm", command]})["result"])
+        snapshot = service.handle({"id": 2, "method": "snapshot", "params": ["doc2.ggm"]})["result"]
+        self.assertEqual([record["desc"] for record in snapshot if record["id"] == 3], ["Remote"])
+        self.assertTrue(service.handle({"id": 3, "method": "undo", "params": ["doc2.ggm"]})["result"])
+        self.assertEqual(service.handle({"id": 4, "method": "drop", "params": []})["error"]["code"], -32601)
+        self.assertEqual(service.handle({"id": 5, "method": "snapshot", "params": ["none.ggm"]})["error"]["code"], -32001)
+        self.assertIn("outside", service.handle({"id": 6, "method": "save", "params": ["../x.ggm"]})["error"]["message"])
+        self.assertEqual(service.handle({"id": 7, "method": "stats"})["result"]["misses"], 2)
+        for request in ([], [{"id": 8, "method": "stats"}], "stats", 42, None):
+            self.assertEqual(service.handle(request)["error"]["code"], -32600)
+
+    def test_http(self):
+        server = DocumentService(DocumentCache(), self.folder.name).serve(port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = "http://{}:{}/".format(*server.server_address[:2])
+
+        def post(body: bytes) -> dict:
+            with urllib.request.urlopen(urllib.request.Request(url, data=body)) as response:
+                return json.loads(response.read())
+
+        try:
+            self.assertEqual(post(b'{"id": 1, "method": "stats"}')["result"]["documents"], 0)
+            self.assertEqual(post(b'[1, 2]')["error"]["code"], -32600)
+            self.assertEqual(post(b'"stats"')["error"]["code"], -32600)
+            self.assertEqual(post(b'{"id": ')["error"]["code"], -32700)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    unittest.main()
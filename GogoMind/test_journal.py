@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+from model import MindMapModel, CommandManager
+from model import AddComponentCommand, DeleteComponentCommand, EditComponentCommand, MoveComponentCommand
+from model import SetAttributeCommand
+from journal import CommandJournal
+import os
+import tempfile
+import unittest
+
+
+class CommandJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, "map.ggm")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def _edit(self, journal: CommandJournal) -> MindMapModel:
+        mind_map = journal._mind_map
+        command_manager = CommandManager(mind_map, journal)
+        command_manager.execute(AddComponentCommand(-1, "Root"))
+        command_manager.execute(AddComponentCommand(0, "A"))
+        command_manager.execute(AddComponentCommand(0, "B"))
+        command_manager.execute(AddComponentCommand(1, "C"))
+        command_manager.execute(EditComponentCommand(3, "D"))
+        command_manager.execute(MoveComponentCommand(3, 2))
+        command_manager.execute(DeleteComponentCommand(2))
+        command_manager.undo()
+        command_manager.undo()
+        return mind_map
+
+    def test_recover(self):
+        journal = CommandJournal.open(MindMapModel(), self.path, sync_interval=1)
+        mind_map = self._edit(journal)
+
+        recovered = MindMapModel()
+        CommandJournal.open(recovered, self.path)
+        self.assertEqual(recovered.get_snapshot(), mind_map.get_snapshot())
+        self.assertEqual(recovered.serial_id, mind_map.serial_id)
+
+    def test_recover_undo_of_root_delete_with_attributes(self):
+        # Undoing a root delete rebuilds the map from a snapshot; its
+        # attribute rows have to reach the journal too.
+        journal = CommandJournal.open(MindMapModel(), self.path, sync_interval=1)
+        mind_map = journal._mind_map
+        command_manager = CommandManager(mind_map, journal)
+        command_manager.execute(AddComponentCommand(-1, "Root"))
+        command_manager.execute(AddComponentCommand(0, "A"))
+        command_manager.execute(SetAttributeCommand(1, "owner", "amy"))
+        command_manager.execute(DeleteComponentCommand(0))
+        command_manager.undo()
+        self.assertEqual(mind_map.attributes.row(1), {"owner": "amy"})
+
+        recovered = MindMapModel()
+        CommandJournal.open(recovered, self.path)
+        self.assertEqual(recovered.attributes.row(1), {"owner": "amy"})
+        self.assertEqual(recovered.get_snapshot(), mind_map.get_snapshot())
+
+    def test_recover_after_checkpoint_and_torn_tail(self):
+        journal = CommandJournal.open(MindMapModel(), self.path, checkpoint_interval=4, sync_interval=1)
+        mind_map = self._edit(journal)
+        with open(journal.journal_path, 'a') as file:
+            file.write('{"op":"execute","cmd":')
+
+        recovered = MindMapModel()
+        CommandJournal.open(recovered, self.path)
+        self.assertEqual(recovered.get_snapshot(), mind_map.get_snapshot())
+        self.assertEqual(recovered.root.deleted_count, mind_map.root.deleted_count)
+
+    def test_recovered_edits_survive_close(self):
+        journal = CommandJournal.open(MindMapModel(), self.path, sync_interval=1)
+        mind_map = self._edit(journal)
+        journal.close()
+
+        recovered = MindMapModel()
+        journal = CommandJournal.open(recovered, self.path)
+        self.assertTrue(journal.unsaved)
+        journal.close(discard=True)
+        self.assertTrue(os.path.exists(journal.checkpoint_path))
+
+        journal = CommandJournal.open(recovered, self.path)
+        self.assertEqual(recovered.get_snapshot(), mind_map.get_snapshot())
+        version = recovered.version
+        recovered.save(self.path, "ggm")
+        CommandManager(recovered, journal).execute(EditComponentCommand(1, "After save"))
+        journal.mark_saved(version)
+        journal.close(discard=True)
+        self.assertTrue(os.path.exists(journal.journal_path))
+
+        journal = CommandJournal.open(recovered, self.path)
+        journal.mark_saved(recovered.version)
+        journal.close(discard=True)
+        self.assertFalse(os.path.exists(journal.journal_path))
+        self.assertFalse(os.path.exists(journal.checkpoint_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
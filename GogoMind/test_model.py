@@ -1,6 +1,15 @@
 #!/usr/bin/env python3
 
 from model import *
+import os
+import sys
+import tempfile
+import asyncio
+import shutil
+import subprocess
+from model import DescriptionFactory, MindMapModel, MindMapBuilder, validate_records, CommandManager, MoveComponentCommand
+from model import EditComponentCommand, PasteComponentCommand, AddComponentCommand, DeleteComponentCommand
+from model import SetAttributeCommand, file_compression, compress_snapshot
 import unittest
 
 
@@ -34,6 +43,42 @@ class ComponentTest(unittest.TestCase):
         self.assertEqual(len(childern), 1)
 
 
+    def test_shared_description(self):
+        factory = DescriptionFactory()
+        hits = factory.stats["hits"]
+        first = Node(1, "".join(["Shared", "Desc"]))
+        second = Node(2, "".join(["Shared", "Desc"]))
+        self.assertIs(first.desc, second.desc)
+        self.assertEqual(factory.stats["hits"], hits + 1)
+        self.assertEqual(factory.CACHE["SharedDesc"][1], 2)
+
+        first.desc = "Other"
+        second.desc = "Other"
+        self.assertNotIn("SharedDesc", factory.CACHE)
+
+        kept = Node(3, "".join(["Kept", "Desc"]))
+        Node(4, "".join(["Dropped", "Desc"]))
+        factory.sweep()
+        self.assertIn("KeptDesc", factory.CACHE)
+        self.assertNotIn("DroppedDesc", factory.CACHE)
+
+    def test_shared_description_threads(self):
+        import threading
+        factory = DescriptionFactory()
+        desc = "".join(["Thread", "Desc"])
+
+        def churn():
+            for _ in range(20000):
+                factory.release(factory.get_description(desc))
+
+        nodes = [Node(index, desc) for index in range(3)]
+        threads = [threading.Thread(target=churn) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(factory.CACHE[desc][1], len(nodes))
+
     def test_node(self):
         root = Root(0, "Root")
         child_1 = Node(1, "Child_1")
@@ -43,6 +88,601 @@ class ComponentTest(unittest.TestCase):
         self.assertFalse(child_1.add_sibling(child_1))
 
 
+class MindMapModelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mind_map = MindMapModel()
+        self.mind_map.create_mind_map("Root")
+        for pid in [0, 0, 1, 3]:
+            self.mind_map.insert_node(self.mind_map.create_node("Node"), pid)
+
+    def test_subtree_stats(self):
+        root = self.mind_map.root
+        self.assertEqual(root.subtree_size, 5)
+        self.assertEqual(root.subtree_height, 4)
+        self.assertEqual(self.mind_map.size, 5)
+
+        node = self.mind_map.get_node(1)
+        node.delete(True, True)
+        self.assertEqual(root.subtree_size, 2)
+        self.assertEqual(root.subtree_height, 2)
+        self.assertEqual(root.deleted_count, 3)
+
+        node.delete(False, True)
+        self.assertEqual(root.subtree_size, 5)
+        self.assertEqual(root.subtree_height, 4)
+        self.assertEqual(root.deleted_count, 0)
+
+    def test_subtree_height_after_edits(self):
+        def height(node):
+            if (node.is_delete):
+                return 0
+            return 1 + max((height(child) for child in node.get_childern()), default=0)
+
+        import random
+        rng = random.Random(7)
+        command_manager = CommandManager(self.mind_map)
+        for index in range(300):
+            ids = [node.id for node in self.mind_map.root.get_childern()] + list(range(1, 5))
+            choice = rng.random()
+            if (choice < 0.4):
+                command = AddComponentCommand(rng.choice(ids), "Node {}".format(index))
+            elif (choice < 0.6):
+                command = DeleteComponentCommand(rng.choice(ids))
+            else:
+                command = MoveComponentCommand(rng.choice(ids), rng.choice(ids + [0]))
+            command_manager.execute(command)
+            if (rng.random() < 0.2):
+                command_manager.undo()
+            for node in self.mind_map.get_snapshot():
+                component = self.mind_map.get_node(node["id"])
+                self.assertEqual(component.subtree_height, height(component), node["id"])
+
+    def test_ancestry(self):
+        self.assertTrue(self.mind_map.is_ancestor(0, 4))
+        self.assertTrue(self.mind_map.is_ancestor(1, 1))
+        self.assertFalse(self.mind_map.is_ancestor(2, 4))
+        self.assertEqual(self.mind_map.lowest_common_ancestor(4, 2), 0)
+        self.assertEqual(self.mind_map.lowest_common_ancestor(4, 1), 1)
+
+        self.mind_map.insert_node(self.mind_map.create_node("Node"), 4)
+        self.mind_map.insert_node(self.mind_map.create_node("Node"), 4)
+        self.assertTrue(self.mind_map.is_ancestor(3, 5))
+        self.assertFalse(self.mind_map.is_ancestor(5, 6))
+        self.assertEqual(self.mind_map.lowest_common_ancestor(5, 6), 4)
+        self.assertEqual(self.mind_map.lowest_common_ancestor(6, 2), 0)
+        self.assertEqual(self.mind_map.get_depth(6), 4)
+
+    def test_ancestry_patched_on_structural_edits(self):
+        def path(id):
+            ids = []
+            node = self.mind_map.get_node(id)
+            while (node):
+                ids.append(node.id)
+                node = node.get_parent()
+            return ids
+
+        import random
+        rng = random.Random(3)
+        mind_map = MindMapModel(reuse_ids=True)
+        mind_map.create_mind_map("Root")
+        self.mind_map = mind_map
+        for index in range(300):
+            mind_map.insert_node(mind_map.create_node("Node"), rng.randrange(index + 1))
+        command_manager = CommandManager(mind_map)
+        self.assertTrue(mind_map.is_ancestor(0, 5))
+        index = mind_map._ancestry
+        for step in range(40):
+            ids = [record["id"] for record in mind_map.get_snapshot()]
+            choice = rng.random()
+            if (choice < 0.4):
+                command_manager.execute(MoveComponentCommand(rng.choice(ids[1:]), rng.choice(ids)))
+            elif (choice < 0.6):
+                command_manager.execute(PasteComponentCommand(rng.choice(ids), mind_map.get_node(rng.choice(ids[1:]))))
+            elif (choice < 0.8):
+                # Undo, then a new command: the undone one is discarded and purges its nodes.
+                command_manager.execute(AddComponentCommand(rng.choice(ids), "Added"))
+                command_manager.undo()
+                command_manager.execute(AddComponentCommand(rng.choice(ids), "Reused"))
+            else:
+                command_manager.undo()
+            ids = [record["id"] for record in mind_map.get_snapshot()]
+            for _ in range(20):
+                a, b = rng.choice(ids), rng.choice(ids)
+                path_a, path_b = path(a), path(b)
+                self.assertEqual(mind_map.is_ancestor(a, b), a in path_b)
+                self.assertEqual(mind_map.get_depth(b), len(path_b) - 1)
+                self.assertEqual(mind_map.lowest_common_ancestor(a, b), next(id for id in path_a if id in path_b))
+        # Patched all along, never rebuilt.
+        self.assertIs(mind_map._ancestry, index)
+
+    def test_move_command(self):
+        command_manager = CommandManager(self.mind_map)
+        self.assertFalse(command_manager.execute(MoveComponentCommand(1, 4)))
+        self.assertTrue(command_manager.execute(MoveComponentCommand(3, 2)))
+        self.assertEqual(self.mind_map.get_node(3).get_parent().id, 2)
+        self.assertTrue(self.mind_map.is_ancestor(2, 4))
+        self.assertEqual(self.mind_map.get_node(2).subtree_size, 3)
+        self.assertEqual(self.mind_map.get_node(1).subtree_height, 1)
+
+        self.assertTrue(command_manager.undo())
+        self.assertEqual(self.mind_map.get_node(3).get_parent().id, 1)
+        self.assertTrue(self.mind_map.is_ancestor(1, 4))
+        self.assertEqual(self.mind_map.root.subtree_height, 4)
+
+    def test_copy_on_write_paste(self):
+        command_manager = CommandManager(self.mind_map)
+        clipboard = self.mind_map.copy_node(1)
+        self.assertIs(clipboard.node, self.mind_map.get_node(1))
+
+        command_manager.execute(EditComponentCommand(4, "Edited"))
+        self.assertTrue(clipboard.is_copied)
+        self.assertTrue(command_manager.execute(PasteComponentCommand(2, clipboard.node)))
+        pasted = self.mind_map.get_node(2).get_childern()[0]
+        self.assertEqual([pasted.id, pasted.get_childern()[0].id], [5, 6])
+        self.assertEqual(self.mind_map.get_node(7).desc, "Node")
+        self.assertEqual(self.mind_map.size, 8)
+
+        command_manager.undo()
+        self.assertEqual(self.mind_map.size, 5)
+        command_manager.redo()
+        self.assertEqual(self.mind_map.size, 8)
+
+    def test_copy_on_write_deep_branch(self):
+        command_manager = CommandManager(self.mind_map)
+        for id in range(4, 3004):
+            self.mind_map.insert_node(self.mind_map.create_node("Deep"), id)
+        clipboard = self.mind_map.copy_node(1)
+        self.assertTrue(command_manager.execute(EditComponentCommand(3004, "Edited")))
+        self.assertTrue(clipboard.is_copied)
+        self.assertEqual(clipboard.node.subtree_height, 3003)
+        self.assertEqual(clipboard.node.subtree_size, 3003)
+
+    def test_paste_copies_attributes(self):
+        command_manager = CommandManager(self.mind_map)
+        command_manager.execute(SetAttributeCommand(3, "cost", 2.5))
+        command_manager.execute(SetAttributeCommand(4, "owner", "ann"))
+        clipboard = self.mind_map.copy_node(1)
+
+        # An attribute change is a write too: the clipboard keeps the old row.
+        command_manager.execute(SetAttributeCommand(3, "cost", 9.0))
+        self.assertTrue(clipboard.is_copied)
+        self.assertEqual(clipboard.attributes, {3: {"cost": 2.5}, 4: {"owner": "ann"}})
+        self.assertTrue(command_manager.execute(PasteComponentCommand(2, clipboard.node, clipboard.attributes)))
+        pasted = self.mind_map.get_node(2).get_childern()[0]
+        self.assertEqual([pasted.id, pasted.get_childern()[0].id], [5, 6])
+        self.assertEqual(self.mind_map.attributes.row(6), {"cost": 2.5})
+        self.assertEqual(self.mind_map.attributes.row(7), {"owner": "ann"})
+
+        # A live node of the map brings its rows without being told.
+        self.assertTrue(command_manager.execute(PasteComponentCommand(0, self.mind_map.get_node(3))))
+        self.assertEqual(self.mind_map.attributes.row(8), {"cost": 9.0})
+        self.assertEqual(self.mind_map.filter_nodes("owner", "==", "ann"), [4, 7, 9])
+
+    def test_id_allocation_across_undo(self):
+        command_manager = CommandManager(self.mind_map)
+        command_manager.execute(AddComponentCommand(0, "A"))
+        command_manager.execute(AddComponentCommand(0, "B"))
+        command_manager.undo()
+        command_manager.redo()
+        command_manager.undo()
+        command_manager.undo()
+        command_manager.redo()
+        self.assertEqual(self.mind_map.get_node(5).desc, "A")
+        command_manager.execute(AddComponentCommand(5, "C"))
+        self.assertEqual(self.mind_map.get_node(7).desc, "C")
+        self.assertEqual(self.mind_map.size, 7)
+
+    def test_id_reuse(self):
+        mind_map = MindMapModel(reuse_ids=True)
+        command_manager = CommandManager(mind_map)
+        command_manager.execute(AddComponentCommand(-1, "Root"))
+        command_manager.execute(AddComponentCommand(0, "A"))
+        command_manager.undo()
+        command_manager.execute(AddComponentCommand(0, "B"))
+        command_manager.execute(AddComponentCommand(0, "C"))
+        self.assertEqual(mind_map.get_node(1).desc, "C")
+        self.assertEqual(mind_map.root.deleted_count, 0)
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "map.ggm")
+            self.assertTrue(MindMapModel.write_snapshot(path, self.mind_map.get_snapshot(), "ggm"))
+            self.assertFalse(os.path.exists(path + ".tmp"))
+            self.assertTrue(self.mind_map.save(os.path.join(folder, "map.xml"), "xml"))
+            mind_map = MindMapModel()
+            self.assertTrue(mind_map.load(path, "ggm"))
+            self.assertEqual(mind_map.get_snapshot(), self.mind_map.get_snapshot())
+            self.assertEqual(mind_map.serial_id, 4)
+            self.assertTrue(mind_map.load(os.path.join(folder, "map.xml"), "xml"))
+            self.assertEqual(mind_map.get_snapshot(), self.mind_map.get_snapshot())
+
+    def test_async_save_and_load(self):
+        async def run(path):
+            events = []
+            self.assertTrue(await self.mind_map.asave(path, "ggm", lambda *event: events.append(event)))
+            mind_map = MindMapModel()
+            mind_map.create_mind_map("Other")
+            self.assertTrue(await mind_map.aload(path, "ggm", lambda *event: events.append(event)))
+            await asyncio.sleep(0)
+            self.assertEqual(mind_map.get_snapshot(), self.mind_map.get_snapshot())
+            self.assertIn(("build", 5, 5), events)
+
+            with open(path, 'w') as file:
+                file.write('[{"id": 0, "desc": "Root", "pid": -1}, {"id": 1, "desc": "A", "pid": 9}]')
+            self.assertFalse(await mind_map.aload(path, "ggm"))
+            self.assertEqual(mind_map.size, 5)
+
+        async def edit_while_saving(path):
+            # The save writes the map as it was when asave was called, even
+            # though the worker only gets to it after the edit.
+            import concurrent.futures
+            import threading
+            expected = self.mind_map.get_snapshot()
+            walked_on = []
+            self.mind_map.get_snapshot = lambda: walked_on.append(threading.get_ident())
+            gate = threading.Event()
+            with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+                executor.submit(gate.wait)
+                save = asyncio.ensure_future(self.mind_map.asave(path, "ggm", executor=executor))
+                await asyncio.sleep(0)
+                CommandManager(self.mind_map).execute(EditComponentCommand(2, "Later"))
+                gate.set()
+                self.assertTrue(await save)
+            self.assertNotIn(threading.get_ident(), walked_on)
+            del self.mind_map.get_snapshot
+            mind_map = MindMapModel()
+            self.assertTrue(mind_map.load(path, "ggm"))
+            self.assertEqual(mind_map.get_snapshot(), expected)
+
+        with tempfile.TemporaryDirectory() as folder:
+            asyncio.run(run(os.path.join(folder, "map.ggm")))
+            asyncio.run(edit_while_saving(os.path.join(folder, "edit.ggm")))
+
+    def test_async_save_failures(self):
+        import threading
+        with tempfile.TemporaryDirectory() as folder:
+            # An unwritable path is reported like save reports it.
+            missing = os.path.join(folder, "missing", "map.ggm")
+            self.assertFalse(self.mind_map.save(missing, "ggm"))
+            self.assertFalse(asyncio.run(self.mind_map.asave(missing, "ggm")))
+            self.assertFalse(asyncio.run(self.mind_map.asave(missing, "xml")))
+
+            path = os.path.join(folder, "map.xml")
+            self.assertTrue(asyncio.run(self.mind_map.asave(path, "xml")))
+            mind_map = MindMapModel()
+            self.assertTrue(mind_map.load(path, "xml"))
+            self.assertEqual(mind_map.get_snapshot(), self.mind_map.get_snapshot())
+
+            # Cancellation is honoured between XML chunks too.
+            cancelled = threading.Event()
+            events = []
+
+            def report(*event):
+                events.append(event)
+                cancelled.set()
+
+            cancelled_path = os.path.join(folder, "cancelled.xml")
+            self.assertFalse(MindMapModel._write_in_chunks(cancelled_path, self.mind_map.get_snapshot(), "xml", report, cancelled, chunk=2))
+            self.assertEqual(events, [("save", 2, 5)])
+            self.assertFalse(os.path.exists(cancelled_path))
+            self.assertFalse(os.path.exists(cancelled_path + ".tmp"))
+
+    def test_command_metrics(self):
+        command_manager = CommandManager(self.mind_map)
+        metrics = command_manager.enable_metrics(trace_memory=True)
+        command_manager.execute(AddComponentCommand(0, "A"))
+        command_manager.execute(AddComponentCommand(0, "B"))
+        command_manager.undo()
+        report = metrics.report()
+        command_manager.disable_metrics()
+
+        self.assertEqual(report["AddComponentCommand.execute"]["count"], 2)
+        self.assertEqual(report["AddComponentCommand.execute"]["size_delta"], 2)
+        self.assertEqual(report["AddComponentCommand.undo"]["size_delta"], -1)
+        self.assertEqual(report["notify"]["count"], 3)
+        self.assertEqual(sum(report["notify"]["histogram_us"].values()), 3)
+        self.assertIsNotNone(report["AddComponentCommand.execute"]["allocated_bytes"])
+        self.assertIsNone(command_manager.metrics)
+
+    def test_transactional_load(self):
+        records = [
+            {"id": 0, "desc": "Root", "pid": -1},
+            {"id": 1, "desc": "A", "pid": 0},
+            {"id": 1, "desc": "B", "pid": 0},
+            {"id": 2, "desc": "C", "pid": 9},
+            {"id": 3, "desc": "D", "pid": 4},
+            {"id": 4, "desc": "E", "pid": 3},
+            {"id": 5, "desc": "F", "pid": -1},
+        ]
+        errors = validate_records(records)
+        self.assertEqual(len(errors), 5)
+        self.assertTrue(any("Duplicate id 1" in error for error in errors))
+        self.assertTrue(any("missing parent 9" in error for error in errors))
+        self.assertTrue(any("Cycle" in error for error in errors))
+        self.assertTrue(any("Multiple roots" in error for error in errors))
+        self.assertEqual(validate_records([]), [])
+        errors = validate_records([{"id": 0, "desc": None, "pid": -1}, {"id": 1, "desc": 7, "pid": 0}])
+        self.assertEqual(len([error for error in errors if "non-string desc" in error]), 2)
+
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "bad.ggm")
+            MindMapModel.write_snapshot(path, records, "ggm")
+            self.assertFalse(self.mind_map.load(path, "ggm"))
+            self.assertEqual(len(self.mind_map.last_error.errors), 5)
+            self.assertEqual(self.mind_map.size, 5)
+            self.assertTrue(self.mind_map.is_ancestor(1, 4))
+
+            MindMapModel.write_snapshot(path, [{"id": 0, "desc": "Root", "pid": -1}, {"id": 1, "desc": None, "pid": 0}], "ggm")
+            self.assertFalse(self.mind_map.load(path, "ggm"))
+            self.assertIn("non-string desc", self.mind_map.last_error.errors[0])
+            self.assertEqual(self.mind_map.size, 5)
+
+    def test_order_independent_load(self):
+        records = self.mind_map.get_snapshot()
+        builder = MindMapBuilder()
+        # Children arrive before their parents; siblings keep their relative order.
+        builder.add(records[3:][::-1])
+        builder.add(records[:3])
+        mind_map = builder.build()
+        self.assertEqual(mind_map.get_snapshot(), records)
+        self.assertEqual(mind_map.root.subtree_height, 4)
+
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "parts.ggm")
+            with open(path, 'w') as file:
+                file.write('[{"id": 4, "desc": "Node", "pid": 3}, {"id": 0, "desc": "Root", "pid": -1}]\n')
+                file.write('[{"id": 3, "desc": "Node", "pid": 1}, {"id": 2, "desc": "Node", "pid": 0}]\n')
+                file.write('[{"id": 1, "desc": "Node", "pid": 0}]')
+            mind_map = MindMapModel()
+            self.assertTrue(mind_map.load(path, "ggm"))
+            self.assertEqual(mind_map.map, self.mind_map.map[:1] + [[(2, 0), (1, 0)]] + self.mind_map.map[2:])
+
+    def test_subtree_hash_and_diff(self):
+        other = MindMapModel()
+        other.restore_from_snapshot(self.mind_map.get_snapshot())
+        self.assertEqual(other.content_hash, self.mind_map.content_hash)
+        self.assertEqual(self.mind_map.diff(other), {"added": [], "removed": [], "edited": [], "moved": []})
+
+        command_manager = CommandManager(other)
+        command_manager.execute(EditComponentCommand(4, "Edited"))
+        self.assertNotEqual(other.content_hash, self.mind_map.content_hash)
+        self.assertEqual(other.get_node(2).subtree_hash, self.mind_map.get_node(2).subtree_hash)
+        command_manager.undo()
+        self.assertEqual(other.content_hash, self.mind_map.content_hash)
+
+        command_manager.execute(EditComponentCommand(4, "Edited"))
+        command_manager.execute(MoveComponentCommand(3, 2))
+        command_manager.execute(AddComponentCommand(4, "New"))
+        command_manager.execute(DeleteComponentCommand(1))
+        self.assertEqual(self.mind_map.diff(other), {"added": [5], "removed": [1], "edited": [4], "moved": [3]})
+        self.assertEqual(other.diff(self.mind_map), {"added": [1], "removed": [5], "edited": [4], "moved": [3]})
+
+    def test_hash_after_delete_undo_redo(self):
+        command_manager = CommandManager(self.mind_map)
+        before = self.mind_map.content_hash
+        self.assertTrue(command_manager.execute(DeleteComponentCommand(1)))
+        deleted = self.mind_map.content_hash
+        self.assertNotEqual(deleted, before)
+        self.assertTrue(command_manager.undo())
+        self.assertEqual(self.mind_map.content_hash, before)
+        self.assertTrue(command_manager.redo())
+        self.assertEqual(self.mind_map.content_hash, deleted)
+
+        self.assertTrue(command_manager.execute(AddComponentCommand(3, "Added")))
+        added = self.mind_map.content_hash
+        command_manager.undo()
+        self.assertEqual(self.mind_map.content_hash, deleted)
+        command_manager.redo()
+        self.assertEqual(self.mind_map.content_hash, added)
+        fresh = MindMapModel()
+        fresh.restore_from_snapshot(self.mind_map.get_snapshot())
+        self.assertEqual(fresh.content_hash, added)
+
+    def test_attributes(self):
+        command_manager = CommandManager(self.mind_map)
+        before = self.mind_map.content_hash
+        for id, priority in [(1, 5), (2, 1), (3, 4), (4, 2)]:
+            command_manager.execute(SetAttributeCommand(id, "priority", priority))
+        command_manager.execute(SetAttributeCommand(3, "progress", 0.5))
+        command_manager.execute(SetAttributeCommand(4, "progress", 1))
+        command_manager.execute(SetAttributeCommand(4, "owner", "amy"))
+        self.assertFalse(command_manager.execute(SetAttributeCommand(4, "priority", "high")))
+        self.assertNotEqual(self.mind_map.content_hash, before)
+        self.assertEqual(self.mind_map.attributes.schema, {"priority": "int", "progress": "float", "owner": "str"})
+
+        self.assertEqual(self.mind_map.filter_nodes("priority", ">", 3), [1, 3])
+        self.assertEqual(self.mind_map.filter_nodes("owner", "startswith", "a"), [4])
+        self.assertEqual(self.mind_map.aggregate("progress", "sum", under=1), 1.5)
+        self.assertEqual(self.mind_map.aggregate("progress", "sum", under=4), 1.0)
+        self.assertEqual(self.mind_map.aggregate("priority", "mean"), 3.0)
+        command_manager.undo()
+        self.assertEqual(self.mind_map.attributes.row(4), {"priority": 2, "progress": 1.0})
+
+        command_manager.execute(DeleteComponentCommand(3))
+        self.assertEqual(self.mind_map.filter_nodes("priority", ">", 3), [1])
+        self.assertEqual(self.mind_map.aggregate("priority", "count"), 2)
+        command_manager.undo()
+
+        with tempfile.TemporaryDirectory() as folder:
+            for file_type in ("ggm", "xml"):
+                path = os.path.join(folder, "attrs." + file_type)
+                self.assertTrue(self.mind_map.save(path, file_type))
+                mind_map = MindMapModel()
+                self.assertTrue(mind_map.load(path, file_type))
+                self.assertEqual(mind_map.attributes.row(3), {"priority": 4, "progress": 0.5})
+                self.assertEqual(mind_map.content_hash, self.mind_map.content_hash)
+                self.assertEqual(mind_map.filter_nodes("progress", ">=", 0.5), [3, 4])
+
+    def test_snapshot_view(self):
+        import threading
+        self.mind_map.set_attribute(self.mind_map.get_node(4), "priority", 1)
+        expected = self.mind_map.get_snapshot()
+        view = self.mind_map.snapshot_view()
+        mismatches = []
+        stop = threading.Event()
+
+        def read():
+            while (not stop.is_set()):
+                if (view.get_snapshot() != expected):
+                    mismatches.append(view.get_snapshot())
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        command_manager = CommandManager(self.mind_map)
+        for index in range(200):
+            command_manager.execute(AddComponentCommand(index % 5, "Added"))
+            command_manager.execute(EditComponentCommand(3, "Edited {}".format(index)))
+            if (index % 50 == 0):
+                command_manager.execute(PasteComponentCommand(2, self.mind_map.get_node(1)))
+        before_paste = self.mind_map.snapshot_view()
+        unpasted = self.mind_map.get_snapshot()
+        command_manager.execute(PasteComponentCommand(3, self.mind_map.get_node(2)))
+        pasted = self.mind_map.get_snapshot()
+        after_paste = self.mind_map.snapshot_view()
+        command_manager.execute(MoveComponentCommand(3, 2))
+        command_manager.execute(SetAttributeCommand(4, "priority", 2))
+        command_manager.execute(PasteComponentCommand(0, self.mind_map.get_node(2)))
+        command_manager.execute(DeleteComponentCommand(1))
+        stop.set()
+        reader.join()
+        self.assertEqual(mismatches, [])
+        self.assertEqual(view.get_node(3).desc, "Node")
+        self.assertEqual(view.get_node(3).pid, 1)
+        self.assertEqual(view.get_node(4).attrs, {"priority": 1})
+        self.assertIsNone(view.get_node(5))
+        self.assertEqual([node.id for node in view.get_childern(0)], [1, 2])
+        self.assertNotEqual(after_paste.version, before_paste.version)
+        self.assertEqual(before_paste.get_snapshot(), unpasted)
+        self.assertEqual(after_paste.get_snapshot(), pasted)
+        before_paste.release()
+        after_paste.release()
+
+        current = self.mind_map.get_snapshot()
+        newer = self.mind_map.snapshot_view()
+        self.mind_map.reset()
+        self.assertEqual(view.get_snapshot(), expected)
+        self.assertEqual(newer.get_snapshot(), current)
+        view.release()
+        newer.release()
+        self.mind_map.create_mind_map("Root")
+        self.assertEqual(self.mind_map._versioned, [])
+        self.assertEqual(self.mind_map._views, [])
+
+    def test_snapshot_view_while_columns_are_added(self):
+        import threading
+        node = self.mind_map.get_node(4)
+        for index in range(50):
+            self.mind_map.set_attribute(node, "a{}".format(index), index)
+        expected = self.mind_map.get_snapshot()
+        view = self.mind_map.snapshot_view()
+        errors = []
+        stop = threading.Event()
+
+        def read():
+            while (not stop.is_set()):
+                try:
+                    if (view.get_snapshot() != expected):
+                        errors.append("mismatch")
+                except RuntimeError as e:
+                    errors.append(e)
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        reader = threading.Thread(target=read)
+        reader.start()
+        try:
+            for index in range(500):
+                self.mind_map.set_attribute(self.mind_map.get_node(2), "b{}".format(index), index)
+        finally:
+            stop.set()
+            reader.join()
+            sys.setswitchinterval(interval)
+        view.release()
+        self.assertEqual(errors, [])
+
+    def test_compression(self):
+        for index in range(200):
+            self.mind_map.insert_node(self.mind_map.create_node("Repeated description"), index % 5)
+        self.mind_map.set_attribute(self.mind_map.get_node(2), "cost", 1.5)
+        expected = self.mind_map.get_snapshot()
+        with tempfile.TemporaryDirectory() as folder:
+            plain = os.path.join(folder, "plain.ggm")
+            self.mind_map.save(plain, "ggm")
+            self.assertIsNone(file_compression(plain))
+            for compression in ("zlib", "lzma"):
+                for file_type in ("ggm", "xml"):
+                    path = os.path.join(folder, "map.{}.{}".format(compression, file_type))
+                    self.assertTrue(self.mind_map.save(path, file_type, compression, 1))
+                    self.assertEqual(file_compression(path), compression)
+                    mind_map = MindMapModel()
+                    self.assertTrue(mind_map.load(path, file_type))
+                    self.assertEqual(mind_map.get_snapshot(), expected)
+                self.assertLess(os.path.getsize(path.replace(".xml", ".ggm")) * 5, os.path.getsize(plain))
+
+            async def run(path):
+                self.assertTrue(await self.mind_map.asave(path, "ggm", compression="zlib"))
+                mind_map = MindMapModel()
+                self.assertTrue(await mind_map.aload(path, "ggm"))
+                return mind_map.get_snapshot()
+            self.assertEqual(asyncio.run(run(os.path.join(folder, "async.ggm"))), expected)
+            self.assertRaises(ValueError, compress_snapshot, expected, "bz2")
+
+    def test_compressed_undo_snapshot(self):
+        command_manager = CommandManager(self.mind_map)
+        with self.assertRaises(ValueError):
+            self.mind_map.snapshot_compression = ("bz2", 1)
+        for compression in ("zlib", "lzma"):
+            expected = self.mind_map.get_snapshot()
+            self.mind_map.snapshot_compression = (compression, 1)
+            command = DeleteComponentCommand(0)
+            self.assertTrue(command_manager.execute(command))
+            self.assertIsInstance(command._snapshot, bytes)
+            self.assertTrue(self.mind_map.is_empty())
+            self.assertTrue(command_manager.undo())
+            self.assertEqual(self.mind_map.get_snapshot(), expected)
+        self.mind_map.snapshot_compression = None
+        self.assertIsInstance(self.mind_map.get_snapshot(compressed=True), list)
+
+
+class ImportTest(unittest.TestCase):
+
+    # Median cumulative `-X importtime` of the package and its model, in
+    # microseconds; generous, since machines vary (about 6 ms here).
+    IMPORT_BUDGET = 50000
+    IMPORT_RUNS = 5
+    # Modules `import model` must leave to the code paths that need them.
+    HEAVY_MODULES = ("PyQt5", "typing", "json", "asyncio", "threading", "xml.etree.ElementTree", "lzma", "gzip", "zlib")
+
+    def test_lazy_imports(self):
+        # A copy in a temporary directory, so no bytecode lands in the tree.
+        source = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model.py")
+        with tempfile.TemporaryDirectory() as folder:
+            shutil.copy(source, folder)
+            code = "import sys, model; print(' '.join(m for m in {!r} if m in sys.modules))".format(self.HEAVY_MODULES)
+            result = subprocess.run([sys.executable, "-c", code], cwd=folder,
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.split(), [])
+
+    @unittest.skipIf(sys.version_info < (3, 8), "PYTHONPYCACHEPREFIX needs Python 3.8")
+    def test_import_time(self):
+        import statistics
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        with tempfile.TemporaryDirectory() as folder:
+            # Bytecode goes to the temporary directory, never into the tree;
+            # the first run only fills that cache.
+            env = dict(os.environ, PYTHONPYCACHEPREFIX=folder)
+            env.pop("PYTHONDONTWRITEBYTECODE", None)
+            times = []
+            for _ in range(self.IMPORT_RUNS + 1):
+                result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import GogoMind.model"], cwd=root, env=env,
+                        stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+                self.assertEqual(result.returncode, 0, result.stderr)
+                times.append(sum(int(line.split("|")[1]) for line in result.stderr.splitlines()
+                                 if line.split("|")[-1].strip() in ("GogoMind", "GogoMind.model")))
+        self.assertLess(statistics.median(times[1:]), self.IMPORT_BUDGET)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+from model import MindMapModel
+from benchmark import generate
+import parallel_load
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+
+class ParallelLoadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, "map.ggm")
+        self.records = generate("random", 2000, seed=1)
+        self.expected = MindMapModel()
+        self.expected.restore_from_snapshot(self.records)
+        self.expected.save(self.path, "ggm")
+        # Use the pool even on a single CPU machine.
+        cpus = mock.patch.object(parallel_load, "available_cpus", return_value=4)
+        cpus.start()
+        self.addCleanup(cpus.stop)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_load(self):
+        chunks = parallel_load.split(self.path, 7)
+        self.assertEqual(chunks[0][0], 0)
+        self.assertEqual(chunks[-1][1], os.path.getsize(self.path))
+
+        for jobs in (1, 3):
+            mind_map = MindMapModel()
+            self.assertTrue(parallel_load.load(mind_map, self.path, jobs, chunk_bytes=4096))
+            self.assertEqual(mind_map.get_snapshot(), self.expected.get_snapshot())
+            self.assertEqual(mind_map.serial_id, self.expected.serial_id)
+
+    def test_serial_fallback(self):
+        with mock.patch.object(parallel_load, "available_cpus", return_value=1), \
+                mock.patch.object(parallel_load.multiprocessing, "Pool") as pool:
+            mind_map = MindMapModel()
+            self.assertTrue(parallel_load.load(mind_map, self.path, 4, chunk_bytes=4096))
+            self.assertFalse(pool.called)
+        self.assertEqual(mind_map.get_snapshot(), self.expected.get_snapshot())
+
+    def test_compressed_file(self):
+        self.expected.save(self.path, "ggm", "zlib")
+        mind_map = MindMapModel()
+        self.assertTrue(parallel_load.load(mind_map, self.path, 2, chunk_bytes=4096))
+        self.assertEqual(mind_map.get_snapshot(), self.expected.get_snapshot())
+
+    def test_invalid_chunk(self):
+        MindMapModel.write_snapshot(self.path, self.records + [{"id": 1, "desc": "Again", "pid": 0}], "ggm")
+        mind_map = MindMapModel()
+        self.assertFalse(parallel_load.load(mind_map, self.path, 2, chunk_bytes=4096))
+        self.assertTrue(mind_map.is_empty())
+        self.assertTrue(any("Duplicate id 1" in error for error in mind_map.last_error.errors))
+
+        with open(self.path, 'a') as file:
+            file.write('{"id": "x"\n')
+        self.assertFalse(parallel_load.load(mind_map, self.path, 2, chunk_bytes=4096))
+        self.assertTrue(any(error.startswith("Bytes ") for error in mind_map.last_error.errors))
+
+        MindMapModel.write_snapshot(self.path, self.records + [{"id": 2000, "desc": None, "pid": 0}], "ggm")
+        self.assertFalse(parallel_load.load(mind_map, self.path, 2, chunk_bytes=4096))
+        self.assertTrue(any("non-string desc" in error for error in mind_map.last_error.errors))
+
+
+if __name__ == "__main__":
+    unittest.main()
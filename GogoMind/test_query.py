@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+from model import MindMapModel, CommandManager, DeleteComponentCommand, SetAttributeCommand, PasteComponentCommand
+from query import TextIndex
+import unittest
+
+
+class QueryTest(unittest.TestCase):
+
+    def setUp(self):
+        # 0 -> 1..4; 1 -> 5..16 ("Q3 ..." under 1); 5 -> 17..28.
+        self.mind_map = MindMapModel()
+        self.mind_map.create_mind_map("Root")
+        for index in range(4):
+            self.mind_map.insert_node(self.mind_map.create_node("Area {}".format(index)), 0)
+        for index in range(12):
+            self.mind_map.insert_node(self.mind_map.create_node("Q3 goal {}".format(index)), 1)
+        for index in range(12):
+            self.mind_map.insert_node(self.mind_map.create_node("Q3 task {}".format(index)), 5)
+
+    def test_structural_and_text(self):
+        query = self.mind_map.query().under(1).depth(2, 4).desc("startswith", "Q3").children(">", 10)
+        self.assertEqual(query.run(), [5])
+        self.assertEqual(sorted(self.mind_map.query().parent(5).desc("contains", "task 1").run()), [18, 27, 28])
+        self.assertEqual(len(self.mind_map.query().depth(3).run()), 12)
+        self.assertEqual(self.mind_map.query().under(2).run(), [])
+
+    def test_planner(self):
+        query = self.mind_map.query().under(5).desc("startswith", "Q3 goal")
+        # The text index is stale at first, so walking the small subtree wins.
+        self.assertTrue(query.explain().startswith("access: subtree walk under 5"))
+        TextIndex.of(self.mind_map)
+        explain = query.explain()
+        self.assertTrue(explain.startswith("access: text index startswith 'Q3 goal' (~12 rows)"), explain)
+        self.assertIn("filter: under 5 (ancestry interval)", explain)
+        self.assertEqual(query.run(), [])
+        self.assertEqual(sorted(self.mind_map.query().under(1).desc("startswith", "Q3 goal 1").run()), [6, 15, 16])
+
+        # A paste must not be served from the index built before it.
+        CommandManager(self.mind_map).execute(PasteComponentCommand(2, self.mind_map.get_node(6)))
+        self.assertEqual(sorted(self.mind_map.query().desc("equals", "Q3 goal 1").run()), [6, 29])
+
+        command_manager = CommandManager(self.mind_map)
+        for id in (6, 7, 20):
+            command_manager.execute(SetAttributeCommand(id, "priority", 5))
+        command_manager.execute(DeleteComponentCommand(5))
+        query = self.mind_map.query().attr("priority", ">", 3)
+        self.assertTrue(query.explain().startswith("access: attribute column priority"))
+        self.assertIn("filter: visible", query.explain())
+        self.assertEqual(sorted(query.run()), [6, 7])
+
+    def test_stale_index_loses_to_full_scan(self):
+        query = self.mind_map.query().desc("startswith", "Q3 goal")
+        TextIndex.of(self.mind_map)
+        self.assertTrue(query.explain().startswith("access: text index"))
+        # After an edit, sorting every node again costs more than one scan.
+        CommandManager(self.mind_map).execute(SetAttributeCommand(6, "priority", 5))
+        self.assertIsNone(TextIndex.cached(self.mind_map))
+        explain = query.explain()
+        self.assertTrue(explain.startswith("access: full scan"), explain)
+        self.assertEqual(len(query.run()), 12)
+        self.assertIsNone(TextIndex.cached(self.mind_map))
+
+
+if __name__ == "__main__":
+    unittest.main()